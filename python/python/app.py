@@ -1,13 +1,25 @@
 from parseFiles import DataFileParser
+from heuristics import giveHeuristicConfig
+import deepJson
 import drawPhylogeo
+import hashlib
+import instanceStore
 import io
 import json
 import math
+import metrics
 import os
+import renderCache
+import secrets
+import solveProgress
+import time
+from datetime import datetime, timezone
 from sqlalchemy import create_engine, text
-from random import random
+from sqlalchemy.exc import IntegrityError
 from flask import (
     Flask,
+    Response,
+    g,
     render_template,
     request,
     url_for,
@@ -32,8 +44,44 @@ dbChanges = [
     "connect TEXT NOT NULL"
     ");",
     "ALTER TABLE solutions ADD COLUMN public BOOL DEFAULT FALSE;",
+    # 'incumbent' while the solution is only the best one found so far, 'final' once
+    # the solve is done. Solutions written before are final as well
+    "ALTER TABLE solutions ADD COLUMN solutionStatus VARCHAR(10);",
+    # wall time and peak memory of the phases of the solve, see SolveStats
+    "ALTER TABLE solutions ADD COLUMN stats LONGTEXT;",
+    # /metrics counts the unfinished solves
+    "CREATE INDEX solutions_timeEnd ON solutions (timeEnd);",
+    # the hash of tree, geo, padding, lType and connect, see giveContentHash. Of
+    # solutions with the same content that were added before, only the first is found
+    "ALTER TABLE solutions ADD COLUMN contentHash CHAR(64);",
+    "UPDATE solutions SET contentHash=SHA2(CONCAT_WS(CHAR(10),tree,geo,padding,lType,connect),256);",
+    "UPDATE solutions JOIN (SELECT contentHash, MIN(id) AS firstId FROM solutions GROUP BY contentHash HAVING COUNT(*) > 1) AS doubles ON solutions.contentHash=doubles.contentHash AND solutions.id<>doubles.firstId SET solutions.contentHash=NULL;",
+    "CREATE UNIQUE INDEX solutions_contentHash ON solutions (contentHash);",
+    # ids are drawn at random from SOLUTION_ID_SPACE, see giveNewId
+    "ALTER TABLE solutions MODIFY id BIGINT NOT NULL;",
+    # the instance made from tree, geo, padding and connect, see instanceStore
+    "ALTER TABLE solutions ADD COLUMN instance LONGBLOB;",
+    # increased with every write of the solution, the drawings of /draw are cached
+    # by it. solutionTime is the unix time in milliseconds of the last write
+    "ALTER TABLE solutions ADD COLUMN solutionVersion INT NOT NULL DEFAULT 0;",
+    "ALTER TABLE solutions ADD COLUMN solutionTime BIGINT;",
+    # /loading only reads solutionStatus, so the solutions written before it are final
+    "UPDATE solutions SET solutionStatus='final' WHERE solution IS NOT NULL AND solutionStatus IS NULL;",
+    # timeEnd was not written before, /metrics counts the solves without it as
+    # unfinished
+    "UPDATE solutions SET timeEnd=IFNULL(timeStart,0) WHERE timeEnd IS NULL AND (solution IS NOT NULL OR solutionStatus='final');",
 ]
 
+# Solutions are only private by their id not being known, so ids are drawn at
+# random from a space far bigger than the table. Stays below 2^53, so ids are exact
+# as numbers in JavaScript as well
+SOLUTION_ID_SPACE = 2**53
+# how often a new id is drawn if the drawn one is taken already
+MAX_ID_TRIES = 10
+# how long /progress waits for a write of the solution, in seconds. Below the
+# timeouts of gunicorn and of proxies in front of it
+SOLVE_PROGRESS_TIMEOUT = 25
+
 with engine.connect() as conn:
     result = (
         conn.execute(
@@ -95,24 +143,95 @@ app = Flask(__name__, static_folder="../web/static", template_folder="../web/tem
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY")
 app.config["MAX_CONTENT_LENGTH"] = float(os.getenv("MAX_CONTENT_LENGTH"))
 
+metricsRedis = metrics.giveRedis()
+# the solve task publishes the writes of solutions here, see solveProgress
+progressRedis = metrics.giveRedis()
+# the instances /draw and /preview used last, by solution id
+instanceCache = instanceStore.InstanceCache(
+    int(float(os.getenv("instanceCacheBytes", "256e6")))
+)
+# the svgs /draw made last, by solution id, solution version and drawing parameters
+svgCache = renderCache.RenderCache(
+    int(float(os.getenv("svgCacheBytes", "64e6"))),
+    os.getenv("svgCacheDir"),
+    int(float(os.getenv("svgCacheDirBytes", "1e9"))),
+)
+
 
-def giveNewId():
-    newId = -1
-    with engine.connect() as conn:
-        result = conn.execute(text("SELECT id FROM solutions;")).mappings().all()
-        isDouble = True
-        while isDouble:
-            newId = math.floor(random() * int(os.getenv("maxSolutions")))
-            isDouble = False
-            for thisId in result:
-                if thisId.id == newId:
-                    isDouble = True
-                    break
+def observeBackgroundMapFetch(pSeconds):
+    metrics.observe(metricsRedis, "phyloptimize_background_map_fetch_seconds", pSeconds)
+
+
+@app.before_request
+def startRequestTimer():
+    g.requestStartTime = time.perf_counter()
+
+
+@app.after_request
+def observeRequestDuration(response):
+    if request.url_rule is not None and request.url_rule.rule not in [
+        "/metrics",
+        "/static/<path:filename>",
+    ]:
+        metrics.observe(
+            metricsRedis,
+            "phyloptimize_request_duration_seconds",
+            time.perf_counter() - g.requestStartTime,
+            {"route": request.url_rule.rule, "status": response.status_code},
+        )
 
-    return newId
+    return response
 
 
-def parseIndexFormInput(phyloTreeFile, geoFile, formPadding, lType, connect):
+@app.route("/metrics", methods=["GET"])
+def giveMetrics():
+    return Response(
+        metrics.giveMetricsText(metricsRedis, engine),
+        mimetype="text/plain; version=0.0.4",
+    )
+
+
+def giveNewId():
+    # an unused id is not looked up, the insert of a taken id fails and is retried
+    # with a new id instead, see submitSolution
+    return secrets.randbelow(SOLUTION_ID_SPACE)
+
+
+def giveSolveKwargs(pTimeLimit, pMipGap):
+    # a request can only ask for a smaller budget than the one of the deployment,
+    # pTimeLimit is in seconds and pMipGap in percent
+    kwargs = {}
+
+    if pTimeLimit:
+        timeLimit = float(pTimeLimit)
+        if not (math.isfinite(timeLimit) and timeLimit > 0):
+            raise Exception("Time limit has to be a positive number of seconds")
+        if os.getenv("solverTimeLimit"):
+            timeLimit = min(timeLimit, float(os.getenv("solverTimeLimit")))
+        kwargs["pTimeLimit"] = timeLimit
+
+    if pMipGap:
+        mipGap = float(pMipGap)
+        # also false for nan
+        if not (0 <= mipGap <= 100):
+            raise Exception("Gap has to be between 0 and 100 %")
+        mipGap = mipGap / 100
+        if os.getenv("solverMipGap"):
+            mipGap = max(mipGap, float(os.getenv("solverMipGap")))
+        kwargs["pMipGap"] = mipGap
+
+    return kwargs
+
+
+def parseIndexFormInput(
+    phyloTreeFile,
+    geoFile,
+    formPadding,
+    lType,
+    connect,
+    formTimeLimit=None,
+    formMipGap=None,
+):
     if phyloTreeFile.filename == "" or geoFile.filename == "":
         return {
             "errorIn": "A preview of your tree will be shown here.",
@@ -150,6 +269,11 @@ def parseIndexFormInput(phyloTreeFile, geoFile, formPadding, lType, connect):
     except Exception as e:
         return {"errorIn": "Error while parsing leader type: ", "errorString": str(e)}
 
+    try:
+        solveKwargs = giveSolveKwargs(formTimeLimit, formMipGap)
+    except Exception as e:
+        return {"errorIn": "Error while parsing solver budget: ", "errorString": str(e)}
+
     try:
         thisParser = DataFileParser()
         thisInstanceJson = thisParser.convertTreeAndGeoToInstance(
@@ -170,33 +294,28 @@ def parseIndexFormInput(phyloTreeFile, geoFile, formPadding, lType, connect):
         "connect": connect,
         "instanceJson": thisInstanceJson,
         "geoTree": thisGeoTree,
+        "solveKwargs": solveKwargs,
     }
 
 
-def checkForExistingSolution(pPhyloTreeJson, pGeoJson, pPadding, pLType, pConnect):
-    phyloTreeJson = pPhyloTreeJson
-    geoJson = pGeoJson
-    padding = pPadding
-    lType = pLType
-    connect = pConnect
+def giveContentHash(pTreeString, pGeoString, pPadding, pLType, pConnect):
+    # the same as SHA2(CONCAT_WS(CHAR(10),tree,geo,padding,lType,connect),256) in the
+    # db, padding is a DECIMAL(4,2) there
+    return hashlib.sha256(
+        "\n".join(
+            [pTreeString, pGeoString, "%.2f" % pPadding, pLType, pConnect]
+        ).encode("utf-8")
+    ).hexdigest()
+
 
+def checkForExistingSolution(pContentHash):
     foundId = -1
 
     with engine.connect() as conn:
         result = (
             conn.execute(
-                text(
-                    "SELECT id FROM solutions WHERE tree=:treeJson AND geo=:geoJson AND padding=:thisPadding AND lType=:thisLType AND connect=:thisConnect;"
-                ),
-                [
-                    {
-                        "treeJson": json.dumps(phyloTreeJson),
-                        "geoJson": json.dumps(geoJson),
-                        "thisPadding": padding,
-                        "thisLType": lType,
-                        "thisConnect": connect,
-                    }
-                ],
+                text("SELECT id FROM solutions WHERE contentHash=:contentHash;"),
+                [{"contentHash": pContentHash}],
             )
             .mappings()
             .all()
@@ -210,6 +329,78 @@ def checkForExistingSolution(pPhyloTreeJson, pGeoJson, pPadding, pLType, pConnec
     return foundId
 
 
+def giveSolutionInstance(pId):
+    # the instance of the solution pId from the instance cache or the db, None if
+    # there is no such solution. It is shared with other requests, so never change it
+    def giveInstanceBlob():
+        with engine.connect() as conn:
+            instanceBlob = instanceStore.giveInstanceBlobOfSolution(conn, pId)
+            conn.commit()
+        return instanceBlob
+
+    return instanceCache.giveInstance(str(pId), giveInstanceBlob)
+
+
+def submitSolution(
+    pPhyloTreeJson,
+    pGeoJson,
+    pPadding,
+    pLType,
+    pConnect,
+    pPublic,
+    pInstanceJson,
+    pSolveKwargs=None,
+):
+    # gives the id of the solution with this input, a new one is added and solved
+    # if there is none yet. pInstanceJson is the instance of the input and
+    # pSolveKwargs the solver budget of giveSolveKwargs
+    treeString = deepJson.dumps(pPhyloTreeJson)
+    geoString = json.dumps(pGeoJson)
+    contentHash = giveContentHash(treeString, geoString, pPadding, pLType, pConnect)
+
+    returnId = checkForExistingSolution(contentHash)
+    if returnId != -1:
+        return returnId
+
+    instanceBlob = instanceStore.giveInstanceBlob(pInstanceJson)
+    for thisTry in range(MAX_ID_TRIES):
+        returnId = giveNewId()
+        try:
+            with engine.connect() as conn:
+                conn.execute(
+                    text(
+                        "INSERT INTO solutions (id,tree,geo,padding,lType,connect,public,contentHash,instance) VALUES (:solutionId,:treeJson,:geoJson,:thisPadding,:thisLType,:thisConnect,:thisPublic,:contentHash,:instance);"
+                    ),
+                    [
+                        {
+                            "solutionId": returnId,
+                            "treeJson": treeString,
+                            "geoJson": geoString,
+                            "thisPadding": pPadding,
+                            "thisLType": pLType,
+                            "thisConnect": pConnect,
+                            "thisPublic": pPublic,
+                            "contentHash": contentHash,
+                            "instance": instanceBlob,
+                        }
+                    ],
+                )
+                conn.commit()
+            break
+        except IntegrityError:
+            # either the same input was submitted at the same time by another
+            # request, or the id is taken already
+            existingId = checkForExistingSolution(contentHash)
+            if existingId != -1:
+                return existingId
+            if thisTry == MAX_ID_TRIES - 1:
+                raise
+
+    celery.send_task("solve", args=[returnId], kwargs=pSolveKwargs or {})
+
+    return returnId
+
+
 @app.route("/", methods=("GET", "POST"))
 def index():
     if request.method == "POST":
@@ -220,7 +411,13 @@ def index():
         connect = request.form["connect"]
 
         indexParseRes = parseIndexFormInput(
-            phyloTreeFile, geoFile, formPadding, lType, connect
+            phyloTreeFile,
+            geoFile,
+            formPadding,
+            lType,
+            connect,
+            request.form.get("timeLimit"),
+            request.form.get("mipGap"),
         )
 
         if "errorIn" in indexParseRes:
@@ -232,32 +429,17 @@ def index():
         lType = indexParseRes["lType"]
         connect = indexParseRes["connect"]
 
-        returnId = checkForExistingSolution(
-            phyloTreeJson, geoJson, padding, lType, connect
+        returnId = submitSolution(
+            phyloTreeJson,
+            geoJson,
+            padding,
+            lType,
+            connect,
+            request.form.get("public") != None,
+            indexParseRes["instanceJson"],
+            indexParseRes["solveKwargs"],
         )
 
-        if returnId == -1:
-            returnId = giveNewId()
-            with engine.connect() as conn:
-                conn.execute(
-                    text(
-                        "INSERT INTO solutions (id,tree,geo,padding,lType,connect,public) VALUES (:solutionId,:treeJson,:geoJson,:thisPadding,:thisLType,:thisConnect,:thisPublic);"
-                    ),
-                    [
-                        {
-                            "solutionId": returnId,
-                            "treeJson": json.dumps(phyloTreeJson),
-                            "geoJson": json.dumps(geoJson),
-                            "thisPadding": padding,
-                            "thisLType": lType,
-                            "thisConnect": connect,
-                            "thisPublic": request.form.get("public") != None,
-                        }
-                    ],
-                )
-                conn.commit()
-            celery.send_task("solve", args=[returnId], kwargs={})
-
         return redirect(url_for("giveSolvePage") + "?id=" + str(returnId))
 
     return render_template("index.html")
@@ -277,7 +459,13 @@ def giveErrorCheckRes():
     connect = request.form["connect"]
 
     indexParseRes = parseIndexFormInput(
-        phyloTreeFile, geoFile, formPadding, lType, connect
+        phyloTreeFile,
+        geoFile,
+        formPadding,
+        lType,
+        connect,
+        request.form.get("timeLimit"),
+        request.form.get("mipGap"),
     )
 
     if "errorIn" in indexParseRes:
@@ -319,33 +507,29 @@ def givePreview():
         with engine.connect() as conn:
             result = (
                 conn.execute(
-                    text("SELECT * FROM solutions WHERE id=:solutionId;"),
+                    text("SELECT lType FROM solutions WHERE id=:solutionId;"),
                     [{"solutionId": request.args.get("id")}],
                 )
                 .mappings()
                 .all()
             )
-
-            if len(result) == 0:
-                return render_template(
-                    "errorStandalone.html",
-                    error="GeoTree with the given id does not exist",
-                )
-
-            phyloTreeJson = json.loads(result[0].tree)
-            geoJson = json.loads(result[0].geo)
-            padding = float(result[0].padding)
-            lType = result[0].lType
-            connect = result[0].connect
-
             conn.commit()
 
-        thisInstanceJson = thisParser.convertTreeAndGeoToInstance(
-            phyloTreeJson, geoJson, padding, connect
-        )
+        if len(result) == 0:
+            return render_template(
+                "errorStandalone.html",
+                error="GeoTree with the given id does not exist",
+            )
+
+        lType = result[0].lType
+        thisInstanceJson = giveSolutionInstance(request.args.get("id"))
         thisGeoTree = thisParser.parseFile(thisInstanceJson, lType, 0)
 
-    shouldVerticesTurn, intersections = thisGeoTree.giveNullSolution()
+    # the preview is drawn while the request waits, so it never runs the ILP
+    if request.values.get("solver", os.getenv("previewSolver")) == "heuristic":
+        shouldVerticesTurn, intersections = giveHeuristicConfig(thisGeoTree)
+    else:
+        shouldVerticesTurn, intersections = thisGeoTree.giveNullSolution()
     thisSolutionJson = thisParser.giveOutputJSON(
         shouldVerticesTurn,
         thisGeoTree.giveLeafOffsetAfterTurns(shouldVerticesTurn),
@@ -366,7 +550,8 @@ def givePreview():
         pExtraRight=int(os.getenv("defaultExtraRight")),
         pExtraBot=int(os.getenv("defaultExtraBot")),
         pBackgroundMode=os.getenv("defaultBackgroundMode"),
-        pBranchLengthMode=os.getenv("defaultBranchLengthMode")
+        pBranchLengthMode=os.getenv("defaultBranchLengthMode"),
+        pOnBackgroundMapFetched=observeBackgroundMapFetch,
     )
 
     thisOutSvgAsBytes = io.BytesIO()
@@ -382,20 +567,83 @@ def loading():
     with engine.connect() as conn:
         result = (
             conn.execute(
-                text("SELECT solution FROM solutions WHERE id=:solutionId;"),
+                text(
+                    "SELECT solutionStatus,solutionVersion FROM solutions WHERE id=:solutionId;"
+                ),
                 [{"solutionId": request.args.get("id")}],
             )
             .mappings()
             .all()
         )
-        solutionReady = result[0].solution is not None
+        solutionReady = result[0].solutionStatus == "final"
+        solutionVersion = result[0].solutionVersion
+
+        # while the solver runs, the best leaf order so far is shown. Its numbers
+        # are in the last progress, the solution is only read if Redis lost it
+        incumbent = None
+        if result[0].solutionStatus == "incumbent":
+            incumbent = solveProgress.giveProgress(
+                progressRedis, request.args.get("id")
+            )
+            if incumbent is None or incumbent["version"] != solutionVersion:
+                result = (
+                    conn.execute(
+                        text("SELECT solution FROM solutions WHERE id=:solutionId;"),
+                        [{"solutionId": request.args.get("id")}],
+                    )
+                    .mappings()
+                    .all()
+                )
+                incumbent = json.loads(result[0].solution)
 
         conn.commit()
 
     if solutionReady:
         return redirect(url_for("draw") + "?id=" + str(request.args.get("id")))
     else:
-        return render_template("loading.html")
+        return render_template(
+            "loading.html",
+            incumbent=incumbent,
+            solutionId=request.args.get("id"),
+            solutionVersion=solutionVersion,
+        )
+
+
+@app.route("/progress", methods=["GET"])
+def progress():
+    # long poll of the loading page: answers once the solution is newer than
+    # version, or after SOLVE_PROGRESS_TIMEOUT seconds with the version unchanged
+    solutionId = request.args.get("id")
+    clientVersion = int(request.args.get("version", 0))
+
+    def giveVersion():
+        with engine.connect() as conn:
+            result = (
+                conn.execute(
+                    text("SELECT solutionVersion FROM solutions WHERE id=:solutionId;"),
+                    [{"solutionId": solutionId}],
+                )
+                .mappings()
+                .all()
+            )
+            conn.commit()
+        if len(result) == 0:
+            return None
+        return result[0].solutionVersion
+
+    progressJson = solveProgress.waitForProgress(
+        progressRedis,
+        solutionId,
+        clientVersion,
+        SOLVE_PROGRESS_TIMEOUT,
+        giveVersion,
+    )
+    if progressJson is None:
+        progressJson = {"version": clientVersion}
+
+    response = Response(json.dumps(progressJson), mimetype="application/json")
+    response.headers["Cache-Control"] = "no-store"
+    return response
 
 
 @app.route("/edit", methods=["GET", "POST"])
@@ -416,7 +664,7 @@ def edit():
                     error="GeoTree with the given id does not exist",
                 )
 
-            phyloTreeJson = json.loads(result[0].tree)
+            phyloTreeJson = deepJson.loads(result[0].tree)
             geoJson = json.loads(result[0].geo)
             padding = int(request.form["sitesPadding"]) / 100
             lType = request.form["lType"]
@@ -426,32 +674,18 @@ def edit():
 
             conn.commit()
 
-        returnId = checkForExistingSolution(
-            phyloTreeJson, geoJson, padding, lType, connect
+        returnId = submitSolution(
+            phyloTreeJson,
+            geoJson,
+            padding,
+            lType,
+            connect,
+            thisPublic,
+            DataFileParser().convertTreeAndGeoToInstance(
+                phyloTreeJson, geoJson, padding, connect
+            ),
         )
 
-        if returnId == -1:
-            returnId = giveNewId()
-            with engine.connect() as conn:
-                conn.execute(
-                    text(
-                        "INSERT INTO solutions (id,tree,geo,padding,lType,connect,public) VALUES (:solutionId,:treeJson,:geoJson,:thisPadding,:thisLType,:thisConnect,:thisPublic);"
-                    ),
-                    [
-                        {
-                            "solutionId": returnId,
-                            "treeJson": json.dumps(phyloTreeJson),
-                            "geoJson": json.dumps(geoJson),
-                            "thisPadding": padding,
-                            "thisLType": lType,
-                            "thisConnect": connect,
-                            "thisPublic": thisPublic,
-                        }
-                    ],
-                )
-                conn.commit()
-            celery.send_task("solve", args=[returnId], kwargs={})
-
         return redirect(url_for("giveSolvePage") + "?id=" + str(returnId))
 
     with engine.connect() as conn:
@@ -481,6 +715,8 @@ def edit():
             "selectedPo": lType == "po",
             "selectedS": lType == "s",
             "padding": math.floor(padding * 100),
+            # the local map tiles can only be drawn if there are any
+            "hasBackgroundTiles": bool(os.getenv("backgroundTiles")),
         },
     )
 
@@ -519,32 +755,6 @@ def cite():
 
 @app.route("/draw", methods=["GET"])
 def draw():
-    with engine.connect() as conn:
-        result = (
-            conn.execute(
-                text("SELECT * FROM solutions WHERE id=:solutionId;"),
-                [{"solutionId": request.args.get("id")}],
-            )
-            .mappings()
-            .all()
-        )
-
-        if len(result) == 0:
-            return render_template(
-                "errorStandalone.html",
-                error="GeoTree with the given id does not exist",
-            )
-
-        thisInstanceJson = DataFileParser().convertTreeAndGeoToInstance(
-            json.loads(result[0].tree),
-            json.loads(result[0].geo),
-            float(result[0].padding),
-            result[0].connect,
-        )
-        thisSolutionJson = json.loads(result[0].solution)
-
-        conn.commit()
-
     if request.args.get("lh"):
         thisLeafHeight = int(float(request.args.get("lh")))
     else:
@@ -554,6 +764,9 @@ def draw():
         thisBackgroundMode = request.args.get("bm")
     else:
         thisBackgroundMode = os.getenv("defaultBackgroundMode")
+    # without local map tiles, tilesEmbed is drawn without a background
+    if thisBackgroundMode == "tilesEmbed" and not os.getenv("backgroundTiles"):
+        thisBackgroundMode = "none"
 
     if request.args.get("ih"):
         thisInternalHeight = int(float(request.args.get("ih")))
@@ -580,35 +793,117 @@ def draw():
     else:
         thisBranchLengthMode = os.getenv("defaultBranchLengthMode")
 
-    if (
-        thisBranchLengthMode == "custom"
-        and thisInstanceJson["maxCumBranchLength"] == math.inf
-    ):
+    with engine.connect() as conn:
+        result = (
+            conn.execute(
+                text(
+                    "SELECT solutionVersion,solutionTime,timeEnd FROM solutions WHERE id=:solutionId;"
+                ),
+                [{"solutionId": request.args.get("id")}],
+            )
+            .mappings()
+            .all()
+        )
+        conn.commit()
+
+    if len(result) == 0:
         return render_template(
-            "errorBaseless.html",
-            errorIn="ERROR: Can not draw custom branch length",
-            errorString="Branch length missing for some nodes. \nPlease make sure the branch length is set in the Newick tree file",
+            "errorStandalone.html",
+            error="GeoTree with the given id does not exist",
         )
 
-    thisOutSvg = io.StringIO()
-    drawPhylogeo.draw(
-        pInstance=thisInstanceJson,
-        pSolution=thisSolutionJson,
-        pOutput=thisOutSvg,
-        pCssMode="embed",
-        pLType=thisSolutionJson["lType"],
-        pLeafHeight=thisLeafHeight,
-        pInternalHeight=thisInternalHeight,
-        pExtraLeft=thisExtraLeft,
-        pExtraRight=thisExtraRight,
-        pExtraBot=thisExtraBot,
-        pBackgroundMode=thisBackgroundMode,
-        pBranchLengthMode=thisBranchLengthMode,
+    # every write of the solution increases its version, so the drawings of older
+    # versions are not found anymore
+    cacheKey = "\n".join(
+        str(thisPart)
+        for thisPart in [
+            request.args.get("id"),
+            result[0].solutionVersion,
+            thisLeafHeight,
+            thisInternalHeight,
+            thisExtraLeft,
+            thisExtraRight,
+            thisExtraBot,
+            thisBackgroundMode,
+            thisBranchLengthMode,
+        ]
     )
+    lastModifiedTime = result[0].solutionTime or result[0].timeEnd
 
-    thisOutSvgAsBytes = io.BytesIO()
-    thisOutSvgAsBytes.write(thisOutSvg.getvalue().encode())
-    thisOutSvgAsBytes.seek(0)
-    thisOutSvg.close()
+    encoding = request.accept_encodings.best_match(
+        renderCache.giveEncodings(), "identity"
+    )
 
-    return send_file(thisOutSvgAsBytes, download_name="optimizedTree.svg")
+    response = Response(mimetype="image/svg+xml")
+    # the bodies of the encodings differ, so each gets its own ETag
+    etag = renderCache.giveKeyHash(cacheKey)[:32]
+    if encoding != "identity":
+        etag += "-" + encoding
+    response.set_etag(etag)
+    if lastModifiedTime is not None:
+        response.last_modified = datetime.fromtimestamp(
+            lastModifiedTime / 1000, timezone.utc
+        )
+    # the solution can change while it is solved, so the browser has to ask every time
+    response.cache_control.no_cache = True
+    response.vary.add("Accept-Encoding")
+    response.headers["Content-Disposition"] = "inline; filename=optimizedTree.svg"
+
+    response.make_conditional(request)
+    if response.status_code == 304:
+        return response
+
+    svgBody = svgCache.get(cacheKey, encoding)
+
+    if svgBody is None:
+        thisInstanceJson = giveSolutionInstance(request.args.get("id"))
+        with engine.connect() as conn:
+            result = (
+                conn.execute(
+                    text("SELECT solution FROM solutions WHERE id=:solutionId;"),
+                    [{"solutionId": request.args.get("id")}],
+                )
+                .mappings()
+                .all()
+            )
+            conn.commit()
+        thisSolutionJson = json.loads(result[0].solution)
+
+        if (
+            thisBranchLengthMode == "custom"
+            and thisInstanceJson["maxCumBranchLength"] == math.inf
+        ):
+            return render_template(
+                "errorBaseless.html",
+                errorIn="ERROR: Can not draw custom branch length",
+                errorString="Branch length missing for some nodes. \nPlease make sure the branch length is set in the Newick tree file",
+            )
+
+        thisOutSvg = io.StringIO()
+        drawPhylogeo.draw(
+            pInstance=thisInstanceJson,
+            pSolution=thisSolutionJson,
+            pOutput=thisOutSvg,
+            pCssMode="embed",
+            pLType=thisSolutionJson["lType"],
+            pLeafHeight=thisLeafHeight,
+            pInternalHeight=thisInternalHeight,
+            pExtraLeft=thisExtraLeft,
+            pExtraRight=thisExtraRight,
+            pExtraBot=thisExtraBot,
+            pBackgroundMode=thisBackgroundMode,
+            pBranchLengthMode=thisBranchLengthMode,
+            pOnBackgroundMapFetched=observeBackgroundMapFetch,
+        )
+
+        svgBody = thisOutSvg.getvalue().encode()
+        thisOutSvg.close()
+        svgCache.put(cacheKey, svgBody)
+        if encoding != "identity":
+            svgBody = renderCache.giveCompressedBody(svgBody, encoding)
+
+    if encoding != "identity":
+        response.content_encoding = encoding
+    response.set_data(svgBody)
+
+    return response
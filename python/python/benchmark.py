@@ -0,0 +1,649 @@
+from parseFiles import DataFileParser, giveFeatureIndex
+from crossingEvaluator import giveLeaderCrossings
+from gurobiFunctions import giveMinLeaderIntersectModel, giveMinLeaderIntersectStart
+from heuristics import giveMeanXTurns, giveHeuristicConfig, giveTurnConfig
+from instanceGenerator import (
+    giveGeoJson,
+    giveInstanceJson,
+    giveNewickString,
+    giveSites,
+    giveTreeAndGeoFiles,
+    giveTreeJson,
+)
+from newickParser import giveNewickTreeJson
+from sitePairClassifier import giveClassifiedSitePairs
+from solverBackends import giveSolverBackend, giveSolverName
+import deepJson
+import drawPhylogeo
+import argparse
+import io
+import json
+import math
+import random
+import time
+
+import numpy as np
+
+# Bio.Phylo is only needed to compare the newick parser against
+try:
+    from Bio import Phylo
+except ImportError:
+    Phylo = None
+
+
+def giveBioPhyloTreeJson(pRootClade):
+    # The nested tree of newickToJson from a Bio.Phylo clade, as newickToJson built it
+    # before it read the newick file itself. Ids are given in post-order and site ids in the
+    # order of the leafs. Returns the tree, the leaf names in order and the biggest
+    # cum_branch_length of a leaf.
+    nextId = 0
+    namesOrder = []
+    maxCumBranchLength = -math.inf
+
+    tree = {}
+    stack = [[pRootClade, tree, 0, False]]
+    while len(stack) > 0:
+        thisClade, thisSubtree, thisCumBranchLength, isVisited = stack.pop()
+
+        if isVisited:
+            # inner vertices get their id after both subtrees
+            thisSubtree["id"] = nextId
+            nextId += 1
+            continue
+
+        thisBranchLength = thisClade.branch_length
+        if thisBranchLength is None:
+            thisBranchLength = math.inf
+
+        newCumBranchLength = thisCumBranchLength + thisBranchLength
+        if len(thisClade.clades) == 0:
+            thisSubtree["leaf"] = True
+            thisSubtree["id"] = nextId
+            thisSubtree["label"] = thisClade.name
+            thisSubtree["site_id"] = len(namesOrder)
+            thisSubtree["cum_branch_length"] = newCumBranchLength
+            nextId += 1
+            namesOrder.append(thisClade.name)
+            maxCumBranchLength = max(maxCumBranchLength, newCumBranchLength)
+        else:
+            thisSubtree["leaf"] = False
+            thisSubtree["cum_branch_length"] = newCumBranchLength
+            thisSubtree["left"] = {}
+            thisSubtree["right"] = {}
+
+            stack.append([thisClade, thisSubtree, newCumBranchLength, True])
+            stack.append(
+                [
+                    thisClade.clades[1],
+                    thisSubtree["right"],
+                    newCumBranchLength,
+                    False,
+                ]
+            )
+            stack.append(
+                [
+                    thisClade.clades[0],
+                    thisSubtree["left"],
+                    newCumBranchLength,
+                    False,
+                ]
+            )
+
+    return [tree, namesOrder, maxCumBranchLength]
+
+
+def benchmarkNewick(pName, pNewick, pShape, pNumLeaves):
+    # reads pNewick with the streaming parser of newickToJson and with Bio.Phylo,
+    # and checks that both give the same tree
+    res = {
+        "benchmark": "newick",
+        "shape": pShape,
+        "num_leaves": pNumLeaves,
+        "file": pName,
+        "newick_bytes": len(pNewick.encode("utf-8")),
+    }
+
+    startTime = time.perf_counter()
+    treeJson = giveNewickTreeJson(io.StringIO(pNewick))
+    res["seconds"] = time.perf_counter() - startTime
+    res["num_leaves"] = len(treeJson[1])
+
+    if Phylo is not None:
+        startTime = time.perf_counter()
+        bioTreeJson = giveBioPhyloTreeJson(
+            Phylo.read(io.StringIO(pNewick), "newick").root
+        )
+        res["bio_phylo_seconds"] = time.perf_counter() - startTime
+        res["equals_bio_phylo"] = deepJson.dumps(treeJson) == deepJson.dumps(
+            bioTreeJson
+        )
+
+    return [res]
+
+
+def giveFeatureIndicesByScan(pNames, pFeatures, pProperty):
+    # the feature of every name as convertTreeAndGeoToInstance found it before it had
+    # an index, by going through all features for every name
+    res = []
+    for thisName in pNames:
+        for thisIndex, thisFeature in enumerate(pFeatures):
+            if (
+                pProperty in thisFeature["properties"]
+                and thisFeature["properties"][pProperty] == thisName
+            ):
+                res.append(thisIndex)
+                break
+    return res
+
+
+def benchmarkConnect(pNumLeaves, pShape, pNumFeatures, pMaxScanLeaves, pRandom):
+    # connects the leafs to sites by "name", among pNumFeatures features of which
+    # the ones that are not a leaf have other names
+    phyloTreeJson = giveTreeJson(pNumLeaves, pShape, pRandom)
+    numFeatures = max(pNumLeaves, pNumFeatures)
+    names = phyloTreeJson["namesOrder"] + [
+        "unused" + str(i) for i in range(numFeatures - pNumLeaves)
+    ]
+    geoJson = giveGeoJson(names, giveSites(numFeatures, "uniform", pRandom), pRandom)
+    features = geoJson["features"]
+
+    res = []
+
+    def addMethod(pMethod, pStartTime):
+        res.append(
+            {
+                "benchmark": "connect",
+                "shape": pShape,
+                "num_leaves": pNumLeaves,
+                "num_features": numFeatures,
+                "method": pMethod,
+                "seconds": time.perf_counter() - pStartTime,
+            }
+        )
+
+    startTime = time.perf_counter()
+    featureIndex = giveFeatureIndex(features, "name")[0]
+    indexedFeatures = [
+        featureIndex[thisName] for thisName in phyloTreeJson["namesOrder"]
+    ]
+    addMethod("index", startTime)
+
+    if pNumLeaves <= pMaxScanLeaves:
+        startTime = time.perf_counter()
+        scannedFeatures = giveFeatureIndicesByScan(
+            phyloTreeJson["namesOrder"], features, "name"
+        )
+        addMethod("scan", startTime)
+        if scannedFeatures != indexedFeatures:
+            raise Exception("The index and the scan found different sites.")
+
+    startTime = time.perf_counter()
+    DataFileParser().convertTreeAndGeoToInstance(phyloTreeJson, geoJson, 0.2, "name")
+    addMethod("convertTreeAndGeoToInstance", startTime)
+
+    return res
+
+
+def benchmarkLca(pNumLeaves, pShape, pNumQueries, pRandom):
+    thisGeoTree = DataFileParser().parseFile(
+        giveInstanceJson(pNumLeaves, pShape, pRandom), "s", 0
+    )
+
+    leafIndices1 = np.array(
+        [pRandom.randrange(pNumLeaves) for i in range(pNumQueries)], dtype=np.int64
+    )
+    leafIndices2 = np.array(
+        [pRandom.randrange(pNumLeaves - 1) for i in range(pNumQueries)], dtype=np.int64
+    )
+    leafIndices2 += leafIndices2 >= leafIndices1
+
+    res = []
+
+    startTime = time.perf_counter()
+    thisGeoTree.buildLcaIndex()
+    res.append(["buildLcaIndex", time.perf_counter() - startTime])
+
+    startTime = time.perf_counter()
+    for i in range(pNumQueries):
+        thisGeoTree.giveLowestCommonParentVertexByParents(
+            thisGeoTree.leafs[leafIndices1[i]], thisGeoTree.leafs[leafIndices2[i]]
+        )
+    res.append(["allParents", time.perf_counter() - startTime])
+
+    startTime = time.perf_counter()
+    for i in range(pNumQueries):
+        thisGeoTree.giveLowestCommonParentVertex(
+            thisGeoTree.leafs[leafIndices1[i]], thisGeoTree.leafs[leafIndices2[i]]
+        )
+    res.append(["lcaIndex", time.perf_counter() - startTime])
+
+    startTime = time.perf_counter()
+    thisGeoTree.giveLowestCommonParentIndices(leafIndices1, leafIndices2)
+    res.append(["lcaIndexBatched", time.perf_counter() - startTime])
+
+    return [
+        {
+            "benchmark": "lca",
+            "shape": pShape,
+            "num_leaves": pNumLeaves,
+            "num_queries": pNumQueries,
+            "method": thisMethod,
+            "seconds": thisSeconds,
+        }
+        for thisMethod, thisSeconds in res
+    ]
+
+
+def benchmarkWarmStart(pNumLeaves, pShape, pLType, pSolver, pRandom):
+    thisGeoTree = DataFileParser().parseFile(
+        giveInstanceJson(pNumLeaves, pShape, pRandom), pLType, 0
+    )
+    ilpModel = giveMinLeaderIntersectModel(thisGeoTree)
+    backend = giveSolverBackend(pSolver, ilpModel)
+
+    startTime = time.perf_counter()
+    start = giveMinLeaderIntersectStart(ilpModel, giveMeanXTurns(thisGeoTree))
+    startSeconds = time.perf_counter() - startTime
+
+    res = []
+    for thisStart in [None, start]:
+        solverResult = backend.solve(ilpModel, thisStart)
+        res.append(
+            {
+                "benchmark": "warmstart",
+                "shape": pShape,
+                "num_leaves": pNumLeaves,
+                "ltype": pLType,
+                "solver": backend.name,
+                "warm_start": thisStart is not None,
+                "start_objective": float(ilpModel.giveObjectiveVector() @ start),
+                "start_seconds": startSeconds,
+                "objective": solverResult.objVal,
+                "time_to_first_incumbent": solverResult.stats["timeToFirstIncumbent"],
+                "seconds": solverResult.stats["runtime"],
+            }
+        )
+
+    return res
+
+
+def benchmarkPresolve(pNumLeaves, pShape, pLType, pSolver, pRandom):
+    thisGeoTree = DataFileParser().parseFile(
+        giveInstanceJson(pNumLeaves, pShape, pRandom), pLType, 0
+    )
+
+    res = []
+    for thisPresolve in [False, True]:
+        startTime = time.perf_counter()
+        ilpModel = giveMinLeaderIntersectModel(thisGeoTree, thisPresolve)
+        buildSeconds = time.perf_counter() - startTime
+
+        backend = giveSolverBackend(pSolver, ilpModel)
+        solverResult = backend.solve(ilpModel)
+        res.append(
+            {
+                "benchmark": "presolve",
+                "shape": pShape,
+                "num_leaves": pNumLeaves,
+                "ltype": pLType,
+                "solver": backend.name,
+                "presolve": thisPresolve,
+                "num_vars": ilpModel.numVars,
+                "num_constraints": ilpModel.numConstraints,
+                "objective": solverResult.objVal,
+                "build_seconds": buildSeconds,
+                "seconds": solverResult.stats["runtime"],
+            }
+        )
+
+    return res
+
+
+def benchmarkCrossings(pNumLeaves, pShape, pLType, pRandom):
+    thisGeoTree = DataFileParser().parseFile(
+        giveInstanceJson(pNumLeaves, pShape, pRandom), pLType, 0
+    )
+    turns = [
+        [thisInnerVertex.id, pRandom.random() < 0.5]
+        for thisInnerVertex in thisGeoTree.innerVertices
+    ]
+
+    methods = ["pairwise"]
+    if pLType == "po":
+        methods.append("sorting")
+
+    res = []
+    for thisMethod in methods:
+        startTime = time.perf_counter()
+        numCrossings = giveLeaderCrossings(thisGeoTree, turns, True, thisMethod)[0]
+        res.append(
+            {
+                "benchmark": "crossings",
+                "shape": pShape,
+                "num_leaves": pNumLeaves,
+                "ltype": pLType,
+                "method": thisMethod,
+                "num_crossings": numCrossings,
+                "seconds": time.perf_counter() - startTime,
+            }
+        )
+
+    return res
+
+
+def benchmarkPipeline(
+    pNumLeaves,
+    pShape,
+    pLType,
+    pSiteDistribution,
+    pSolver,
+    pTimeLimit,
+    pMaxClassifyLeaves,
+    pMaxSolveLeaves,
+    pRandom,
+):
+    # times every stage from the newick and geojson input to the svg separately. The
+    # stages that look at all site pairs are skipped above pMaxClassifyLeaves and the
+    # ILP above pMaxSolveLeaves, then the tree is drawn in the order of the tree file
+    newick, geoJson = giveTreeAndGeoFiles(
+        pNumLeaves, pShape, pSiteDistribution, pRandom
+    )
+    thisParser = DataFileParser()
+    res = []
+
+    def addStage(pStage, pStartTime, pInfo=None):
+        thisRes = {
+            "benchmark": "pipeline",
+            "shape": pShape,
+            "num_leaves": pNumLeaves,
+            "ltype": pLType,
+            "sites": pSiteDistribution,
+            "stage": pStage,
+            "seconds": None if pStartTime is None else time.perf_counter() - pStartTime,
+        }
+        if pInfo is not None:
+            thisRes.update(pInfo)
+        res.append(thisRes)
+
+    startTime = time.perf_counter()
+    phyloTreeJson = thisParser.newickToJson(io.StringIO(newick), pShape)
+    addStage("newickToJson", startTime)
+
+    # the web app stores the tree as JSON and reads it back for solving and drawing
+    startTime = time.perf_counter()
+    phyloTreeJson = deepJson.loads(deepJson.dumps(phyloTreeJson))
+    addStage("treeJson", startTime)
+
+    startTime = time.perf_counter()
+    instanceJson = thisParser.convertTreeAndGeoToInstance(
+        phyloTreeJson, geoJson, 0.2, "name"
+    )
+    addStage("convertTreeAndGeoToInstance", startTime)
+
+    startTime = time.perf_counter()
+    geoTree = thisParser.parseFile(instanceJson, pLType, 0)
+    addStage("parseFile", startTime)
+
+    shouldVerticesTurn, intersections = geoTree.giveNullSolution()
+    solver = giveSolverName(pSolver)
+
+    if pNumLeaves > pMaxClassifyLeaves:
+        addStage("classification", None)
+    else:
+        startTime = time.perf_counter()
+        sitePairs = giveClassifiedSitePairs(geoTree)
+        addStage(
+            "classification",
+            startTime,
+            {
+                "num_fixed": sitePairs.numFixed,
+                "num_intersecting": sitePairs.numIntersecting,
+                "num_horizontal": sitePairs.numHorizontal,
+            },
+        )
+
+    if pNumLeaves > pMaxSolveLeaves:
+        addStage("build", None)
+        addStage("optimize", None)
+    elif solver == "heuristic":
+        addStage("build", None)
+
+        startTime = time.perf_counter()
+        shouldVerticesTurn, intersections = giveHeuristicConfig(
+            geoTree, pTimeLimit=pTimeLimit
+        )
+        addStage(
+            "optimize", startTime, {"solver": solver, "intersections": intersections}
+        )
+    else:
+        startTime = time.perf_counter()
+        ilpModel = giveMinLeaderIntersectModel(geoTree)
+        addStage(
+            "build",
+            startTime,
+            {
+                "num_vars": ilpModel.numVars,
+                "num_constraints": ilpModel.numConstraints,
+            },
+        )
+
+        startTime = time.perf_counter()
+        backend = giveSolverBackend(pSolver, ilpModel)
+        solverResult = backend.solve(ilpModel, None, pTimeLimit)
+        if solverResult.x is None:
+            # no solution within the time limit, the tree is drawn in its own order
+            addStage(
+                "optimize",
+                startTime,
+                {
+                    "solver": backend.name,
+                    "intersections": None,
+                    "gap": None,
+                    "error": "no solution within the time limit",
+                },
+            )
+        else:
+            shouldVerticesTurn = giveTurnConfig(
+                geoTree,
+                solverResult.x[ilpModel.giveVariableSlice("innerVertices")] > 0.5,
+            )
+            intersections = solverResult.objVal
+            addStage(
+                "optimize",
+                startTime,
+                {
+                    "solver": backend.name,
+                    "intersections": intersections,
+                    "gap": solverResult.stats["gap"],
+                },
+            )
+
+    startTime = time.perf_counter()
+    leafPos = geoTree.giveLeafOffsetAfterTurns(shouldVerticesTurn)
+    addStage("giveLeafOffsetAfterTurns", startTime)
+
+    solutionJson = thisParser.giveOutputJSON(
+        shouldVerticesTurn, leafPos, intersections, pLType
+    )
+
+    startTime = time.perf_counter()
+    outSvg = io.StringIO()
+    drawPhylogeo.draw(
+        pInstance=instanceJson,
+        pSolution=solutionJson,
+        pOutput=outSvg,
+        pCssMode="none",
+        pLType=pLType,
+    )
+    addStage("draw", startTime, {"svg_bytes": len(outSvg.getvalue())})
+
+    return res
+
+
+if __name__ == "__main__":
+    ### HANDLE COMMANDLINE ARGUMENTS
+    aparser = argparse.ArgumentParser()
+
+    aparser.add_argument(
+        "benchmark",
+        help="Benchmark to run: pipeline, newick, connect, lca, warmstart, presolve or crossings",
+    )
+    aparser.add_argument(
+        "-o", "--output", help="Output JSON to a file. (Default is standard out.)"
+    )
+    aparser.add_argument(
+        "-n",
+        "--num-leaves",
+        type=int,
+        nargs="+",
+        default=[100, 500, 2000],
+        help="Tree sizes to benchmark.",
+    )
+    aparser.add_argument(
+        "-s",
+        "--shapes",
+        nargs="+",
+        default=["balanced", "caterpillar"],
+        help="Tree shapes to benchmark: balanced, caterpillar or random",
+    )
+    aparser.add_argument(
+        "-q",
+        "--num-queries",
+        type=int,
+        default=10000,
+        help="Number of random leaf pairs to query.",
+    )
+    aparser.add_argument(
+        "-l",
+        "--ltypes",
+        nargs="+",
+        default=["s", "po"],
+        help="Leader types for the pipeline, solver and crossings benchmarks: s and/or po",
+    )
+    aparser.add_argument(
+        "--solver",
+        help="MILP solver backend for the solver benchmarks (default: auto)",
+        default=None,
+    )
+    aparser.add_argument(
+        "-d",
+        "--sites",
+        nargs="+",
+        default=["clustered"],
+        help="Site distributions for the pipeline benchmark: uniform and/or clustered",
+    )
+    aparser.add_argument(
+        "-t",
+        "--time-limit",
+        type=float,
+        default=60,
+        help="Time limit of the optimize stage in the pipeline benchmark in seconds.",
+    )
+    aparser.add_argument(
+        "--max-classify-leaves",
+        type=int,
+        default=5000,
+        help="Biggest tree for which the pipeline benchmark classifies all site pairs.",
+    )
+    aparser.add_argument(
+        "--max-solve-leaves",
+        type=int,
+        default=200,
+        help="Biggest tree for which the pipeline benchmark builds and solves the ILP.",
+    )
+    aparser.add_argument(
+        "--num-features",
+        type=int,
+        default=50000,
+        help="Number of geojson features the connect benchmark connects the leafs to.",
+    )
+    aparser.add_argument(
+        "--max-scan-leaves",
+        type=int,
+        default=500,
+        help="Biggest tree for which the connect benchmark also scans all features per leaf.",
+    )
+    aparser.add_argument(
+        "--newick-files",
+        nargs="+",
+        default=[],
+        help="Newick files the newick benchmark reads as well.",
+    )
+    aparser.add_argument("--seed", type=int, default=0, help="Random seed.")
+
+    args = aparser.parse_args()
+
+    thisRandom = random.Random(args.seed)
+
+    results = []
+    for thisShape in args.shapes:
+        for thisNumLeaves in args.num_leaves:
+            if args.benchmark == "pipeline":
+                for thisLType in args.ltypes:
+                    for thisSiteDistribution in args.sites:
+                        results += benchmarkPipeline(
+                            thisNumLeaves,
+                            thisShape,
+                            thisLType,
+                            thisSiteDistribution,
+                            args.solver,
+                            args.time_limit,
+                            args.max_classify_leaves,
+                            args.max_solve_leaves,
+                            thisRandom,
+                        )
+            elif args.benchmark == "newick":
+                results += benchmarkNewick(
+                    None,
+                    giveNewickString(
+                        giveTreeJson(thisNumLeaves, thisShape, thisRandom)
+                    ),
+                    thisShape,
+                    thisNumLeaves,
+                )
+            elif args.benchmark == "connect":
+                results += benchmarkConnect(
+                    thisNumLeaves,
+                    thisShape,
+                    args.num_features,
+                    args.max_scan_leaves,
+                    thisRandom,
+                )
+            elif args.benchmark == "lca":
+                results += benchmarkLca(
+                    thisNumLeaves, thisShape, args.num_queries, thisRandom
+                )
+            elif args.benchmark == "warmstart":
+                for thisLType in args.ltypes:
+                    results += benchmarkWarmStart(
+                        thisNumLeaves, thisShape, thisLType, args.solver, thisRandom
+                    )
+            elif args.benchmark == "presolve":
+                for thisLType in args.ltypes:
+                    results += benchmarkPresolve(
+                        thisNumLeaves, thisShape, thisLType, args.solver, thisRandom
+                    )
+            elif args.benchmark == "crossings":
+                for thisLType in args.ltypes:
+                    results += benchmarkCrossings(
+                        thisNumLeaves, thisShape, thisLType, thisRandom
+                    )
+            else:
+                raise Exception("Unknown benchmark " + args.benchmark)
+
+    if args.benchmark == "newick":
+        for thisFile in args.newick_files:
+            with open(thisFile, encoding="utf-8") as newickFile:
+                results += benchmarkNewick(thisFile, newickFile.read(), None, None)
+
+    # setup: output to file if args say so, otherwise stdout
+    if args.output == None:
+        from sys import stdout as stdout
+
+        outputStream = stdout
+    else:
+        outputStream = open(args.output, "w", encoding="utf-8")
+
+    outputStream.write(json.dumps(results, indent=1))
+
+    print("Done.")
@@ -0,0 +1,317 @@
+from parseFiles import DataFileParser
+from sitePairClassifier import DEFAULT_CHUNK_SIZE, giveSitePairChunks
+import deepJson
+import argparse
+import json
+
+import numpy as np
+
+
+def giveLeafPositionArray(pGeoTree, pLeafPos):
+    # pLeafPos is either the leaf positions by leaf id, like leaf_pos of a solution and
+    # the output of giveLeafOffsetAfterTurns, or the turns of the inner vertices as
+    # [[id, turn], ...]. Returns the position of every leaf in the order of leafs.
+    if isinstance(pLeafPos, dict):
+        return np.array(
+            [pLeafPos[str(thisLeafId)] for thisLeafId in pGeoTree.leafIds.tolist()],
+            dtype=np.int64,
+        )
+
+    return pGeoTree.giveLeafPositionsAfterTurns([thisTurn[1] for thisTurn in pLeafPos])
+
+
+def giveRelativeCCW(pX1, pY1, pX2, pY2, pPX, pPY):
+    # vectorized java.awt.geom.Line2D.relativeCCW, 0 if the point is on the segment
+    x2 = pX2 - pX1
+    y2 = pY2 - pY1
+    px = pPX - pX1
+    py = pPY - pY1
+
+    ccw = px * y2 - py * x2
+
+    # collinear points: positive beyond the end, negative before the start of the segment
+    collinearCcw = px * x2 + py * y2
+    beyondCcw = np.maximum((px - x2) * x2 + (py - y2) * y2, 0.0)
+    collinearCcw = np.where(collinearCcw > 0, beyondCcw, collinearCcw)
+
+    return np.sign(np.where(ccw == 0, collinearCcw, ccw))
+
+
+def giveSegmentsIntersect(pSegment1, pSegment2):
+    # vectorized java.awt.geom.Line2D.linesIntersect for closed segments, every segment
+    # is a tuple of arrays (x1, y1, x2, y2)
+    x1, y1, x2, y2 = pSegment1
+    x3, y3, x4, y4 = pSegment2
+
+    return (
+        giveRelativeCCW(x1, y1, x2, y2, x3, y3)
+        * giveRelativeCCW(x1, y1, x2, y2, x4, y4)
+        <= 0
+    ) & (
+        giveRelativeCCW(x3, y3, x4, y4, x1, y1)
+        * giveRelativeCCW(x3, y3, x4, y4, x2, y2)
+        <= 0
+    )
+
+
+def giveDominanceCounts(pPointKeys, pPointValues, pQueryKeys, pQueryValues):
+    # for every query the number of points with key <= query key and value <= query
+    # value. The points are sorted by key, so a query asks for a prefix of them, which
+    # splits into at most log n blocks of length 2^level. Every level is one sort and one
+    # binary search, so the counts take O(n log^2 n) instead of O(n^2).
+    numPoints = len(pPointKeys)
+    counts = np.zeros(len(pQueryKeys), dtype=np.int64)
+    if numPoints == 0:
+        return counts
+
+    keyOrder = np.argsort(pPointKeys, kind="stable")
+    prefixLengths = np.searchsorted(pPointKeys[keyOrder], pQueryKeys, side="right")
+
+    uniqueValues = np.unique(pPointValues)
+    numUniqueValues = len(uniqueValues)
+    valueRanks = np.searchsorted(uniqueValues, pPointValues[keyOrder])
+    queryRanks = np.searchsorted(uniqueValues, pQueryValues, side="right")
+
+    level = 0
+    while (1 << level) <= numPoints:
+        blockKeys = np.sort(
+            (np.arange(numPoints, dtype=np.int64) >> level) * numUniqueValues
+            + valueRanks
+        )
+
+        hasBlock = ((prefixLengths >> level) & 1) == 1
+        queryBlocks = (prefixLengths[hasBlock] >> level) - 1
+        counts[hasBlock] += np.searchsorted(
+            blockKeys, queryBlocks * numUniqueValues + queryRanks[hasBlock]
+        ) - (queryBlocks << level)
+
+        level += 1
+
+    return counts
+
+
+class LeaderGeometry(object):
+    # the leaders of a drawing with the leafs at the given positions, in the order of
+    # leafs. Leafs are placed on the top line like in GeoTree.giveTwoSitesTopLineIntersectIndex.
+    def __init__(self, pGeoTree, pLeafPositions):
+        treeWidth = pGeoTree.innerVertices[0].subTreeWidth
+        sitePos = pGeoTree.sitePositions
+
+        self.lType = pGeoTree.lType
+        self.topLineY = pGeoTree.topLineStart[1]
+        self.leafX = pGeoTree.topLineStart[0] + np.asarray(pLeafPositions) / (
+            treeWidth - 1
+        ) * (pGeoTree.topLineEnd[0] - pGeoTree.topLineStart[0])
+        self.siteX = sitePos[:, 0]
+        self.siteY = sitePos[:, 1]
+
+    def givePairCrossings(self, pLeader1, pLeader2):
+        # the exact test of Leader.crossesLeader in the java implementation
+        topLineY = np.full(len(pLeader1), self.topLineY, dtype=np.float64)
+
+        if self.lType == "s":
+            return giveSegmentsIntersect(
+                (
+                    self.leafX[pLeader1],
+                    topLineY,
+                    self.siteX[pLeader1],
+                    self.siteY[pLeader1],
+                ),
+                (
+                    self.leafX[pLeader2],
+                    topLineY,
+                    self.siteX[pLeader2],
+                    self.siteY[pLeader2],
+                ),
+            )
+        elif self.lType == "po":
+            horizontal1 = (
+                self.leafX[pLeader1],
+                self.siteY[pLeader1],
+                self.siteX[pLeader1],
+                self.siteY[pLeader1],
+            )
+            vertical1 = (
+                self.leafX[pLeader1],
+                topLineY,
+                self.leafX[pLeader1],
+                self.siteY[pLeader1],
+            )
+            horizontal2 = (
+                self.leafX[pLeader2],
+                self.siteY[pLeader2],
+                self.siteX[pLeader2],
+                self.siteY[pLeader2],
+            )
+            vertical2 = (
+                self.leafX[pLeader2],
+                topLineY,
+                self.leafX[pLeader2],
+                self.siteY[pLeader2],
+            )
+
+            return giveSegmentsIntersect(
+                horizontal1, vertical2
+            ) | giveSegmentsIntersect(vertical1, horizontal2)
+
+        raise Exception("Unknown leader type " + self.lType)
+
+    def giveCrossingsPairwise(self, pChunkSize=DEFAULT_CHUNK_SIZE):
+        # tests all pairs of leaders, chunk by chunk
+        numCrossings = 0
+        leafCrossings = np.zeros(len(self.leafX), dtype=np.int64)
+
+        for leader1, leader2 in giveSitePairChunks(len(self.leafX), pChunkSize):
+            isCrossing = self.givePairCrossings(leader1, leader2)
+            numCrossings += int(np.count_nonzero(isCrossing))
+            leafCrossings += np.bincount(
+                leader1[isCrossing], minlength=len(self.leafX)
+            ) + np.bincount(leader2[isCrossing], minlength=len(self.leafX))
+
+        return numCrossings, leafCrossings
+
+    def canCountBySorting(self):
+        # the po leaders are axis parallel, so if all sites are below the top line the
+        # crossings are dominance counts. A site on the top line makes its vertical
+        # segment a point, which Line2D lets intersect every other point.
+        return self.lType == "po" and bool(np.all(self.siteY > self.topLineY))
+
+    def giveCrossingsBySorting(self):
+        # The horizontal segment of leader a meets the vertical segment of leader b iff
+        # leafX[b] is between leafX[a] and siteX[a] and siteY[b] >= siteY[a]. Leader a
+        # meets its own vertical segment, which is removed afterwards.
+        numLeaders = len(self.leafX)
+        horizontalLeft = np.minimum(self.leafX, self.siteX)
+        horizontalRight = np.maximum(self.leafX, self.siteX)
+        beforeHorizontalLeft = np.nextafter(horizontalLeft, -np.inf)
+        beforeLeafX = np.nextafter(self.leafX, -np.inf)
+
+        # horizontal segment of a on vertical segment of b
+        outgoing = giveDominanceCounts(
+            -self.siteY, self.leafX, -self.siteY, horizontalRight
+        ) - giveDominanceCounts(
+            -self.siteY, self.leafX, -self.siteY, beforeHorizontalLeft
+        )
+        # horizontal segment of b on vertical segment of a
+        incoming = giveDominanceCounts(
+            self.siteY, horizontalLeft, self.siteY, self.leafX
+        ) - giveDominanceCounts(self.siteY, horizontalRight, self.siteY, beforeLeafX)
+        outgoing -= 1
+        incoming -= 1
+
+        # pairs meeting both ways need the same y, they are only counted once
+        both = np.zeros(numLeaders, dtype=np.int64)
+        yOrder = np.argsort(self.siteY, kind="stable")
+        groupStarts = np.flatnonzero(
+            np.concatenate([[True], np.diff(self.siteY[yOrder]) != 0, [True]])
+        )
+        for thisStart, thisEnd in zip(groupStarts[:-1], groupStarts[1:]):
+            if thisEnd - thisStart < 2:
+                continue
+
+            for group1, group2 in giveSitePairChunks(thisEnd - thisStart):
+                leader1 = yOrder[thisStart + group1]
+                leader2 = yOrder[thisStart + group2]
+                isBoth = (
+                    (self.leafX[leader2] >= horizontalLeft[leader1])
+                    & (self.leafX[leader2] <= horizontalRight[leader1])
+                    & (self.leafX[leader1] >= horizontalLeft[leader2])
+                    & (self.leafX[leader1] <= horizontalRight[leader2])
+                )
+                both += np.bincount(leader1[isBoth], minlength=numLeaders)
+                both += np.bincount(leader2[isBoth], minlength=numLeaders)
+
+        numCrossings = int(np.sum(outgoing) - np.sum(both) // 2)
+        return numCrossings, outgoing + incoming - both
+
+    pass
+
+
+def giveLeaderCrossings(
+    pGeoTree, pLeafPos, pPerLeaf=False, pMethod="auto", pChunkSize=DEFAULT_CHUNK_SIZE
+):
+    # Counts the pairs of leaders that cross in the drawing of the leaf order pLeafPos
+    # (see giveLeafPositionArray). With pPerLeaf also returns the number of crossings of
+    # every leaf in the order of leafs. pMethod is pairwise, sorting or auto, which sorts
+    # whenever the leaders allow it.
+    leaderGeometry = LeaderGeometry(pGeoTree, giveLeafPositionArray(pGeoTree, pLeafPos))
+
+    method = pMethod
+    if method == "auto":
+        method = "sorting" if leaderGeometry.canCountBySorting() else "pairwise"
+
+    if method == "sorting":
+        if not leaderGeometry.canCountBySorting():
+            raise Exception(
+                "The crossings of these leaders can not be counted by sorting"
+            )
+        numCrossings, leafCrossings = leaderGeometry.giveCrossingsBySorting()
+    elif method == "pairwise":
+        numCrossings, leafCrossings = leaderGeometry.giveCrossingsPairwise(pChunkSize)
+    else:
+        raise Exception("Unknown method " + method)
+
+    if pPerLeaf:
+        return numCrossings, leafCrossings
+
+    return numCrossings
+
+
+if __name__ == "__main__":
+    ### HANDLE COMMANDLINE ARGUMENTS
+    aparser = argparse.ArgumentParser()
+
+    # input/output
+    aparser.add_argument(
+        "instance", help="Path to JSON file with the geophylo instance."
+    )
+    aparser.add_argument("solution", help="Path to JSON file with the solution.")
+    aparser.add_argument(
+        "-o", "--output", help="Output JSON to a file. (Default is standard out.)"
+    )
+    aparser.add_argument(
+        "-g",
+        "--pogap",
+        help="Min Gap between Horizontal Lines for PO-Leaders",
+        type=float,
+        default=0,
+    )
+    aparser.add_argument(
+        "-m",
+        "--method",
+        help="How to count: pairwise, sorting or auto (default)",
+        default="auto",
+    )
+
+    args = aparser.parse_args()
+
+    # setup: output to file if args say so, otherwise stdout
+    if args.output == None:
+        from sys import stdout as stdout
+
+        outputStream = stdout
+    else:
+        outputStream = open(args.output, "w", encoding="utf-8")
+
+    solutionJson = json.load(open(args.solution))
+    thisGeoTree = DataFileParser().parseFile(
+        deepJson.load(open(args.instance)), solutionJson["lType"], args.pogap
+    )
+    numCrossings, leafCrossings = giveLeaderCrossings(
+        thisGeoTree, solutionJson["leaf_pos"], True, args.method
+    )
+
+    outputStream.write(
+        json.dumps(
+            {
+                "num_crossings": numCrossings,
+                "num_intersections": solutionJson["num_intersections"],
+                "leaf_crossings": {
+                    str(thisLeaf.id): int(leafCrossings[thisLeaf.totalIndex])
+                    for thisLeaf in thisGeoTree.leafs
+                },
+            }
+        )
+    )
+
+    print("Done.")
@@ -0,0 +1,166 @@
+import json
+import re
+
+# The trees are nested one level per tree level, so deep trees are nested deeper than
+# json.dumps and json.loads can handle without hitting the recursion limit. dumps and
+# loads give the same results as the json module, but fall back to explicit stacks
+# for deeply nested objects.
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+# an object or array without objects or arrays in it, e.g. a leaf of a tree
+FLAT_CONTAINER = re.compile(
+    r'\{(?:[^{}\[\]"]|"(?:[^"\\]|\\.)*")*\}|\[(?:[^{}\[\]"]|"(?:[^"\\]|\\.)*")*\]'
+)
+DECODER = json.JSONDecoder()
+
+
+def dumps(pObject):
+    try:
+        return json.dumps(pObject)
+    except RecursionError:
+        return giveJsonStringWithStack(pObject)
+
+
+def loads(pString):
+    if isinstance(pString, (bytes, bytearray)):
+        pString = pString.decode("utf-8")
+
+    try:
+        return json.loads(pString)
+    except RecursionError:
+        return giveJsonObjectWithStack(pString)
+
+
+def load(pFile):
+    return loads(pFile.read())
+
+
+def isFlat(pItem):
+    # flat objects and arrays are written by json.dumps at once
+    if isinstance(pItem, dict):
+        values = pItem.values()
+    elif isinstance(pItem, (list, tuple)):
+        values = pItem
+    else:
+        return True
+
+    for thisValue in values:
+        if isinstance(thisValue, (dict, list, tuple)):
+            return False
+    return True
+
+
+def giveKeyString(pKey):
+    # json.dumps turns non string keys into strings like this
+    if isinstance(pKey, str):
+        return json.dumps(pKey)
+    return json.dumps(json.dumps(pKey))
+
+
+def giveJsonStringWithStack(pObject):
+    # like json.dumps with the default separators. The stack holds [isText, item],
+    # text is written as it is and the other items are still to encode
+    parts = []
+    stack = [[False, pObject]]
+    while len(stack) > 0:
+        isText, thisItem = stack.pop()
+
+        if isText:
+            parts.append(thisItem)
+        elif isFlat(thisItem):
+            parts.append(json.dumps(thisItem))
+        elif isinstance(thisItem, dict):
+            parts.append("{")
+            stack.append([True, "}"])
+            items = list(thisItem.items())
+            for thisIndex in range(len(items) - 1, -1, -1):
+                stack.append([False, items[thisIndex][1]])
+                stack.append([True, giveKeyString(items[thisIndex][0]) + ": "])
+                if thisIndex > 0:
+                    stack.append([True, ", "])
+        elif isinstance(thisItem, (list, tuple)):
+            parts.append("[")
+            stack.append([True, "]"])
+            for thisIndex in range(len(thisItem) - 1, -1, -1):
+                stack.append([False, thisItem[thisIndex]])
+                if thisIndex > 0:
+                    stack.append([True, ", "])
+        else:
+            parts.append(json.dumps(thisItem))
+
+    return "".join(parts)
+
+
+def giveKeyAndIndex(pString, pIndex):
+    # reads '"key" :' at pIndex, returns the key and the index after the colon
+    if pString[pIndex : pIndex + 1] != '"':
+        raise json.JSONDecodeError(
+            "Expecting property name enclosed in double quotes", pString, pIndex
+        )
+    key, index = json.decoder.scanstring(pString, pIndex + 1)
+
+    index = WHITESPACE.match(pString, index).end()
+    if pString[index : index + 1] != ":":
+        raise json.JSONDecodeError("Expecting ':' delimiter", pString, index)
+
+    return key, WHITESPACE.match(pString, index + 1).end()
+
+
+def giveJsonObjectWithStack(pString):
+    # like json.loads, the stack holds the open objects and arrays together with the
+    # key the next value belongs to (None for arrays)
+    stack = []
+    index = WHITESPACE.match(pString, 0).end()
+
+    while True:
+        # read the next value, objects and arrays are opened and read on later
+        thisChar = pString[index : index + 1]
+        flatMatch = None
+        if thisChar == "{" or thisChar == "[":
+            flatMatch = FLAT_CONTAINER.match(pString, index)
+
+        if flatMatch is None and (thisChar == "{" or thisChar == "["):
+            container = {} if thisChar == "{" else []
+            closingChar = "}" if thisChar == "{" else "]"
+            index = WHITESPACE.match(pString, index + 1).end()
+
+            if pString[index : index + 1] != closingChar:
+                key = None
+                if thisChar == "{":
+                    key, index = giveKeyAndIndex(pString, index)
+                stack.append([container, key])
+                continue
+
+            value = container
+            index += 1
+        else:
+            value, index = DECODER.raw_decode(pString, index)
+
+        # add the value to its container and close all containers that end here
+        while True:
+            index = WHITESPACE.match(pString, index).end()
+            if len(stack) == 0:
+                if index != len(pString):
+                    raise json.JSONDecodeError("Extra data", pString, index)
+                return value
+
+            container, key = stack[-1]
+            if key is None:
+                container.append(value)
+            else:
+                container[key] = value
+
+            thisChar = pString[index : index + 1]
+            if thisChar == ",":
+                index = WHITESPACE.match(pString, index + 1).end()
+                if isinstance(container, dict):
+                    stack[-1][1], index = giveKeyAndIndex(pString, index)
+                break
+
+            closingChar = "}" if isinstance(container, dict) else "]"
+            if thisChar != closingChar:
+                raise json.JSONDecodeError("Expecting ',' delimiter", pString, index)
+
+            stack.pop()
+            value = container
+            index += 1
@@ -1,12 +1,15 @@
+import deepJson
 import json
 import svgwrite as svg
 import argparse
 from pyproj import Transformer
-from datauri import DataURI
+from renderCache import DiskCache
+from tileMaps import giveTileMap
+import base64
 import tempfile
 import requests
-import shutil
 import os
+import time
 
 TRAN_3857_TO_4326 = Transformer.from_crs("EPSG:3857", "EPSG:4326", always_xy=True)
 
@@ -15,7 +18,17 @@ def transformToLonLat(mercatorX, mercatorY):
     return TRAN_3857_TO_4326.transform(mercatorX, mercatorY)
 
 
-def giveBackgroundMapMercator(pX1, pY1, pX2, pY2, mapWidth, mapHeight, pScale):
+def giveBackgroundMapMercator(
+    pX1,
+    pY1,
+    pX2,
+    pY2,
+    mapWidth,
+    mapHeight,
+    pScale,
+    pFetchBackgroundMap=None,
+    pOnBackgroundMapFetched=None,
+):
     point1 = transformToLonLat(pX1, pY1)
     point2 = transformToLonLat(pX2, pY2)
     return giveBackgroundMap(
@@ -25,18 +38,47 @@ def giveBackgroundMapMercator(pX1, pY1, pX2, pY2, mapWidth, mapHeight, pScale):
         point2[0],
         mapWidth * pScale,
         mapHeight * pScale,
+        pFetchBackgroundMap,
+        pOnBackgroundMapFetched,
     )
 
 
-def giveBackgroundMap(pLat1, pLng1, pLat2, pLng2, mapWidth, mapHeight):
+# style of the static background maps
+BACKGROUND_MAP_STYLE = "osm-bright-smooth"
+# the corners of background maps are rounded to this many decimals (about 1 m)
+BACKGROUND_MAP_DECIMALS = 5
+# made on first use, see giveBackgroundMapCache
+backgroundMapCache = None
+
+
+def giveBackgroundMapCache():
+    # the background maps are kept in backgroundMapCacheDir, which several processes
+    # can share. None if backgroundMapCacheDir is set to be empty
+    global backgroundMapCache
+    if backgroundMapCache is None:
+        cacheDir = os.getenv(
+            "backgroundMapCacheDir",
+            os.path.join(tempfile.gettempdir(), "phyloptimizeBackgroundMaps"),
+        )
+        if cacheDir == "":
+            return None
+        backgroundMapCache = DiskCache(
+            cacheDir, int(float(os.getenv("backgroundMapCacheBytes", "512e6")))
+        )
+    return backgroundMapCache
+
+
+def fetchGeoapifyMap(pLat1, pLng1, pLat2, pLng2, mapWidth, mapHeight, pStyle):
+    # the static map image from the Geoapify API, or from the server at GeoAPIUrl
+    # instead, which is what a stub server in tests uses
     geoUrl = ""
-    geoBaseUrl = "https://maps.geoapify.com/v1/staticmap?"
+    geoBaseUrl = os.getenv("GeoAPIUrl", "https://maps.geoapify.com/v1/staticmap?")
     geoUrl += geoBaseUrl
 
     geoApiKey = os.getenv("GeoAPI")
     geoUrl += "apiKey=" + geoApiKey
 
-    geoStyle = "osm-bright-smooth"
+    geoStyle = pStyle
     geoUrl += "&style=" + geoStyle
 
     geoWidth = mapWidth
@@ -58,9 +100,61 @@ def giveBackgroundMap(pLat1, pLng1, pLat2, pLng2, mapWidth, mapHeight):
 
     print(geoUrl)
 
-    response = requests.get(geoUrl, stream=True)
+    response = requests.get(geoUrl)
+    response.raise_for_status()
+
+    return response.content
 
-    return response.raw
+
+def giveBackgroundMap(
+    pLat1,
+    pLng1,
+    pLat2,
+    pLng2,
+    mapWidth,
+    mapHeight,
+    pFetchBackgroundMap=None,
+    pOnBackgroundMapFetched=None,
+):
+    # the image of the background map as bytes, from the cache or fetched with
+    # pFetchBackgroundMap (default fetchGeoapifyMap), which gets the same arguments
+    # as fetchGeoapifyMap. pOnBackgroundMapFetched(seconds) is called after a fetch
+    if pFetchBackgroundMap is None:
+        pFetchBackgroundMap = fetchGeoapifyMap
+
+    # maps of nearly the same area are the same map
+    mapArgs = [
+        round(pLat1, BACKGROUND_MAP_DECIMALS),
+        round(pLng1, BACKGROUND_MAP_DECIMALS),
+        round(pLat2, BACKGROUND_MAP_DECIMALS),
+        round(pLng2, BACKGROUND_MAP_DECIMALS),
+        round(mapWidth),
+        round(mapHeight),
+        BACKGROUND_MAP_STYLE,
+    ]
+    cacheKey = " ".join(str(thisArg) for thisArg in mapArgs)
+
+    cache = giveBackgroundMapCache()
+    if cache is not None:
+        mapImage = cache.get(cacheKey)
+        if mapImage is not None:
+            return mapImage
+
+    fetchStartTime = time.perf_counter()
+    mapImage = pFetchBackgroundMap(*mapArgs)
+    if pOnBackgroundMapFetched is not None:
+        pOnBackgroundMapFetched(time.perf_counter() - fetchStartTime)
+
+    if cache is not None:
+        cache.put(cacheKey, mapImage)
+
+    return mapImage
+
+
+def giveImageDataUri(pImage):
+    # the static maps are jpeg or png images
+    mimeType = "image/png" if pImage.startswith(b"\x89PNG") else "image/jpeg"
+    return "data:" + mimeType + ";base64," + base64.b64encode(pImage).decode("ascii")
 
 
 def draw(
@@ -77,7 +171,11 @@ def draw(
     pExtraRight=0,
     pBackgroundMode="none",
     pBranchLengthMode="custom",
+    pOnBackgroundMapFetched=None,
+    pFetchBackgroundMap=None,
 ):
+    # pOnBackgroundMapFetched(seconds) is called after a static background map has been
+    # downloaded, pFetchBackgroundMap replaces the download, see giveBackgroundMap
     inst = pInstance
     sol = pSolution
     svg_stream = pOutput
@@ -115,73 +213,85 @@ def draw(
 
     fontSize = leaf_x_scale2 - 0.5
 
-    def draw_tree(self, gr):
-        if self["leaf"]:
-            leaf_label = gr.add(
-                gr.g(
-                    id="leaf-{}".format(self["id"]),
-                    class_="leaf",
-                    style="font-size:" + str(fontSize) + "px !important;",
+    def draw_leaf(self, gr):
+        leaf_label = gr.add(
+            gr.g(
+                id="leaf-{}".format(self["id"]),
+                class_="leaf",
+                style="font-size:" + str(fontSize) + "px !important;",
+            )
+        )
+        real_x = leaf_x(sol["leaf_pos"][str(self["id"])])
+        leaf_label.translate(real_x, 0)
+        leaf_label.add(gr.text(self["label"], (0, 0), class_="label"))
+        # leader
+        site = inst["sites"][self["site_id"]]
+        leaf_port = sol["leaf_pos"][str(self["id"])]
+
+        if pLType == "s":
+            dwg.add(
+                dwg.line(
+                    (leaf_x(leaf_port), 0),
+                    [site["x"] - x_min, site["y"] - y_min],
+                    class_="leader",
                 )
             )
-            real_x = leaf_x(sol["leaf_pos"][str(self["id"])])
-            leaf_label.translate(real_x, 0)
-            leaf_label.add(gr.text(self["label"], (0, 0), class_="label"))
-            # leader
-            site = inst["sites"][self["site_id"]]
-            leaf_port = sol["leaf_pos"][str(self["id"])]
-
-            if pLType == "s":
-                dwg.add(
-                    dwg.line(
+        elif pLType == "po":
+            dwg.add(
+                dwg.polyline(
+                    [
                         (leaf_x(leaf_port), 0),
+                        (leaf_x(leaf_port), site["y"]),
                         [site["x"] - x_min, site["y"] - y_min],
-                        class_="leader",
-                    )
-                )
-            elif pLType == "po":
-                dwg.add(
-                    dwg.polyline(
-                        [
-                            (leaf_x(leaf_port), 0),
-                            (leaf_x(leaf_port), site["y"]),
-                            [site["x"] - x_min, site["y"] - y_min],
-                        ],
-                        class_="leader",
-                    )
+                    ],
+                    class_="leader",
                 )
+            )
 
-            if pBranchLengthMode == "autoAlign":
-                return (real_x, 0)
-            else:
-                newY = (
-                    self["cum_branch_length"] - maxCumBranchLength
-                ) * pInternalHeight
+        if pBranchLengthMode == "autoAlign":
+            return (real_x, 0)
+        else:
+            newY = (self["cum_branch_length"] - maxCumBranchLength) * pInternalHeight
 
-                return (real_x, newY)
+            return (real_x, newY)
 
+    def draw_inner(self, gr, pL, pR):
+        if pBranchLengthMode == "autoAlign":
+            new_y = min(pL[1], pR[1]) - pInternalHeight
+
+            if self["left"]["leaf"] or self["right"]["leaf"]:
+                # give at least leaf_height space for leafs
+                new_y = min(new_y, -pLeafHeight)
         else:
-            pL = draw_tree(self["left"], gr)
-            pR = draw_tree(self["right"], gr)
+            new_y = (self["cum_branch_length"] - maxCumBranchLength) * pInternalHeight
 
-            if pBranchLengthMode == "autoAlign":
-                new_y = min(pL[1], pR[1]) - pInternalHeight
+        gr.add(
+            gr.path(
+                "M {} {} V {} H {} V {}".format(pL[0], pL[1], new_y, pR[0], pR[1]),
+                class_="tree",
+            )
+        )
+        return (0.5 * (pL[0] + pR[0]), new_y)
 
-                if self["left"]["leaf"] or self["right"]["leaf"]:
-                    # give at least leaf_height space for leafs
-                    new_y = min(new_y, -pLeafHeight)
+    def draw_tree(self, gr):
+        # post-order with an explicit stack, so deep trees do not hit the recursion
+        # limit. The positions of the drawn subtrees wait on their own stack
+        positions = []
+        stack = [[self, False]]
+        while len(stack) > 0:
+            subtree, is_visited = stack.pop()
+            if subtree["leaf"]:
+                positions.append(draw_leaf(subtree, gr))
+            elif is_visited:
+                pR = positions.pop()
+                pL = positions.pop()
+                positions.append(draw_inner(subtree, gr, pL, pR))
             else:
-                new_y = (
-                    self["cum_branch_length"] - maxCumBranchLength
-                ) * pInternalHeight
-
-            gr.add(
-                gr.path(
-                    "M {} {} V {} H {} V {}".format(pL[0], pL[1], new_y, pR[0], pR[1]),
-                    class_="tree",
-                )
-            )
-            return (0.5 * (pL[0] + pR[0]), new_y)
+                stack.append([subtree, True])
+                stack.append([subtree["right"], False])
+                stack.append([subtree["left"], False])
+
+        return positions[0]
 
     dwg = svg.Drawing()
 
@@ -217,7 +327,6 @@ def draw(
         extraBotMerc = (
             pExtraBot * (inst["mercator_max_y"] - inst["mercator_min_y"]) / 100
         )
-        backgroundImgTempFile = tempfile.NamedTemporaryFile(suffix=".jpg")
         backgroundImg = giveBackgroundMapMercator(
             inst["mercator_min_x"] - extraLeftMerc,
             inst["mercator_min_y"],
@@ -226,15 +335,11 @@ def draw(
             inst["map_width"] + extraLeftAbs + extraRightAbs,
             inst["map_height"] + extraBotAbs,
             5,
+            pFetchBackgroundMap,
+            pOnBackgroundMapFetched,
         )
 
-        with open(backgroundImgTempFile.name, "bw") as f:
-            shutil.copyfileobj(backgroundImg, f)
-            f.seek(0)
-
-        backgroundImgDataURI = DataURI.from_file(backgroundImgTempFile.name)
-
-        backgroundImgDataURIString = str(backgroundImgDataURI)
+        backgroundImgDataURIString = giveImageDataUri(backgroundImg)
 
         dwg.add(
             dwg.image(
@@ -246,6 +351,45 @@ def draw(
                 ),
             )
         )
+    elif pBackgroundMode == "tilesEmbed":
+        # the same area as osmEmbed, from the local tiles at backgroundTiles
+        mercatorScale = inst["map_width"] / (
+            inst["mercator_max_x"] - inst["mercator_min_x"]
+        )
+        extraLeftMerc = extraLeftAbs / mercatorScale
+        extraRightMerc = extraRightAbs / mercatorScale
+        extraBotMerc = extraBotAbs / mercatorScale
+        tiles = giveTileMap().giveTiles(
+            inst["mercator_min_x"] - extraLeftMerc,
+            inst["mercator_min_y"],
+            inst["mercator_max_x"] + extraRightMerc,
+            inst["mercator_max_y"] + extraBotMerc,
+            (inst["map_width"] + extraLeftAbs + extraRightAbs) * 5,
+        )
+
+        # the tiles at the border reach out of the background
+        backgroundClip = dwg.defs.add(dwg.clipPath(id="background-clip"))
+        backgroundClip.add(
+            dwg.rect(
+                insert=(-extraLeftAbs, 0),
+                size=(
+                    inst["map_width"] + extraLeftAbs + extraRightAbs,
+                    inst["map_height"] + extraBotAbs,
+                ),
+            )
+        )
+        backgroundGroup = dwg.add(dwg.g(clip_path="url(#background-clip)"))
+        for thisDataUri, thisX, thisY, thisSize in tiles:
+            backgroundGroup.add(
+                dwg.image(
+                    href=thisDataUri,
+                    insert=(
+                        (thisX - inst["mercator_min_x"]) * mercatorScale,
+                        (thisY - inst["mercator_min_y"]) * mercatorScale,
+                    ),
+                    size=(thisSize * mercatorScale, thisSize * mercatorScale),
+                )
+            )
     elif pBackgroundMode == "none":
         dwg.add(
             dwg.rect(
@@ -353,7 +497,7 @@ if __name__ == "__main__":
         "--background-mode",
         type=str,
         default="none",
-        help="Style of the background. Either none or osmEmbed for a static map",
+        help="Style of the background. Either none, osmEmbed for a static map or tilesEmbed for a map from the local tiles at backgroundTiles",
     )
     aparser.add_argument(
         "-blm",
@@ -366,7 +510,7 @@ if __name__ == "__main__":
     args = aparser.parse_args()
 
     with open(args.instance) as f:
-        instanceJson = json.load(f)
+        instanceJson = deepJson.load(f)
 
     with open(args.solution) as f:
         solutionJson = json.load(f)
@@ -1,391 +1,405 @@
 import numpy as np
 import scipy.sparse as sp
-import gurobipy as gp
-from gurobipy import GRB
-import os
-
-usingLicense = False
-
-if (
-    (os.getenv("GRB_WLSACCESSID") is not None)
-    and (os.getenv("GRB_LICENSEID") is not None)
-    and (os.getenv("GRB_WLSSECRET") is not None)
-):
-    print("usingLicense")
-    usingLicense = True
-    gurobiEnv = gp.Env(empty=True)
-
-    wlsaccessID = os.getenv("GRB_WLSACCESSID", "undefined")
-    gurobiEnv.setParam("WLSACCESSID", wlsaccessID)
-
-    licenseID = os.getenv("GRB_LICENSEID", "0")
-    gurobiEnv.setParam("LICENSEID", int(licenseID))
-
-    wlsSecrets = os.getenv("GRB_WLSSECRET", "undefined")
-    gurobiEnv.setParam("WLSSECRET", wlsSecrets)
-
-    gurobiEnv.setParam("CSCLIENTLOG", int(3))
-
-    gurobiEnv.start()
-
-
-def giveMinLeaderIntersectConfig(self):
-    intersectingSitePairs = []
-    fixedSitePairs = []
-    horizontalSitePairs = []
-
-    for i in range(0, len(self.sites)):
-        for j in range(i + 1, len(self.sites)):
-            if (
-                self.lType == "po"
-                and abs(self.sites[i].pos[1] - self.sites[j].pos[1]) < self.poGap
-            ):
-                isSite1Left = self.sites[i].pos[0] < self.sites[j].pos[0]
-                horizontalSitePairs.append([self.sites[i], self.sites[j], isSite1Left])
-            else:
-                (
-                    thisIntersectIndex,
-                    isSite1Lower,
-                ) = self.giveTwoSitesTopLineIntersectIndex(
-                    self.sites[i].pos, self.sites[j].pos
-                )
-
-                if (
-                    thisIntersectIndex > 0
-                    and thisIntersectIndex < self.innerVertices[0].subTreeWidth - 1
-                ):
-                    intersectingSitePairs.append(
-                        [
-                            self.sites[i],
-                            self.sites[j],
-                            thisIntersectIndex,
-                            isSite1Lower,
-                        ]
-                    )
-                else:
-                    fixedSitePairs.append(
-                        [
-                            self.sites[i],
-                            self.sites[j],
-                            thisIntersectIndex,
-                            isSite1Lower,
-                        ]
-                    )
-
-    if usingLicense:
-        ilpModel = gp.Model(env=gurobiEnv, name="ilpModel")
-    else:
-        ilpModel = gp.Model("ilpModel")
-
-    innerVerticesVars = ilpModel.addMVar(
-        len(self.innerVertices), vtype=GRB.BINARY, name="innerVertices"
-    )
-    intersectingSitePairsVars = ilpModel.addMVar(
-        len(intersectingSitePairs), vtype=GRB.BINARY, name="intersectingSitePairs"
+import time
+from sitePairClassifier import (
+    giveClassifiedSitePairs,
+    giveFixedPairOrders,
+    giveFixedPairCrossingCounts,
+)
+from heuristics import giveMeanXTurns, giveHeuristicConfig, giveTurnConfig
+from solveStats import SolveStats
+from solverBackends import (
+    IlpModel,
+    giveSolverBackend,
+    giveSolverBudget,
+    giveSolverName,
+)
+
+
+def giveSingleEntryRows(pCols, pVals, pNumCols):
+    # one row per entry, explicit zeros are dropped
+    matrix = sp.csr_matrix(
+        (pVals, (np.arange(len(pCols)), pCols)), shape=(len(pCols), pNumCols)
     )
-    allowIntersectForFixedVars = ilpModel.addMVar(
-        len(fixedSitePairs), vtype=GRB.BINARY, name="allowIntersectForFixed"
-    )
-    allowIntersectForIntersectingVars = ilpModel.addMVar(
-        len(intersectingSitePairs),
-        vtype=GRB.BINARY,
-        name="allowIntersectForIntersecting",
-    )
-    allowIntersectForHorizontalVars = ilpModel.addMVar(
-        len(horizontalSitePairs),
-        vtype=GRB.BINARY,
-        name="allowIntersectForHorizontal",
-    )
-
-    objective = gp.LinExpr()
-    if len(fixedSitePairs) > 0:
-        objective += allowIntersectForFixedVars.sum()
-    if len(intersectingSitePairs) > 0:
-        objective += allowIntersectForIntersectingVars.sum()
-    if len(horizontalSitePairs) > 0:
-        objective += allowIntersectForHorizontalVars.sum(), GRB.MINIMIZE
-    ilpModel.setObjective(objective)
-
-    fixedConstraintsVal = []
-    fixedConstraintsCol = []
-    fixedConstraintsRhs = []
-
-    for thisSitePair in fixedSitePairs:
-        if thisSitePair[0].pos != thisSitePair[1].pos:
-            thisLowestCommonParent = self.giveLowestCommonParentVertex(
-                thisSitePair[0].leaf, thisSitePair[1].leaf
-            )
-            thisIntersectIndex = thisSitePair[2]
-            isSite1Lower = thisSitePair[3]
-            # is leaf 1 in the left subtree?
-            isThisLeaf1LeftOf2 = thisLowestCommonParent[1]
+    matrix.eliminate_zeros()
+    return matrix
 
-            # because the intersect index for fixed Pairs can either be negative
-            # (meaning the line drawn from 1 to 2 passes the top line lefthand) or positive (passes righthand)
-            # if the intersecting line is reversed (from 2 to 1) the result is reversed to
-            isThisSite1LeftOf2 = (thisIntersectIndex > 0) == isSite1Lower
 
-            leafsInOrder = isThisLeaf1LeftOf2 == isThisSite1LeftOf2
+def giveInterleavedRows(pMatrices):
+    # row i of the k-th matrix becomes row i * len(pMatrices) + k of the result
+    numRows = pMatrices[0].shape[0]
+    stackedMatrix = sp.vstack(pMatrices, format="csr")
+    rowOrder = (
+        np.arange(len(pMatrices))[np.newaxis, :] * numRows
+        + np.arange(numRows)[:, np.newaxis]
+    ).ravel()
+    return stackedMatrix[rowOrder]
 
-            if leafsInOrder:
-                fixedConstraintsVal.append(1)
-                fixedConstraintsRhs.append(0)
-            else:
-                fixedConstraintsVal.append(-1)
-                fixedConstraintsRhs.append(-1)
 
-            fixedConstraintsCol.append(thisLowestCommonParent[0].totalIndex)
-
-    fixedConstraintsMatrix = sp.csc_matrix(
+def givePairBlockMatrix(pVals, pNumPairs):
+    # the constraints of pair i are the rows i * len(pVals) to (i + 1) * len(pVals) - 1,
+    # they get the entries pVals in column i
+    return sp.csr_matrix(
         (
-            np.array(fixedConstraintsVal),
-            (np.arange(0, len(fixedSitePairs), 1), np.array(fixedConstraintsCol)),
+            np.tile(pVals, pNumPairs),
+            (
+                np.arange(len(pVals) * pNumPairs),
+                np.repeat(np.arange(pNumPairs), len(pVals)),
+            ),
         ),
-        shape=(len(fixedSitePairs), len(self.innerVertices)),
+        shape=(len(pVals) * pNumPairs, pNumPairs),
     )
-    fixedConstrainsRhsVector = np.array(fixedConstraintsRhs)
-
-    if len(fixedSitePairs) > 0:
-        ilpModel.addConstr(
-            fixedConstraintsMatrix @ innerVerticesVars - allowIntersectForFixedVars
-            <= fixedConstrainsRhsVector,
-            name="fixedConstraints",
-        )
 
-    intersectingInnerVerticesVal = []
-    intersectingInnerVerticesRow = []
-    intersectingInnerVerticesCol = []
-    intersectingRhs = []
 
-    intersectingSitePairsVal = []
-    intersectingSitePairsCol = []
+def giveMinLeaderIntersectModel(self, pPresolve=True, pSitePairs=None):
+    # pSitePairs are the ClassifiedSitePairs of the tree, if they are already known
+    sitePairs = pSitePairs
+    if sitePairs is None:
+        sitePairs = giveClassifiedSitePairs(self)
 
-    bigMVal = self.innerVertices[0].subTreeWidth
-    bigNVal = bigMVal * 2
+    ilpModel = IlpModel("ilpModel")
+    numInnerVertices = len(self.innerVertices)
 
-    for i in range(0, len(intersectingSitePairs)):
-        thisSitePair = intersectingSitePairs[i]
+    if pPresolve:
+        # every fixed pair only depends on the turn of its lowest common parent, so
+        # instead of a variable and a constraint per pair, it is folded into the
+        # objective coefficient of that parent
+        fixedCrossingsIfKept, fixedCrossingsIfTurned = giveFixedPairCrossingCounts(
+            self, sitePairs
+        )
+        ilpModel.addVariables(
+            "innerVertices",
+            numInnerVertices,
+            fixedCrossingsIfTurned - fixedCrossingsIfKept,
+        )
+        ilpModel.objectiveConstant += int(np.sum(fixedCrossingsIfKept))
+    else:
+        ilpModel.addVariables("innerVertices", numInnerVertices)
+    ilpModel.addVariables("intersectingSitePairs", sitePairs.numIntersecting)
+    if not pPresolve:
+        ilpModel.addVariables("allowIntersectForFixed", sitePairs.numFixed, 1)
+    ilpModel.addVariables("allowIntersectForIntersecting", sitePairs.numIntersecting, 1)
+    ilpModel.addVariables("allowIntersectForHorizontal", sitePairs.numHorizontal, 1)
 
-        if thisSitePair[0].pos != thisSitePair[1].pos:
-            thisIntersectIndex = thisSitePair[2]
-            isSite1Lower = thisSitePair[3]
+    sitePos = self.sitePositions
 
-            if isSite1Lower:
-                lowerSite = thisSitePair[0]
-                upperSite = thisSitePair[1]
-            else:
-                lowerSite = thisSitePair[1]
-                upperSite = thisSitePair[0]
+    if not pPresolve:
+        (
+            fixedLowestCommonParents,
+            fixedLeafsInOrder,
+            fixedHasConstraint,
+        ) = giveFixedPairOrders(self, sitePairs)
+
+        fixedConstraintsMatrix = giveSingleEntryRows(
+            fixedLowestCommonParents,
+            np.where(fixedLeafsInOrder, 1, -1) * fixedHasConstraint,
+            numInnerVertices,
+        )
+        fixedConstrainsRhsVector = np.where(
+            fixedHasConstraint & ~fixedLeafsInOrder, -1, 0
+        )
 
-            thisLowestCommonParent = self.giveLowestCommonParentVertex(
-                lowerSite.leaf, upperSite.leaf
-            )
+        ilpModel.addConstraints(
+            "fixedConstraints",
+            [
+                ["innerVertices", fixedConstraintsMatrix],
+                [
+                    "allowIntersectForFixed",
+                    -sp.identity(sitePairs.numFixed, format="csr"),
+                ],
+            ],
+            fixedConstrainsRhsVector,
+        )
 
-            # Big M and N Values for case 1 and 2
-            for j in range(0, 2):
-                intersectingSitePairsCol.append(i)
-                intersectingSitePairsVal.append(-bigMVal)
-            for j in range(0, 2):
-                intersectingSitePairsCol.append(i)
-                intersectingSitePairsVal.append(bigMVal)
-
-            # case 1: lowerSite passing upperSite left hand
-            # case 1 constraint 1: lowerSite left of intersect
-            for j in range(0, len(lowerSite.leaf.parentCoef)):
-                intersectingInnerVerticesVal.append(lowerSite.leaf.parentCoef[j])
-                intersectingInnerVerticesRow.append(4 * i)
-                intersectingInnerVerticesCol.append(
-                    lowerSite.leaf.allParents[j][0].totalIndex
-                )
-
-            intersectingRhs.append(thisIntersectIndex - lowerSite.leaf.initialOffset)
-
-            # case 1 constraint 2: lowerSite left of upperSite
-            intersectingInnerVerticesRow.append(4 * i + 1)
-            intersectingInnerVerticesCol.append(thisLowestCommonParent[0].totalIndex)
-
-            if thisLowestCommonParent[1]:
-                # lowerSite is initially left of upperSite so parent should NOT turn
-                intersectingInnerVerticesVal.append(1)
-                intersectingRhs.append(0)
-            else:
-                # lowerSite is initially right of upperSite so parent should turn
-                intersectingInnerVerticesVal.append(-1)
-                intersectingRhs.append(-1)
-
-            # case 2: lowerSite passing upperSite right hand
-            # case 2 constraint 1: lowerSite right of intersect
-            for j in range(0, len(lowerSite.leaf.parentCoef)):
-                intersectingInnerVerticesVal.append(-lowerSite.leaf.parentCoef[j])
-                intersectingInnerVerticesRow.append(4 * i + 2)
-                intersectingInnerVerticesCol.append(
-                    lowerSite.leaf.allParents[j][0].totalIndex
-                )
-
-            intersectingRhs.append(
-                -thisIntersectIndex + lowerSite.leaf.initialOffset + bigMVal
-            )
+    bigMVal = self.innerVertices[0].subTreeWidth
+    bigNVal = bigMVal * 2
 
-            # case 2 constraint 2: lowerSite right of upperSite
-            intersectingInnerVerticesRow.append(4 * i + 3)
-            intersectingInnerVerticesCol.append(thisLowestCommonParent[0].totalIndex)
+    intersectingLowerSite = np.where(
+        sitePairs.intersectingIsSite1Lower,
+        sitePairs.intersectingSite1,
+        sitePairs.intersectingSite2,
+    )
+    intersectingUpperSite = np.where(
+        sitePairs.intersectingIsSite1Lower,
+        sitePairs.intersectingSite2,
+        sitePairs.intersectingSite1,
+    )
+    (
+        intersectingLowestCommonParents,
+        intersectingIsLowerLeafLeft,
+    ) = self.giveLowestCommonParentIndices(intersectingLowerSite, intersectingUpperSite)
+    intersectingLowerCoef = self.parentCoefMatrix[intersectingLowerSite]
+    intersectingLowerOffset = self.initialOffsets[intersectingLowerSite]
+    intersectingIntersectIndex = sitePairs.intersectingIntersectIndex
+
+    # four constraints per pair, the intersectingSitePairs variable picks the case
+    # case 1: lowerSite passing upperSite left hand
+    # case 1 constraint 1: lowerSite left of intersect
+    # case 1 constraint 2: lowerSite left of upperSite
+    # case 2: lowerSite passing upperSite right hand
+    # case 2 constraint 1: lowerSite right of intersect
+    # case 2 constraint 2: lowerSite right of upperSite
+    # if lowerSite is initially left of upperSite the parent should NOT turn in case 1
+    # and turn in case 2, otherwise the other way round
+    intersectingInnerVerticesMatrix = giveInterleavedRows(
+        [
+            intersectingLowerCoef,
+            giveSingleEntryRows(
+                intersectingLowestCommonParents,
+                np.where(intersectingIsLowerLeafLeft, 1, -1),
+                numInnerVertices,
+            ),
+            -intersectingLowerCoef,
+            giveSingleEntryRows(
+                intersectingLowestCommonParents,
+                np.where(intersectingIsLowerLeafLeft, -1, 1),
+                numInnerVertices,
+            ),
+        ]
+    )
+    intersectingRhsVector = np.column_stack(
+        [
+            intersectingIntersectIndex - intersectingLowerOffset,
+            np.where(intersectingIsLowerLeafLeft, 0, -1),
+            -intersectingIntersectIndex + intersectingLowerOffset + bigMVal,
+            np.where(intersectingIsLowerLeafLeft, -1 + bigMVal, bigMVal),
+        ]
+    ).ravel()
+
+    # Big M and N Values for case 1 and 2
+    intersectingSitePairsMatrix = givePairBlockMatrix(
+        [-bigMVal, -bigMVal, bigMVal, bigMVal], sitePairs.numIntersecting
+    )
+    intersectingBigNMatrix = givePairBlockMatrix(
+        [bigNVal] * 4, sitePairs.numIntersecting
+    )
 
-            if thisLowestCommonParent[1]:
-                # lowerSite is initially left of upperSite so parent should turn
-                intersectingInnerVerticesVal.append(-1)
-                intersectingRhs.append(-1 + bigMVal)
-            else:
-                # lowerSite is initially right of upperSite so parent should NOT turn
-                intersectingInnerVerticesVal.append(1)
-                intersectingRhs.append(bigMVal)
+    ilpModel.addConstraints(
+        "intersectingConstraints",
+        [
+            ["innerVertices", intersectingInnerVerticesMatrix],
+            ["intersectingSitePairs", intersectingSitePairsMatrix],
+            ["allowIntersectForIntersecting", -intersectingBigNMatrix],
+        ],
+        intersectingRhsVector,
+    )
 
-    intersectingInnerVerticesMatrix = sp.csc_matrix(
-        (
-            np.array(intersectingInnerVerticesVal),
-            (
-                np.array(intersectingInnerVerticesRow),
-                np.array(intersectingInnerVerticesCol),
-            ),
-        ),
-        shape=(len(intersectingSitePairs) * 4, len(self.innerVertices)),
+    horizontalLeftSite = np.where(
+        sitePairs.horizontalIsSite1Left,
+        sitePairs.horizontalSite1,
+        sitePairs.horizontalSite2,
     )
-    intersectingSitePairsMatrix = sp.csc_matrix(
-        (
-            np.array(intersectingSitePairsVal),
-            (
-                np.arange(0, len(intersectingSitePairsVal), 1),
-                np.array(intersectingSitePairsCol),
-            ),
-        ),
-        shape=(len(intersectingSitePairs) * 4, len(intersectingSitePairs)),
+    horizontalRightSite = np.where(
+        sitePairs.horizontalIsSite1Left,
+        sitePairs.horizontalSite2,
+        sitePairs.horizontalSite1,
     )
-    intersectingBigNMatrix = sp.csc_matrix(
-        (
-            np.full(len(intersectingSitePairs) * 4, bigNVal),
-            (
-                np.arange(0, len(intersectingSitePairsVal), 1),
-                np.array(intersectingSitePairsCol),
+    (
+        horizontalLowestCommonParents,
+        horizontalIsLeftLeafLeft,
+    ) = self.giveLowestCommonParentIndices(horizontalLeftSite, horizontalRightSite)
+    siteIndex = (
+        (sitePos[:, 0] - self.topLineStart[0])
+        / (self.topLineEnd[0] - self.topLineStart[0])
+        * (self.innerVertices[0].subTreeWidth - 1)
+    )
+
+    # constraint 1: left leaf left of right site
+    # constraint 2: right leaf right of left site
+    # constraint 3: left leaf left of right leaf
+    # if leftSite is initially left of rightSite the parent should NOT turn, otherwise it should
+    horizontalInnerVerticesMatrix = giveInterleavedRows(
+        [
+            self.parentCoefMatrix[horizontalLeftSite],
+            -self.parentCoefMatrix[horizontalRightSite],
+            giveSingleEntryRows(
+                horizontalLowestCommonParents,
+                np.where(horizontalIsLeftLeafLeft, 1, -1),
+                numInnerVertices,
             ),
-        ),
-        shape=(len(intersectingSitePairs) * 4, len(intersectingSitePairs)),
+        ]
     )
-    intersectingRhsVector = np.array(intersectingRhs)
-
-    if len(intersectingSitePairs) > 0:
-        ilpModel.addConstr(
-            intersectingInnerVerticesMatrix @ innerVerticesVars
-            + intersectingSitePairsMatrix @ intersectingSitePairsVars
-            - intersectingBigNMatrix @ allowIntersectForIntersectingVars
-            <= intersectingRhsVector,
-            name="intersectingConstraints",
-        )
+    horizontalRhsVector = np.column_stack(
+        [
+            siteIndex[horizontalRightSite] - self.initialOffsets[horizontalLeftSite],
+            -siteIndex[horizontalLeftSite] + self.initialOffsets[horizontalRightSite],
+            np.where(horizontalIsLeftLeafLeft, 0, -1),
+        ]
+    ).ravel()
+    horizontalBigNMatrix = givePairBlockMatrix([bigNVal] * 3, sitePairs.numHorizontal)
+
+    ilpModel.addConstraints(
+        "horizontalConstraints",
+        [
+            ["innerVertices", horizontalInnerVerticesMatrix],
+            ["allowIntersectForHorizontal", -horizontalBigNMatrix],
+        ],
+        horizontalRhsVector,
+    )
+
+    return ilpModel
 
-    horizontalInnerVerticesVal = []
-    horizontalInnerVerticesRow = []
-    horizontalInnerVerticesCol = []
-    horizontalSitePairsCol = []
-    horizontalRhs = []
 
-    for i in range(0, len(horizontalSitePairs)):
-        thisSitePair = horizontalSitePairs[i]
+def giveConstraintResiduals(pIlpModel, pName, pInnerVerticesX):
+    # lhs - rhs of the constraints pName with only the innerVertices variables set
+    constraintBlock = pIlpModel.giveConstraintBlock(pName)
+    if constraintBlock is None:
+        return np.zeros(0)
 
-        isSite1Left = thisSitePair[2]
+    terms, rhs = constraintBlock
+    return terms["innerVertices"] @ pInnerVerticesX - rhs
 
-        for j in range(0, 3):
-            horizontalSitePairsCol.append(i)
 
-        if isSite1Left:
-            leftSite = thisSitePair[0]
-            rightSite = thisSitePair[1]
-        else:
-            leftSite = thisSitePair[1]
-            rightSite = thisSitePair[0]
+def giveMinLeaderIntersectStart(pIlpModel, pTurns):
+    # completes the turns of the inner vertices to a feasible assignment of all
+    # variables, allowing exactly the intersections this leaf order has
+    start = np.zeros(pIlpModel.numVars)
+    innerVerticesX = np.asarray(pTurns, dtype=np.float64)
+    start[pIlpModel.giveVariableSlice("innerVertices")] = innerVerticesX
 
-        thisLowestCommonParent = self.giveLowestCommonParentVertex(
-            leftSite.leaf, rightSite.leaf
+    # without presolve the fixed pairs have their own variables
+    if pIlpModel.giveConstraintBlock("fixedConstraints") is not None:
+        fixedResiduals = giveConstraintResiduals(
+            pIlpModel, "fixedConstraints", innerVerticesX
+        )
+        start[pIlpModel.giveVariableSlice("allowIntersectForFixed")] = (
+            fixedResiduals > 0
         )
 
-        # constraint 1: left leaf left of right site
-        rightSiteIndex = (
-            (rightSite.pos[0] - self.topLineStart[0])
-            / (self.topLineEnd[0] - self.topLineStart[0])
-            * (self.innerVertices[0].subTreeWidth - 1)
+    intersectingBlock = pIlpModel.giveConstraintBlock("intersectingConstraints")
+    if intersectingBlock is not None:
+        # a pair does not intersect if all four constraints hold for one of the cases
+        intersectingResiduals = giveConstraintResiduals(
+            pIlpModel, "intersectingConstraints", innerVerticesX
+        )
+        intersectingSitePairsMatrix = intersectingBlock[0]["intersectingSitePairs"]
+        isCase1Feasible = np.all(intersectingResiduals.reshape(-1, 4) <= 0, axis=1)
+        isCase2Feasible = np.all(
+            (
+                intersectingResiduals
+                + intersectingSitePairsMatrix
+                @ np.ones(intersectingSitePairsMatrix.shape[1])
+            ).reshape(-1, 4)
+            <= 0,
+            axis=1,
         )
-        for j in range(0, len(leftSite.leaf.parentCoef)):
-            horizontalInnerVerticesVal.append(leftSite.leaf.parentCoef[j])
-            horizontalInnerVerticesRow.append(3 * i)
-            horizontalInnerVerticesCol.append(leftSite.leaf.allParents[j][0].totalIndex)
-
-        horizontalRhs.append(rightSiteIndex - leftSite.leaf.initialOffset)
-
-        # constraint 2: right leaf right of left site
-        leftSiteIndex = (
-            (leftSite.pos[0] - self.topLineStart[0])
-            / (self.topLineEnd[0] - self.topLineStart[0])
-            * (self.innerVertices[0].subTreeWidth - 1)
+        start[pIlpModel.giveVariableSlice("intersectingSitePairs")] = (
+            ~isCase1Feasible & isCase2Feasible
         )
-        for j in range(0, len(rightSite.leaf.parentCoef)):
-            horizontalInnerVerticesVal.append(-rightSite.leaf.parentCoef[j])
-            horizontalInnerVerticesRow.append(3 * i + 1)
-            horizontalInnerVerticesCol.append(
-                rightSite.leaf.allParents[j][0].totalIndex
-            )
+        start[pIlpModel.giveVariableSlice("allowIntersectForIntersecting")] = (
+            ~isCase1Feasible & ~isCase2Feasible
+        )
+
+    horizontalResiduals = giveConstraintResiduals(
+        pIlpModel, "horizontalConstraints", innerVerticesX
+    )
+    start[pIlpModel.giveVariableSlice("allowIntersectForHorizontal")] = np.any(
+        horizontalResiduals.reshape(-1, 3) > 0, axis=1
+    )
 
-        horizontalRhs.append(-leftSiteIndex + rightSite.leaf.initialOffset)
+    return start
 
-        # constraint 3: left leaf left of right leaf
-        horizontalInnerVerticesRow.append(3 * i + 2)
-        horizontalInnerVerticesCol.append(thisLowestCommonParent[0].totalIndex)
 
-        if thisLowestCommonParent[1]:
-            # leftSite is initially left of rightSite so parent should NOT turn
-            horizontalInnerVerticesVal.append(1)
-            horizontalRhs.append(0)
-        else:
-            # leftSite is initially right of upperSite so parent should turn
-            horizontalInnerVerticesVal.append(-1)
-            horizontalRhs.append(-1)
+def giveMinLeaderIntersectResult(
+    self,
+    pSolver=None,
+    pWarmStart=False,
+    pPresolve=True,
+    pTimeLimit=None,
+    pMipGap=None,
+    pOnIncumbent=None,
+    pSolveStats=None,
+    pOnProgress=None,
+):
+    # like giveMinLeaderIntersectConfig, but the solve is limited by the time and gap
+    # budget (see giveSolverBudget) and pOnIncumbent(config, intersections, bound) is
+    # called for every improving leaf order found on the way, and pOnProgress()
+    # regularly in between if the solver supports it. Also returns the solver stats,
+    # with the bound and gap of the returned leaf order. The phases, the model size
+    # and the solver stats are recorded in pSolveStats, if given.
+    timeLimit, mipGap = giveSolverBudget(pTimeLimit, pMipGap)
+    solveStats = pSolveStats
+    if solveStats is None:
+        solveStats = SolveStats()
+
+    # "heuristic" skips the ILP and only improves the leaf order heuristically
+    if giveSolverName(pSolver) == "heuristic":
+        onHeuristicIncumbent = None
+        if pOnIncumbent is not None:
+
+            def onHeuristicIncumbent(pConfig, pIntersections):
+                pOnIncumbent(pConfig, pIntersections, None)
+
+        startTime = time.perf_counter()
+        with solveStats.measure("optimize"):
+            config, intersections = giveHeuristicConfig(
+                self, pTimeLimit=timeLimit, pOnIncumbent=onHeuristicIncumbent
+            )
+        stats = {
+            "runtime": time.perf_counter() - startTime,
+            "timeToFirstIncumbent": None,
+            "nodes": None,
+            "bound": None,
+            "gap": None,
+        }
+        solveStats.setSolver("heuristic", stats)
+        return [config, intersections, stats]
+
+    with solveStats.measure("classification"):
+        sitePairs = giveClassifiedSitePairs(self)
+
+    with solveStats.measure("build"):
+        ilpModel = giveMinLeaderIntersectModel(self, pPresolve, sitePairs)
+
+        # the warm start orders the leafs by the mean x of the sites of each subtree
+        start = None
+        if pWarmStart:
+            start = giveMinLeaderIntersectStart(ilpModel, giveMeanXTurns(self))
+    solveStats.setModel(ilpModel)
+
+    onSolverIncumbent = None
+    if pOnIncumbent is not None:
+
+        def onSolverIncumbent(pX, pObjVal, pBound):
+            pOnIncumbent(
+                giveTurnConfig(
+                    self, pX[ilpModel.giveVariableSlice("innerVertices")] > 0.5
+                ),
+                pObjVal,
+                pBound,
+            )
 
-    horizontalInnerVerticesMatrix = sp.csc_matrix(
-        (
-            np.array(horizontalInnerVerticesVal),
-            (
-                np.array(horizontalInnerVerticesRow),
-                np.array(horizontalInnerVerticesCol),
-            ),
-        ),
-        shape=(len(horizontalSitePairs) * 3, len(self.innerVertices)),
-    )
-    horizontalBigNMatrix = sp.csc_matrix(
-        (
-            np.full(len(horizontalSitePairs) * 3, bigNVal),
-            (
-                np.arange(0, len(horizontalSitePairs) * 3, 1),
-                np.array(horizontalSitePairsCol),
-            ),
-        ),
-        shape=(len(horizontalSitePairs) * 3, len(horizontalSitePairs)),
-    )
-    horizontalRhsVector = np.array(horizontalRhs)
-
-    if len(horizontalSitePairs) > 0:
-        ilpModel.addConstr(
-            horizontalInnerVerticesMatrix @ innerVerticesVars
-            - horizontalBigNMatrix @ allowIntersectForHorizontalVars
-            <= horizontalRhsVector,
-            name="horizontalConstraints",
+    backend = giveSolverBackend(pSolver, ilpModel)
+    with solveStats.measure("optimize"):
+        solverResult = backend.solve(
+            ilpModel, start, timeLimit, mipGap, onSolverIncumbent, pOnProgress
+        )
+
+    if solverResult.x is None:
+        # the budget ran out before a first solution, so the mean x leaf order is
+        # returned without a bound
+        if start is None:
+            start = giveMinLeaderIntersectStart(ilpModel, giveMeanXTurns(self))
+        solverResult.x = start
+        solverResult.objVal = float(
+            ilpModel.giveObjectiveVector() @ start + ilpModel.objectiveConstant
         )
+    solveStats.setSolver(backend.name, solverResult.stats)
 
-    ilpModel.optimize()
+    innerVerticesX = solverResult.x[ilpModel.giveVariableSlice("innerVertices")]
 
-    res = [[], ilpModel.ObjVal]
+    return [
+        giveTurnConfig(self, innerVerticesX > 0.5),
+        solverResult.objVal,
+        solverResult.stats,
+    ]
 
-    for thisInnerVertexIndex in range(len(self.innerVertices)):
-        res[0].append(
-            [
-                self.innerVertices[thisInnerVertexIndex].id,
-                bool(innerVerticesVars.X[thisInnerVertexIndex]),
-            ]
-        )
 
-    return res
+def giveMinLeaderIntersectConfig(self, pSolver=None, pWarmStart=False, pPresolve=True):
+    # returns [[id of the inner vertex, whether it turns], ...] and the number of
+    # intersections of the leaf order
+    config, intersections, stats = giveMinLeaderIntersectResult(
+        self, pSolver, pWarmStart, pPresolve
+    )
+
+    return [config, intersections]
@@ -0,0 +1,501 @@
+import numpy as np
+import random
+import time
+from sitePairClassifier import (
+    DEFAULT_CHUNK_SIZE,
+    giveClassifiedSitePairChunks,
+    giveFixedPairCrossingCounts,
+)
+
+
+def giveMeanXTurns(pGeoTree):
+    # turn every inner vertex whose left subtree has its sites further right on average
+    # than its right subtree, returns one bool per inner vertex in totalIndex order
+    sitesX = pGeoTree.sitePositions[:, 0]
+
+    # a leaf has a positive coefficient for the parents it is in the left subtree of
+    # and a negative one for those it is in the right subtree of
+    isInLeftSubtree = (pGeoTree.parentCoefMatrix > 0).astype(np.float64).T.tocsr()
+    isInRightSubtree = (pGeoTree.parentCoefMatrix < 0).astype(np.float64).T.tocsr()
+
+    leftMeanX = (isInLeftSubtree @ sitesX) / (isInLeftSubtree @ np.ones(len(sitesX)))
+    rightMeanX = (isInRightSubtree @ sitesX) / (isInRightSubtree @ np.ones(len(sitesX)))
+
+    return leftMeanX > rightMeanX
+
+
+def giveLeafPositions(pGeoTree, pTurns):
+    # position of every leaf on the top line after the turns, in the order of leafs
+    return pGeoTree.giveLeafPositionsAfterTurns(pTurns)
+
+
+def giveRanges(pStarts, pEnds):
+    # the concatenation of range(pStarts[i], pEnds[i]) for all i
+    lengths = pEnds - pStarts
+    offsets = np.cumsum(lengths) - lengths
+    return (
+        np.arange(np.sum(lengths), dtype=np.int64)
+        - np.repeat(offsets, lengths)
+        + np.repeat(pStarts, lengths)
+    )
+
+
+class HeuristicOrderer(object):
+    # Heuristics for the leaf order that need no ILP solver. The crossings are counted
+    # like the objective of giveMinLeaderIntersectModel, so the result is comparable to
+    # the ILP optimum. The site pairs are classified once, chunk by chunk, and only the
+    # intersecting and horizontal pairs are kept. Afterwards turning an inner vertex
+    # only touches the pairs that can change by it.
+    def __init__(self, pGeoTree, pChunkSize=DEFAULT_CHUNK_SIZE):
+        self.geoTree = pGeoTree
+        self.treeWidth = int(pGeoTree.innerWidth[0])
+        self.sitesX = pGeoTree.sitePositions[:, 0]
+
+        # the leafs of a subtree are a contiguous range of leafs, starting at firstLeaf
+        self.firstLeaf = pGeoTree.innerFirstLeaf.astype(np.int64)
+        self.leftChildWidth = pGeoTree.giveLeftChildWidths()
+        self.rightChildWidth = pGeoTree.innerWidth - self.leftChildWidth
+
+        numLeafs = len(pGeoTree.leafs)
+        numInnerVertices = len(pGeoTree.innerIds)
+        # an intersect index t is kept as the code 2t if t is whole and 2floor(t)+1
+        # otherwise, then position <= t iff 2position <= code, and the same for >=
+        self.codeFactor = 2 * self.treeWidth
+
+        self.fixedCrossingsIfKept = np.zeros(numInnerVertices, dtype=np.int64)
+        self.fixedCrossingsIfTurned = np.zeros(numInnerVertices, dtype=np.int64)
+        keyChunks = []
+        upperLeafChunks = []
+        parentChunks = []
+        horizontalChunks = []
+
+        for thisChunk in giveClassifiedSitePairChunks(pGeoTree, pChunkSize):
+            # a fixed pair only depends on the turn of its lowest common parent, so it
+            # is enough to count them by the turn of that vertex they cross with
+            crossingsIfKept, crossingsIfTurned = giveFixedPairCrossingCounts(
+                pGeoTree, thisChunk
+            )
+            self.fixedCrossingsIfKept += crossingsIfKept
+            self.fixedCrossingsIfTurned += crossingsIfTurned
+
+            lowerLeaf = np.where(
+                thisChunk.intersectingIsSite1Lower,
+                thisChunk.intersectingSite1,
+                thisChunk.intersectingSite2,
+            )
+            upperLeaf = np.where(
+                thisChunk.intersectingIsSite1Lower,
+                thisChunk.intersectingSite2,
+                thisChunk.intersectingSite1,
+            )
+            intersectIndex = thisChunk.intersectingIntersectIndex
+            floorIndex = np.floor(intersectIndex)
+            code = (2 * floorIndex + (intersectIndex != floorIndex)).astype(np.int64)
+            lowestCommonParents = pGeoTree.giveLowestCommonParentIndices(
+                lowerLeaf, upperLeaf
+            )[0]
+            keyChunks.append(lowerLeaf.astype(np.int64) * self.codeFactor + code)
+            upperLeafChunks.append(upperLeaf.astype(np.int32))
+            parentChunks.append(lowestCommonParents.astype(np.int32))
+
+            horizontalChunks.append(
+                (
+                    np.where(
+                        thisChunk.horizontalIsSite1Left,
+                        thisChunk.horizontalSite1,
+                        thisChunk.horizontalSite2,
+                    ),
+                    np.where(
+                        thisChunk.horizontalIsSite1Left,
+                        thisChunk.horizontalSite2,
+                        thisChunk.horizontalSite1,
+                    ),
+                )
+            )
+
+        # An intersecting pair only changes if its lower leaf moves. Turning a vertex
+        # keeps the order of two leafs unless it is their lowest common parent, so
+        # the other pairs only change if the lower leaf passes the intersect index.
+        # The pairs are sorted by lower leaf and code, intersectingKey is
+        # lower leaf * codeFactor + code. The chunks are freed as soon as they are
+        # joined, so only the pairs themselves stay in memory
+        intersectingKey = np.concatenate([np.empty(0, dtype=np.int64)] + keyChunks)
+        del keyChunks
+        intersectingOrder = np.argsort(intersectingKey, kind="stable")
+        self.intersectingKey = intersectingKey[intersectingOrder]
+        del intersectingKey
+        self.intersectingUpperLeaf = np.concatenate(
+            [np.empty(0, dtype=np.int32)] + upperLeafChunks
+        )[intersectingOrder]
+        del upperLeafChunks
+        lowestCommonParents = np.concatenate(
+            [np.empty(0, dtype=np.int32)] + parentChunks
+        )[intersectingOrder]
+        del parentChunks, intersectingOrder
+
+        # the pairs whose lowest common parent is the inner vertex i are
+        # parentPairs[parentPairStart[i]:parentPairStart[i + 1]]
+        self.parentPairs = np.argsort(lowestCommonParents, kind="stable").astype(
+            np.int32
+        )
+        self.parentPairStart = np.concatenate(
+            [
+                [0],
+                np.cumsum(np.bincount(lowestCommonParents, minlength=numInnerVertices)),
+            ]
+        )
+        del lowestCommonParents
+
+        # horizontal pairs change if any of its leafs moves, so every pair is listed
+        # once for each of its leafs, sorted by that leaf. There are only few of them
+        # unless the gap is big
+        siteIndex = (
+            (self.sitesX - pGeoTree.topLineStart[0])
+            / (pGeoTree.topLineEnd[0] - pGeoTree.topLineStart[0])
+            * (self.treeWidth - 1)
+        )
+        self.horizontalLeftLeaf = np.concatenate(
+            [np.empty(0, dtype=np.int32)]
+            + [thisChunk[0] for thisChunk in horizontalChunks]
+        )
+        self.horizontalRightLeaf = np.concatenate(
+            [np.empty(0, dtype=np.int32)]
+            + [thisChunk[1] for thisChunk in horizontalChunks]
+        )
+        self.horizontalLeftSiteIndex = siteIndex[self.horizontalLeftLeaf]
+        self.horizontalRightSiteIndex = siteIndex[self.horizontalRightLeaf]
+
+        horizontalPairs = np.arange(len(self.horizontalLeftLeaf))
+        horizontalLeaf = np.concatenate(
+            [self.horizontalLeftLeaf, self.horizontalRightLeaf]
+        )
+        horizontalOrder = np.argsort(horizontalLeaf, kind="stable")
+        self.horizontalByLeafLeaf = horizontalLeaf[horizontalOrder]
+        self.horizontalByLeafOtherLeaf = np.concatenate(
+            [self.horizontalRightLeaf, self.horizontalLeftLeaf]
+        )[horizontalOrder]
+        self.horizontalByLeafPair = np.concatenate([horizontalPairs, horizontalPairs])[
+            horizontalOrder
+        ]
+        self.horizontalStart = np.concatenate(
+            [[0], np.cumsum(np.bincount(horizontalLeaf, minlength=numLeafs))]
+        )
+
+    def giveIntersectingCrossings(self, pCode, pLowerPos, pIsUpperRight):
+        # the pair does not cross if the lower leaf is on the same side of the intersect
+        # as of the upper leaf
+        isCrossing = np.where(
+            pIsUpperRight, pCode < 2 * pLowerPos, pCode > 2 * pLowerPos
+        )
+
+        return int(np.count_nonzero(isCrossing))
+
+    def giveHorizontalCrossings(self, pPairs, pLeftPos, pRightPos):
+        isCrossing = ~(
+            (pLeftPos <= self.horizontalRightSiteIndex[pPairs])
+            & (pRightPos >= self.horizontalLeftSiteIndex[pPairs])
+            & (pLeftPos < pRightPos)
+        )
+
+        return int(np.count_nonzero(isCrossing))
+
+    def giveNumCrossings(self, pTurns, pPositions, pChunkSize=DEFAULT_CHUNK_SIZE):
+        numCrossings = int(
+            np.sum(
+                np.where(pTurns, self.fixedCrossingsIfTurned, self.fixedCrossingsIfKept)
+            )
+        )
+
+        for thisStart in range(0, len(self.intersectingKey), pChunkSize):
+            key = self.intersectingKey[thisStart : thisStart + pChunkSize]
+            lowerLeaf = key // self.codeFactor
+            lowerPositions = pPositions[lowerLeaf]
+            numCrossings += self.giveIntersectingCrossings(
+                key - lowerLeaf * self.codeFactor,
+                lowerPositions,
+                lowerPositions
+                < pPositions[
+                    self.intersectingUpperLeaf[thisStart : thisStart + pChunkSize]
+                ],
+            )
+
+        numCrossings += self.giveHorizontalCrossings(
+            np.arange(len(self.horizontalLeftLeaf)),
+            pPositions[self.horizontalLeftLeaf],
+            pPositions[self.horizontalRightLeaf],
+        )
+
+        return numCrossings
+
+    def giveRotatedPositions(self, pInnerVertexIndex, pTurns, pPositions):
+        # leaf range and new positions of the subtree of the inner vertex after turning it
+        firstLeaf = self.firstLeaf[pInnerVertexIndex]
+        leftChildWidth = self.leftChildWidth[pInnerVertexIndex]
+        rightChildWidth = self.rightChildWidth[pInnerVertexIndex]
+
+        leftChildShift = rightChildWidth
+        rightChildShift = -leftChildWidth
+        if pTurns[pInnerVertexIndex]:
+            leftChildShift = -leftChildShift
+            rightChildShift = -rightChildShift
+
+        leafRange = slice(firstLeaf, firstLeaf + leftChildWidth + rightChildWidth)
+        rotatedPositions = pPositions[leafRange].copy()
+        rotatedPositions[:leftChildWidth] += leftChildShift
+        rotatedPositions[leftChildWidth:] += rightChildShift
+
+        return leafRange, rotatedPositions
+
+    def giveRotationDelta(self, pInnerVertexIndex, pTurns, pPositions):
+        # change of the number of crossings when turning the inner vertex, without
+        # recounting the pairs that stay the same. Only the positions of the leafs of
+        # the subtree change, they are read from rotatedPositions instead of a copy
+        # of pPositions
+        leafRange, rotatedPositions = self.giveRotatedPositions(
+            pInnerVertexIndex, pTurns, pPositions
+        )
+        firstLeaf = leafRange.start
+        rightChildFirstLeaf = firstLeaf + self.leftChildWidth[pInnerVertexIndex]
+        oldPositions = pPositions[leafRange]
+
+        delta = (
+            self.fixedCrossingsIfKept[pInnerVertexIndex]
+            - self.fixedCrossingsIfTurned[pInnerVertexIndex]
+        )
+        if not pTurns[pInnerVertexIndex]:
+            delta = -delta
+
+        # pairs of a leaf of the subtree and another leaf that stays on the same side
+        # of it, they only change if the leaf passes their intersect index
+        leafKeys = np.arange(firstLeaf, leafRange.stop) * self.codeFactor
+        passedPairs = giveRanges(
+            np.searchsorted(
+                self.intersectingKey,
+                leafKeys + 2 * np.minimum(oldPositions, rotatedPositions),
+                side="left",
+            ),
+            np.searchsorted(
+                self.intersectingKey,
+                leafKeys + 2 * np.maximum(oldPositions, rotatedPositions),
+                side="right",
+            ),
+        )
+        lowerLeaf = self.intersectingKey[passedPairs] // self.codeFactor
+        upperLeaf = self.intersectingUpperLeaf[passedPairs]
+        # the pairs of the inner vertex are counted below
+        isOtherChild = (lowerLeaf < rightChildFirstLeaf) != (
+            upperLeaf < rightChildFirstLeaf
+        )
+        isParentPair = (
+            (upperLeaf >= firstLeaf) & (upperLeaf < leafRange.stop) & isOtherChild
+        )
+        passedPairs = passedPairs[~isParentPair]
+        lowerLeaf = lowerLeaf[~isParentPair]
+        upperLeaf = upperLeaf[~isParentPair]
+        code = self.intersectingKey[passedPairs] - lowerLeaf * self.codeFactor
+        oldLowerPositions = oldPositions[lowerLeaf - firstLeaf]
+        # the order of these pairs stays the same, even if both leafs move
+        isUpperRight = oldLowerPositions < pPositions[upperLeaf]
+        delta += self.giveIntersectingCrossings(
+            code, rotatedPositions[lowerLeaf - firstLeaf], isUpperRight
+        ) - self.giveIntersectingCrossings(code, oldLowerPositions, isUpperRight)
+
+        # the pairs the inner vertex is the lowest common parent of, their order swaps
+        parentPairs = self.parentPairs[
+            self.parentPairStart[pInnerVertexIndex] : self.parentPairStart[
+                pInnerVertexIndex + 1
+            ]
+        ]
+        lowerLeaf = self.intersectingKey[parentPairs] // self.codeFactor
+        code = self.intersectingKey[parentPairs] - lowerLeaf * self.codeFactor
+        lowerLeaf -= firstLeaf
+        upperLeaf = self.intersectingUpperLeaf[parentPairs] - firstLeaf
+        delta += self.giveIntersectingCrossings(
+            code,
+            rotatedPositions[lowerLeaf],
+            rotatedPositions[lowerLeaf] < rotatedPositions[upperLeaf],
+        ) - self.giveIntersectingCrossings(
+            code,
+            oldPositions[lowerLeaf],
+            oldPositions[lowerLeaf] < oldPositions[upperLeaf],
+        )
+
+        # pairs with both leafs in the subtree are listed twice
+        horizontalEntries = slice(
+            self.horizontalStart[firstLeaf],
+            self.horizontalStart[leafRange.stop],
+        )
+        otherLeaf = self.horizontalByLeafOtherLeaf[horizontalEntries]
+        horizontalPairs = self.horizontalByLeafPair[horizontalEntries][
+            (otherLeaf < firstLeaf)
+            | (otherLeaf >= leafRange.stop)
+            | (otherLeaf > self.horizontalByLeafLeaf[horizontalEntries])
+        ]
+        if len(horizontalPairs) > 0:
+            leftLeaf = self.horizontalLeftLeaf[horizontalPairs]
+            rightLeaf = self.horizontalRightLeaf[horizontalPairs]
+            oldLeftPositions = pPositions[leftLeaf]
+            oldRightPositions = pPositions[rightLeaf]
+            delta += self.giveHorizontalCrossings(
+                horizontalPairs,
+                self.giveMovedPositions(
+                    leftLeaf, oldLeftPositions, leafRange, rotatedPositions
+                ),
+                self.giveMovedPositions(
+                    rightLeaf, oldRightPositions, leafRange, rotatedPositions
+                ),
+            ) - self.giveHorizontalCrossings(
+                horizontalPairs, oldLeftPositions, oldRightPositions
+            )
+
+        return int(delta), leafRange, rotatedPositions
+
+    def giveMovedPositions(self, pLeafs, pPositions, pLeafRange, pRotatedPositions):
+        # pPositions of pLeafs with those in pLeafRange replaced by pRotatedPositions
+        isMoved = (pLeafs >= pLeafRange.start) & (pLeafs < pLeafRange.stop)
+        return np.where(
+            isMoved,
+            pRotatedPositions[np.where(isMoved, pLeafs - pLeafRange.start, 0)],
+            pPositions,
+        )
+
+    def giveTopDownTurns(self):
+        # Going top down, every inner vertex gets the rotation with fewer sites on the
+        # wrong side of the line between its two subtrees
+        # (TopDownGeophylogenyOrderer in the java implementation)
+        topLineStart = self.geoTree.topLineStart[0]
+        slotWidth = (self.geoTree.topLineEnd[0] - topLineStart) / (self.treeWidth - 1)
+        sitesX = self.sitesX
+
+        numInnerVertices = len(self.geoTree.innerIds)
+        turns = np.zeros(numInnerVertices, dtype=bool)
+        blockStart = np.zeros(numInnerVertices, dtype=np.int64)
+
+        # parents come before their children in innerVertices
+        for thisIndex in range(numInnerVertices):
+            firstLeaf = self.firstLeaf[thisIndex]
+            leftChildWidth = self.leftChildWidth[thisIndex]
+            rightChildWidth = self.rightChildWidth[thisIndex]
+            rightChildFirstLeaf = firstLeaf + leftChildWidth
+            leftChildX = sitesX[firstLeaf:rightChildFirstLeaf]
+            rightChildX = sitesX[
+                rightChildFirstLeaf : rightChildFirstLeaf + rightChildWidth
+            ]
+
+            midKeep = (
+                topLineStart
+                + (blockStart[thisIndex] + leftChildWidth - 0.5) * slotWidth
+            )
+            crossingsKeep = np.count_nonzero(leftChildX > midKeep) + np.count_nonzero(
+                rightChildX < midKeep
+            )
+            midTurn = (
+                topLineStart
+                + (blockStart[thisIndex] + rightChildWidth - 0.5) * slotWidth
+            )
+            crossingsTurn = np.count_nonzero(rightChildX > midTurn) + np.count_nonzero(
+                leftChildX < midTurn
+            )
+            turns[thisIndex] = crossingsTurn < crossingsKeep
+
+            leftChild = self.geoTree.innerLeftChild[thisIndex]
+            rightChild = self.geoTree.innerRightChild[thisIndex]
+            if turns[thisIndex]:
+                rightChildStart = blockStart[thisIndex]
+                leftChildStart = rightChildStart + rightChildWidth
+            else:
+                leftChildStart = blockStart[thisIndex]
+                rightChildStart = leftChildStart + leftChildWidth
+            # leafs are stored as negative children
+            if leftChild >= 0:
+                blockStart[leftChild] = leftChildStart
+            if rightChild >= 0:
+                blockStart[rightChild] = rightChildStart
+
+        return turns
+
+    def giveGreedyTurns(
+        self, pTurns, pRandom, pMaxRounds=None, pTimeLimit=None, pOnIncumbent=None
+    ):
+        # Greedy hill climbing: turn every inner vertex once per round in a random order
+        # and keep the turn if it saves crossings, as long as a round improves
+        # (GreedyGeophylogenyOrderOptimizer in the java implementation). Stops early
+        # after pTimeLimit seconds and calls pOnIncumbent(turns, numCrossings) after
+        # every improving round.
+        # Returns the turns and their number of crossings.
+        startTime = time.perf_counter()
+        turns = np.array(pTurns, dtype=bool)
+        positions = giveLeafPositions(self.geoTree, turns)
+        numCrossings = self.giveNumCrossings(turns, positions)
+
+        vertexTestOrder = list(range(len(turns)))
+        pRandom.shuffle(vertexTestOrder)
+
+        numRounds = 0
+        improvement = 1
+        isTimeUp = False
+        while (
+            improvement > 0
+            and not isTimeUp
+            and (pMaxRounds is None or numRounds < pMaxRounds)
+        ):
+            improvement = 0
+            for thisIndex in vertexTestOrder:
+                if (
+                    pTimeLimit is not None
+                    and time.perf_counter() - startTime > pTimeLimit
+                ):
+                    isTimeUp = True
+                    break
+
+                delta, leafRange, rotatedPositions = self.giveRotationDelta(
+                    thisIndex, turns, positions
+                )
+                if delta < 0:
+                    turns[thisIndex] = not turns[thisIndex]
+                    positions[leafRange] = rotatedPositions
+                    improvement -= delta
+            numCrossings -= improvement
+            numRounds += 1
+
+            if improvement > 0 and pOnIncumbent is not None:
+                pOnIncumbent(turns.copy(), numCrossings)
+
+        return turns, numCrossings
+
+    pass
+
+
+def giveTurnConfig(pGeoTree, pTurns):
+    # [[id of the inner vertex, whether it turns], ...] in totalIndex order
+    res = []
+
+    for thisInnerVertexIndex, thisInnerVertexId in enumerate(
+        pGeoTree.innerIds.tolist()
+    ):
+        res.append([thisInnerVertexId, bool(pTurns[thisInnerVertexIndex])])
+
+    return res
+
+
+def giveHeuristicConfig(
+    pGeoTree, pRandom=None, pMaxRounds=None, pTimeLimit=None, pOnIncumbent=None
+):
+    # top down ordering followed by greedy hill climbing, in the shape of
+    # giveMinLeaderIntersectConfig. pOnIncumbent(config, numCrossings) is called
+    # whenever a round of the hill climbing improved the order
+    if pRandom is None:
+        pRandom = random.Random(0)
+
+    onRound = None
+    if pOnIncumbent is not None:
+
+        def onRound(pTurns, pNumCrossings):
+            pOnIncumbent(giveTurnConfig(pGeoTree, pTurns), pNumCrossings)
+
+    orderer = HeuristicOrderer(pGeoTree)
+    turns, numCrossings = orderer.giveGreedyTurns(
+        orderer.giveTopDownTurns(), pRandom, pMaxRounds, pTimeLimit, onRound
+    )
+
+    return [giveTurnConfig(pGeoTree, turns), numCrossings]
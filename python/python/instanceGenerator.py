@@ -0,0 +1,256 @@
+import argparse
+import json
+import math
+import random
+
+# lon/lat box the generated sites are placed in: minLon, minLat, maxLon, maxLat
+DEFAULT_MAP_BOUNDS = [-10.0, 35.0, 40.0, 70.0]
+# as in GeophylogenyInstanceCreater of the java implementation
+MIN_CLUSTER_SIZE = 3
+CLUSTER_FACTOR = 1.5
+
+
+def giveTreeJson(pNumLeaves, pShape, pRandom):
+    # builds the nested tree in the format of DataFileParser.newickToJson without recursion
+    nextId = 0
+    nextSiteId = 0
+    maxCumBranchLength = 0
+    namesOrder = []
+
+    tree = {}
+    stack = [[tree, pNumLeaves, 1, False]]
+    while len(stack) > 0:
+        thisSubtree, thisNumLeaves, thisCumBranchLength, isVisited = stack.pop()
+
+        if thisNumLeaves == 1:
+            thisSubtree["leaf"] = True
+            thisSubtree["id"] = nextId
+            thisSubtree["label"] = "L" + str(nextSiteId)
+            thisSubtree["site_id"] = nextSiteId
+            thisSubtree["cum_branch_length"] = thisCumBranchLength
+            namesOrder.append(thisSubtree["label"])
+            maxCumBranchLength = max(maxCumBranchLength, thisCumBranchLength)
+            nextId += 1
+            nextSiteId += 1
+        elif isVisited:
+            thisSubtree["id"] = nextId
+            nextId += 1
+        else:
+            if pShape == "balanced":
+                numLeftLeaves = thisNumLeaves // 2
+            elif pShape == "caterpillar":
+                numLeftLeaves = 1
+            else:
+                numLeftLeaves = pRandom.randint(1, thisNumLeaves - 1)
+
+            thisSubtree["leaf"] = False
+            thisSubtree["cum_branch_length"] = thisCumBranchLength
+            thisSubtree["left"] = {}
+            thisSubtree["right"] = {}
+
+            stack.append([thisSubtree, thisNumLeaves, thisCumBranchLength, True])
+            stack.append(
+                [
+                    thisSubtree["right"],
+                    thisNumLeaves - numLeftLeaves,
+                    thisCumBranchLength + 1,
+                    False,
+                ]
+            )
+            stack.append(
+                [thisSubtree["left"], numLeftLeaves, thisCumBranchLength + 1, False]
+            )
+
+    return {
+        "title": pShape + str(pNumLeaves),
+        "tree": tree,
+        "num_leaves": pNumLeaves,
+        "namesOrder": namesOrder,
+        "maxCumBranchLength": maxCumBranchLength,
+    }
+
+
+def giveNewickString(pTreeJson):
+    # writes the tree of giveTreeJson in newick format, every branch has length 1 so
+    # newickToJson gives back the same cum_branch_length
+    parts = []
+    # the stack holds subtrees still to write and the text that closes them
+    stack = [pTreeJson["tree"]]
+    while len(stack) > 0:
+        thisItem = stack.pop()
+
+        if isinstance(thisItem, str):
+            parts.append(thisItem)
+        elif thisItem["leaf"]:
+            parts.append(thisItem["label"] + ":1")
+        else:
+            parts.append("(")
+            stack += ["):1", thisItem["right"], ",", thisItem["left"]]
+
+    return "".join(parts) + ";"
+
+
+def giveUniformSites(pNumSites, pRandom, pMapBounds=DEFAULT_MAP_BOUNDS):
+    minLon, minLat, maxLon, maxLat = pMapBounds
+
+    return [
+        [pRandom.uniform(minLon, maxLon), pRandom.uniform(minLat, maxLat)]
+        for i in range(pNumSites)
+    ]
+
+
+def giveClampedGauss(pRandom, pMean, pSigma, pMin, pMax):
+    return min(max(pRandom.gauss(pMean, pSigma), pMin), pMax)
+
+
+def giveClusteredSites(pNumSites, pNumClusters, pRandom, pMapBounds=DEFAULT_MAP_BOUNDS):
+    # sites around random cluster centres like generateClusteredInstance of the java
+    # implementation. Consecutive sites share a cluster, so if they are given to the
+    # leafs in tree order, close leafs in the tree are also close on the map
+    if pNumClusters * MIN_CLUSTER_SIZE > pNumSites:
+        raise Exception("Num sites is smaller than num clusters times min cluster size")
+
+    clusterSizes = [MIN_CLUSTER_SIZE] * pNumClusters
+    for i in range(pNumSites - MIN_CLUSTER_SIZE * pNumClusters):
+        clusterSizes[pRandom.randrange(pNumClusters)] += 1
+
+    minLon, minLat, maxLon, maxLat = pMapBounds
+    clusterCentres = giveUniformSites(
+        pNumClusters,
+        pRandom,
+        [
+            minLon + (maxLon - minLon) / 10,
+            minLat + (maxLat - minLat) / 10,
+            maxLon - (maxLon - minLon) / 10,
+            maxLat - (maxLat - minLat) / 10,
+        ],
+    )
+
+    sites = []
+    for thisCentre, thisClusterSize in zip(clusterCentres, clusterSizes):
+        # bigger clusters spread out over a bigger fraction of the map
+        fraction = CLUSTER_FACTOR * thisClusterSize / pNumSites
+        for i in range(thisClusterSize):
+            sites.append(
+                [
+                    giveClampedGauss(
+                        pRandom,
+                        thisCentre[0],
+                        fraction * (maxLon - minLon),
+                        minLon,
+                        maxLon,
+                    ),
+                    giveClampedGauss(
+                        pRandom,
+                        thisCentre[1],
+                        fraction * (maxLat - minLat),
+                        minLat,
+                        maxLat,
+                    ),
+                ]
+            )
+
+    return sites
+
+
+def giveGeoJson(pNames, pSites, pRandom=None):
+    # one point feature per site, named by the leaf it belongs to. If pRandom is given,
+    # the features are shuffled so they have to be connected to the leafs by name
+    features = [
+        {
+            "type": "Feature",
+            "properties": {"name": thisName},
+            "geometry": {"coordinates": thisSite, "type": "Point"},
+        }
+        for thisName, thisSite in zip(pNames, pSites)
+    ]
+
+    if pRandom is not None:
+        pRandom.shuffle(features)
+
+    for thisIndex, thisFeature in enumerate(features):
+        thisFeature["id"] = thisIndex
+
+    return {"type": "FeatureCollection", "features": features}
+
+
+def giveSites(pNumSites, pSiteDistribution, pRandom):
+    if pSiteDistribution == "uniform":
+        return giveUniformSites(pNumSites, pRandom)
+    elif pSiteDistribution == "clustered":
+        return giveClusteredSites(
+            pNumSites, max(1, round(math.sqrt(pNumSites) / 2)), pRandom
+        )
+
+    raise Exception("Unknown site distribution " + pSiteDistribution)
+
+
+def giveTreeAndGeoFiles(pNumLeaves, pShape, pSiteDistribution, pRandom):
+    # a newick tree and a geojson with sites connectable by "name", like the input
+    # files of the webserver and parseFiles.py
+    phyloTreeJson = giveTreeJson(pNumLeaves, pShape, pRandom)
+    sites = giveSites(pNumLeaves, pSiteDistribution, pRandom)
+
+    return [
+        giveNewickString(phyloTreeJson),
+        giveGeoJson(phyloTreeJson["namesOrder"], sites, pRandom),
+    ]
+
+
+def giveInstanceJson(pNumLeaves, pShape, pRandom):
+    # an instance for parseFile with sites uniformly at random on a 100x100 map
+    phyloTreeJson = giveTreeJson(pNumLeaves, pShape, pRandom)
+
+    return {
+        "title": phyloTreeJson["title"],
+        "tree": phyloTreeJson["tree"],
+        "sites": [
+            {"x": pRandom.random() * 100, "y": pRandom.random() * 100}
+            for i in range(pNumLeaves)
+        ],
+        "num_leaves": pNumLeaves,
+        "maxCumBranchLength": phyloTreeJson["maxCumBranchLength"],
+        "left_coord": 0,
+        "top_coord": 0,
+        "map_width": 100,
+        "map_height": 100,
+    }
+
+
+if __name__ == "__main__":
+    ### HANDLE COMMANDLINE ARGUMENTS
+    aparser = argparse.ArgumentParser()
+
+    aparser.add_argument(
+        "output",
+        help="Path prefix of the generated files, writes <output>.dnd and <output>.geojson",
+    )
+    aparser.add_argument(
+        "-n", "--num-leaves", type=int, default=100, help="Number of leafs."
+    )
+    aparser.add_argument(
+        "-s",
+        "--shape",
+        default="random",
+        help="Tree shape: balanced, caterpillar or random (default)",
+    )
+    aparser.add_argument(
+        "-d",
+        "--sites",
+        default="clustered",
+        help="Site distribution: uniform or clustered (default)",
+    )
+    aparser.add_argument("--seed", type=int, default=0, help="Random seed.")
+
+    args = aparser.parse_args()
+
+    newick, geoJson = giveTreeAndGeoFiles(
+        args.num_leaves, args.shape, args.sites, random.Random(args.seed)
+    )
+
+    with open(args.output + ".dnd", "w", encoding="utf-8") as newickFile:
+        newickFile.write(newick)
+    with open(args.output + ".geojson", "w", encoding="utf-8") as geoFile:
+        geoFile.write(json.dumps(geoJson))
+
+    print("Done.")
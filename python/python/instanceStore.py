@@ -0,0 +1,107 @@
+import collections
+import json
+import threading
+import zlib
+from sqlalchemy import text
+from parseFiles import DataFileParser
+import deepJson
+
+# The instance of a solution only depends on its tree, geo, padding and connect,
+# which never change for an id. So it is computed once when the solution is added
+# and stored zlib compressed in the instance column of the solutions table.
+
+
+def giveInstanceBlob(pInstanceJson):
+    return zlib.compress(deepJson.dumps(pInstanceJson).encode("utf-8"))
+
+
+def giveInstanceFromBlob(pInstanceBlob):
+    return deepJson.loads(zlib.decompress(pInstanceBlob))
+
+
+def giveInstanceBlobOfSolution(pConn, pId):
+    # the stored instance of the solution pId, or None if there is no such solution.
+    # Solutions added before the instance was stored get it computed and stored here
+    result = (
+        pConn.execute(
+            text("SELECT instance FROM solutions WHERE id=:solutionId;"),
+            [{"solutionId": pId}],
+        )
+        .mappings()
+        .all()
+    )
+    if len(result) == 0:
+        return None
+    if result[0].instance is not None:
+        return result[0].instance
+
+    result = (
+        pConn.execute(
+            text(
+                "SELECT tree,geo,padding,connect FROM solutions WHERE id=:solutionId;"
+            ),
+            [{"solutionId": pId}],
+        )
+        .mappings()
+        .all()
+    )
+    instanceBlob = giveInstanceBlob(
+        DataFileParser().convertTreeAndGeoToInstance(
+            deepJson.loads(result[0].tree),
+            json.loads(result[0].geo),
+            float(result[0].padding),
+            result[0].connect,
+        )
+    )
+    pConn.execute(
+        text("UPDATE solutions SET instance=:instance WHERE id=:solutionId;"),
+        [{"solutionId": pId, "instance": instanceBlob}],
+    )
+
+    return instanceBlob
+
+
+class InstanceCache(object):
+    # The instances used last by solution id, at most pMaxBytes of them measured by
+    # the size of their JSON. The instances are shared by all requests, so they must
+    # not be changed.
+    def __init__(self, pMaxBytes):
+        self.maxBytes = pMaxBytes
+        self.numBytes = 0
+        # id: [instance, size], the one used last at the end
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def giveInstance(self, pId, pGiveInstanceBlob):
+        # the instance of pId from the cache, otherwise pGiveInstanceBlob() is read
+        # and cached. None if pGiveInstanceBlob() gives None
+        with self.lock:
+            entry = self.entries.get(pId)
+            if entry is not None:
+                self.entries.move_to_end(pId)
+                return entry[0]
+
+        instanceBlob = pGiveInstanceBlob()
+        if instanceBlob is None:
+            return None
+
+        instanceString = zlib.decompress(instanceBlob)
+        instanceJson = deepJson.loads(instanceString)
+        self.add(pId, instanceJson, len(instanceString))
+
+        return instanceJson
+
+    def add(self, pId, pInstanceJson, pSize):
+        if pSize > self.maxBytes:
+            return
+
+        with self.lock:
+            if pId in self.entries:
+                self.numBytes -= self.entries.pop(pId)[1]
+            self.entries[pId] = [pInstanceJson, pSize]
+            self.numBytes += pSize
+
+            while self.numBytes > self.maxBytes:
+                self.numBytes -= self.entries.popitem(last=False)[1][1]
+
+    pass
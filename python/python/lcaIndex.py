@@ -0,0 +1,83 @@
+import numpy as np
+
+
+class LcaIndex(object):
+    # In the in-order tour of a binary tree every inner vertex sits between the last leaf
+    # of its left and the first leaf of its right subtree. So the lowest common parent of
+    # the leafs a < b is the vertex of minimal depth between them in the tour, which a
+    # sparse table answers in O(1) after O(n log n) preprocessing.
+    def __init__(self, pGapVertices, pGapDepths):
+        self.gapVertices = np.asarray(pGapVertices, dtype=np.int32)
+        self.gapDepths = np.asarray(pGapDepths, dtype=np.int32)
+
+        numGaps = len(self.gapVertices)
+
+        self.logTable = np.zeros(numGaps + 1, dtype=np.int8)
+        for thisLevel in range(1, max(numGaps, 1).bit_length()):
+            self.logTable[1 << thisLevel :] += 1
+
+        levels = [np.arange(numGaps, dtype=np.int32)]
+        windowSize = 1
+        while 2 * windowSize <= numGaps:
+            lastLevel = levels[-1]
+            leftMin = lastLevel[: numGaps - 2 * windowSize + 1]
+            rightMin = lastLevel[windowSize : numGaps - windowSize + 1]
+            levels.append(
+                np.where(
+                    self.gapDepths[leftMin] <= self.gapDepths[rightMin],
+                    leftMin,
+                    rightMin,
+                )
+            )
+            windowSize *= 2
+
+        self.sparseTable = np.zeros((len(levels), numGaps), dtype=np.int32)
+        for thisLevel in range(len(levels)):
+            self.sparseTable[thisLevel, : len(levels[thisLevel])] = levels[thisLevel]
+
+    @classmethod
+    def fromGeoTree(cls, pGeoTree):
+        # the gap after leaf i of the in-order tour is the inner vertex whose left
+        # subtree ends with leaf i
+        numInnerVertices = len(pGeoTree.innerIds)
+        gapVertices = np.zeros(numInnerVertices, dtype=np.int32)
+        gapVertices[pGeoTree.innerFirstLeaf + pGeoTree.giveLeftChildWidths() - 1] = (
+            np.arange(numInnerVertices, dtype=np.int32)
+        )
+
+        return cls(gapVertices, pGeoTree.innerDepth[gapVertices])
+
+    def giveLowestCommonParents(self, pLeafIndices1, pLeafIndices2):
+        # returns the totalIndex of the lowest common parent of each pair of leafs and
+        # whether leaf 1 is in its left subtree
+        leafIndices1 = np.asarray(pLeafIndices1, dtype=np.int64)
+        leafIndices2 = np.asarray(pLeafIndices2, dtype=np.int64)
+
+        isLeaf1Left = leafIndices1 < leafIndices2
+        rangeStart = np.minimum(leafIndices1, leafIndices2)
+        rangeEnd = np.maximum(leafIndices1, leafIndices2) - 1
+
+        level = self.logTable[rangeEnd - rangeStart + 1]
+        leftMin = self.sparseTable[level, rangeStart]
+        rightMin = self.sparseTable[level, rangeEnd - (1 << level.astype(np.int64)) + 1]
+        gapIndex = np.where(
+            self.gapDepths[leftMin] <= self.gapDepths[rightMin], leftMin, rightMin
+        )
+
+        return self.gapVertices[gapIndex], isLeaf1Left
+
+    def giveLowestCommonParent(self, pLeafIndex1, pLeafIndex2):
+        rangeStart = min(pLeafIndex1, pLeafIndex2)
+        rangeEnd = max(pLeafIndex1, pLeafIndex2) - 1
+
+        level = int(self.logTable[rangeEnd - rangeStart + 1])
+        leftMin = self.sparseTable[level, rangeStart]
+        rightMin = self.sparseTable[level, rangeEnd - (1 << level) + 1]
+        if self.gapDepths[leftMin] <= self.gapDepths[rightMin]:
+            gapIndex = leftMin
+        else:
+            gapIndex = rightMin
+
+        return int(self.gapVertices[gapIndex]), pLeafIndex1 < pLeafIndex2
+
+    pass
@@ -0,0 +1,180 @@
+import math
+import os
+import redis
+from sqlalchemy import text
+
+# The histograms are kept in Redis, so the gunicorn workers of the web app and the
+# celery workers add to the same numbers and /metrics can be served by any of them.
+# Every histogram is one Redis hash with a field per label set and bucket.
+KEY_PREFIX = "metrics:"
+
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+SOLVE_BUCKETS = [0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600, 7200, 21600]
+SIZE_BUCKETS = [1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8]
+
+# name: [help, buckets]
+HISTOGRAMS = {
+    "phyloptimize_request_duration_seconds": [
+        "Duration of the requests to the web app by route",
+        LATENCY_BUCKETS,
+    ],
+    "phyloptimize_solve_duration_seconds": [
+        "Duration of the solve tasks by final task state",
+        SOLVE_BUCKETS,
+    ],
+    "phyloptimize_model_variables": [
+        "Number of variables of the solved ILPs",
+        SIZE_BUCKETS,
+    ],
+    "phyloptimize_model_constraints": [
+        "Number of constraints of the solved ILPs",
+        SIZE_BUCKETS,
+    ],
+    "phyloptimize_background_map_fetch_seconds": [
+        "Duration of fetching the static background maps",
+        LATENCY_BUCKETS,
+    ],
+}
+
+# the celery queue the solve tasks wait in
+CELERY_QUEUE = "celery"
+
+
+def giveRedis():
+    return redis.Redis.from_url(os.getenv("redisUrl", "redis://redis"))
+
+
+def giveLabelString(pLabels):
+    return ",".join(
+        thisKey + '="' + str(pLabels[thisKey]).replace('"', '\\"') + '"'
+        for thisKey in sorted(pLabels)
+    )
+
+
+def observe(pRedis, pName, pValue, pLabels=None):
+    # adds pValue to the histogram pName, in one round trip. Metrics are best effort,
+    # so an unreachable Redis never fails the request or task that is measured
+    labelString = giveLabelString({} if pLabels is None else pLabels)
+    buckets = HISTOGRAMS[pName][1]
+
+    bucket = "+Inf"
+    for thisBound in buckets:
+        if pValue <= thisBound:
+            bucket = repr(float(thisBound))
+            break
+
+    try:
+        pipe = pRedis.pipeline(transaction=False)
+        pipe.hincrby(KEY_PREFIX + pName, labelString + "\t" + bucket, 1)
+        pipe.hincrby(KEY_PREFIX + pName, labelString + "\tcount", 1)
+        pipe.hincrbyfloat(KEY_PREFIX + pName, labelString + "\tsum", pValue)
+        pipe.execute()
+    except redis.RedisError:
+        pass
+
+
+def giveSeriesName(pName, pLabelString):
+    if pLabelString == "":
+        return pName
+
+    return pName + "{" + pLabelString + "}"
+
+
+def giveHistogramLines(pName, pFields):
+    # pFields are the fields of the Redis hash, the buckets are stored per bucket and
+    # are summed up to the cumulative counts of the text format here
+    lines = [
+        "# HELP " + pName + " " + HISTOGRAMS[pName][0],
+        "# TYPE " + pName + " histogram",
+    ]
+
+    byLabels = {}
+    for thisField, thisValue in pFields.items():
+        if isinstance(thisField, bytes):
+            thisField = thisField.decode()
+        thisLabels, thisKey = thisField.rsplit("\t", 1)
+        byLabels.setdefault(thisLabels, {})[thisKey] = float(thisValue)
+
+    for thisLabels in sorted(byLabels):
+        thisValues = byLabels[thisLabels]
+        labelPrefix = thisLabels + "," if thisLabels != "" else ""
+
+        cumulativeCount = 0
+        for thisBound in HISTOGRAMS[pName][1] + [math.inf]:
+            thisBucket = "+Inf" if thisBound == math.inf else repr(float(thisBound))
+            cumulativeCount += thisValues.get(thisBucket, 0)
+            lines.append(
+                giveSeriesName(
+                    pName + "_bucket", labelPrefix + 'le="' + thisBucket + '"'
+                )
+                + " "
+                + str(int(cumulativeCount))
+            )
+        lines.append(
+            giveSeriesName(pName + "_sum", thisLabels)
+            + " "
+            + repr(thisValues.get("sum", 0.0))
+        )
+        lines.append(
+            giveSeriesName(pName + "_count", thisLabels)
+            + " "
+            + str(int(thisValues.get("count", 0)))
+        )
+
+    return lines
+
+
+def giveSolveCounts(pEngine):
+    # solves waiting for a worker and solves a worker is busy with. Only unfinished
+    # solves have no timeEnd, so the query stays small with the index on timeEnd.
+    # A solve is done once its solution is final, even before its timeEnd is written
+    with pEngine.connect() as conn:
+        result = (
+            conn.execute(
+                text(
+                    "SELECT "
+                    "SUM(CASE WHEN timeStart IS NULL THEN 1 ELSE 0 END) AS pending,"
+                    "SUM(CASE WHEN timeStart IS NOT NULL AND (solutionStatus IS NULL OR solutionStatus<>'final') THEN 1 ELSE 0 END) AS inFlight "
+                    "FROM solutions WHERE timeEnd IS NULL;"
+                )
+            )
+            .mappings()
+            .all()
+        )
+        conn.commit()
+
+    return int(result[0]["pending"] or 0), int(result[0]["inFlight"] or 0)
+
+
+def giveMetricsText(pRedis, pEngine):
+    # everything /metrics serves in the Prometheus text format
+    lines = []
+
+    pending, inFlight = giveSolveCounts(pEngine)
+    lines += [
+        "# HELP phyloptimize_solves_pending Solves without a worker in the solutions table",
+        "# TYPE phyloptimize_solves_pending gauge",
+        "phyloptimize_solves_pending " + str(pending),
+        "# HELP phyloptimize_solves_in_flight Solves a worker is busy with",
+        "# TYPE phyloptimize_solves_in_flight gauge",
+        "phyloptimize_solves_in_flight " + str(inFlight),
+    ]
+
+    try:
+        pipe = pRedis.pipeline(transaction=False)
+        pipe.llen(CELERY_QUEUE)
+        for thisName in HISTOGRAMS:
+            pipe.hgetall(KEY_PREFIX + thisName)
+        redisResults = pipe.execute()
+    except redis.RedisError:
+        return "\n".join(lines) + "\n"
+
+    lines += [
+        "# HELP phyloptimize_queue_length Solve tasks waiting in the celery queue",
+        "# TYPE phyloptimize_queue_length gauge",
+        "phyloptimize_queue_length " + str(redisResults[0]),
+    ]
+    for thisName, thisFields in zip(HISTOGRAMS, redisResults[1:]):
+        lines += giveHistogramLines(thisName, thisFields)
+
+    return "\n".join(lines) + "\n"
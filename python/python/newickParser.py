@@ -0,0 +1,211 @@
+import codecs
+import math
+import re
+
+# The tokens of the newick format as Bio.Phylo.NewickIO reads them, everything
+# between them (whitespace) is skipped. The group of a match tells the token kind.
+TOKENS = re.compile(
+    r"(\()|(\))|(,)|(;)"
+    r"|(:\ ?[+-]?[0-9]*\.?[0-9]+(?:[eE][+-]?[0-9]+)?)"
+    r"|(\[(?:\\.|[^\]])*\])"
+    r"|('(?:\\.|[^'])*')"
+    r"|([^\s()\[\]':;,]+)"
+)
+OPEN, CLOSE, COMMA, SEMICOLON, LENGTH, COMMENT, QUOTED, LABEL = range(1, 9)
+
+# the file is read in chunks of this many characters
+CHUNK_SIZE = 1 << 20
+# a token that ends closer than this to the end of a chunk might go on in the next one
+LOOKAHEAD = 64
+
+
+def giveNewickChunks(pNewick):
+    # pNewick is a path or a file object in text or binary mode
+    if isinstance(pNewick, str):
+        with open(pNewick, encoding="utf-8") as newickFile:
+            yield from giveNewickChunks(newickFile)
+        return
+
+    decoder = None
+    while True:
+        rawChunk = pNewick.read(CHUNK_SIZE)
+        chunk = rawChunk
+        if isinstance(rawChunk, bytes):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder("utf-8")()
+            # a chunk that ends inside a character decodes to less, maybe to nothing
+            chunk = decoder.decode(rawChunk, len(rawChunk) == 0)
+        if len(chunk) > 0:
+            yield chunk
+        if len(rawChunk) == 0:
+            return
+
+
+def giveNewickTokens(pNewick):
+    # yields [kind, text] for every token, reading the file chunk by chunk
+    buffer = ""
+    isLastChunk = False
+    chunks = giveNewickChunks(pNewick)
+
+    while not isLastChunk:
+        chunk = next(chunks, None)
+        if chunk is None:
+            isLastChunk = True
+        else:
+            buffer += chunk
+            if len(buffer) < 2 * LOOKAHEAD:
+                continue
+
+        safeEnd = len(buffer) if isLastChunk else len(buffer) - LOOKAHEAD
+        position = 0
+        for match in TOKENS.finditer(buffer):
+            # an unfinished comment or quoted label is skipped over by finditer, so
+            # those have to wait for the next chunk as well
+            if not isLastChunk and (
+                match.end() > safeEnd
+                or (
+                    match.start() > position
+                    and (
+                        "'" in buffer[position : match.start()]
+                        or "[" in buffer[position : match.start()]
+                    )
+                )
+            ):
+                break
+
+            position = match.end()
+            yield [match.lastindex, match.group()]
+
+        buffer = buffer[position:]
+
+
+def giveNewickTreeJson(pNewick):
+    # Reads the single tree of a newick file in one pass, straight into the nested tree
+    # of DataFileParser.newickToJson with the same ids as Bio.Phylo.read would give:
+    # ids in post-order and site ids in the order of the leafs. Like Bio.Phylo, it
+    # handles quoted labels, comments and branch lengths. Returns the tree, the leaf
+    # names in order and the biggest cum_branch_length of a leaf.
+
+    # the vertices in the order they are finished (post-order)
+    vertexJsons = []
+    vertexBranchLengths = []
+    vertexChildren = []
+    namesOrder = []
+
+    # a clade that is still read: [name, branch length, children, parent clade]
+    def giveNewClade(pParent):
+        return [None, None, [], pParent]
+
+    def finishClade(pClade):
+        # makes the json of a clade once all of it is read, returns its parent
+        name, branchLength, children, parent = pClade
+        thisIndex = len(vertexJsons)
+
+        if len(children) == 0:
+            vertexJsons.append(
+                {
+                    "leaf": True,
+                    "id": thisIndex,
+                    "label": name,
+                    "site_id": len(namesOrder),
+                    "cum_branch_length": None,
+                }
+            )
+            namesOrder.append(name)
+        elif len(children) == 2:
+            vertexJsons.append(
+                {
+                    "leaf": False,
+                    "cum_branch_length": None,
+                    "left": vertexJsons[children[0]],
+                    "right": vertexJsons[children[1]],
+                    "id": thisIndex,
+                }
+            )
+        else:
+            raise Exception(
+                "The tree is not binary, a vertex has "
+                + str(len(children))
+                + " children."
+            )
+
+        vertexBranchLengths.append(math.inf if branchLength is None else branchLength)
+        vertexChildren.append(children)
+        if parent is not None:
+            parent[2].append(thisIndex)
+
+        return parent
+
+    rootClade = giveNewClade(None)
+    currentClade = rootClade
+    numOpen = 0
+    numClose = 0
+    hasTokens = False
+    isTreeEnd = False
+
+    for thisKind, thisToken in giveNewickTokens(pNewick):
+        if isTreeEnd:
+            raise Exception("Text after semicolon in Newick tree: " + thisToken)
+        hasTokens = True
+
+        if thisKind == OPEN:
+            currentClade = giveNewClade(currentClade)
+            numOpen += 1
+        elif thisKind == CLOSE:
+            parent = finishClade(currentClade)
+            if parent is None:
+                raise Exception("Parenthesis mismatch.")
+            currentClade = parent
+            numClose += 1
+        elif thisKind == COMMA:
+            # without the outer parentheses, the root is only known at the first comma
+            if currentClade is rootClade:
+                rootClade = giveNewClade(None)
+                currentClade[3] = rootClade
+            currentClade = giveNewClade(finishClade(currentClade))
+        elif thisKind == SEMICOLON:
+            isTreeEnd = True
+        elif thisKind == LENGTH:
+            currentClade[1] = float(thisToken[1:])
+        elif thisKind == QUOTED:
+            if not currentClade[0]:
+                currentClade[0] = thisToken[1:-1]
+            else:
+                # an escaped quote '' looks like two quoted labels next to each other
+                currentClade[0] += thisToken[:-1]
+        elif thisKind == LABEL:
+            currentClade[0] = thisToken
+
+    if not hasTokens:
+        raise Exception("There are no trees in this file.")
+    if numOpen != numClose:
+        raise Exception(
+            "Mismatch, "
+            + str(numOpen)
+            + " open vs "
+            + str(numClose)
+            + " close parentheses."
+        )
+
+    if currentClade is not rootClade:
+        finishClade(currentClade)
+    finishClade(rootClade)
+
+    # the root is finished last, so going backwards every parent comes before its
+    # children
+    cumBranchLengths = [0] * len(vertexJsons)
+    cumBranchLengths[-1] = 0 + vertexBranchLengths[-1]
+    for thisIndex in range(len(vertexJsons) - 1, -1, -1):
+        thisCumBranchLength = cumBranchLengths[thisIndex]
+        vertexJsons[thisIndex]["cum_branch_length"] = thisCumBranchLength
+        for thisChild in vertexChildren[thisIndex]:
+            cumBranchLengths[thisChild] = (
+                thisCumBranchLength + vertexBranchLengths[thisChild]
+            )
+
+    maxCumBranchLength = -math.inf
+    for thisIndex, thisChildren in enumerate(vertexChildren):
+        if len(thisChildren) == 0:
+            maxCumBranchLength = max(maxCumBranchLength, cumBranchLengths[thisIndex])
+
+    return [vertexJsons[-1], namesOrder, maxCumBranchLength]
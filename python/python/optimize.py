@@ -1,7 +1,11 @@
 from parseFiles import DataFileParser
-from gurobiFunctions import giveMinLeaderIntersectConfig
+from gurobiFunctions import giveMinLeaderIntersectResult
+from solveStats import SolveStats
+import deepJson
 import argparse
 import json
+import logging
+import sys
 
 if __name__ == "__main__":
     ### HANDLE COMMANDLINE ARGUMENTS
@@ -24,6 +28,42 @@ if __name__ == "__main__":
         type=float,
         default=0,
     )
+    aparser.add_argument(
+        "-s",
+        "--solver",
+        help="Solver: gurobi, highs, auto or heuristic (default: env solverBackend or auto)",
+        default=None,
+    )
+    aparser.add_argument(
+        "-w",
+        "--warm-start",
+        help="Start the solver from the leaf order by mean x of the subtree sites",
+        action="store_true",
+    )
+    aparser.add_argument(
+        "-t",
+        "--time-limit",
+        help="Stop the solver after this many seconds with the best leaf order found so far (default: env solverTimeLimit or none)",
+        type=float,
+        default=None,
+    )
+    aparser.add_argument(
+        "--mip-gap",
+        help="Stop the solver once the relative gap to the optimum is at most this (default: env solverMipGap or the solver default)",
+        type=float,
+        default=None,
+    )
+    aparser.add_argument(
+        "--stats",
+        help="Write the wall time and peak memory of every phase, the model size and the solver stats as JSON to this file",
+        default=None,
+    )
+    aparser.add_argument(
+        "--no-presolve",
+        help="Keep a variable and a constraint for every fixed site pair in the ILP",
+        dest="presolve",
+        action="store_false",
+    )
 
     args = aparser.parse_args()
 
@@ -37,21 +77,51 @@ if __name__ == "__main__":
     else:
         outputStream = open(args.output, "w", encoding="utf-8")
 
+    # the phases are logged as JSON lines to stderr, so they do not mix with the output.
+    # Only this logger is set up, the root logger would print the log of gurobipy twice
+    logger = logging.getLogger("optimize")
+    logHandler = logging.StreamHandler(sys.stderr)
+    logHandler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(logHandler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    solveStats = SolveStats()
+
     thisParser = DataFileParser()
 
-    thisGeoTree = thisParser.parseFile(
-        json.load(open(instanceFileName)), args.ltype, args.pogap
+    with solveStats.measure("load"):
+        thisInstanceJson = deepJson.load(open(instanceFileName))
+    with solveStats.measure("parseFile"):
+        thisGeoTree = thisParser.parseFile(thisInstanceJson, args.ltype, args.pogap)
+    shouldVerticesTurn, intersections, solverStats = giveMinLeaderIntersectResult(
+        thisGeoTree,
+        args.solver,
+        args.warm_start,
+        args.presolve,
+        args.time_limit,
+        args.mip_gap,
+        pSolveStats=solveStats,
     )
-    shouldVerticesTurn, intersections = giveMinLeaderIntersectConfig(thisGeoTree)
-    thisOutputJSONString = json.dumps(
-        thisParser.giveOutputJSON(
-            shouldVerticesTurn,
-            thisGeoTree.giveLeafOffsetAfterTurns(shouldVerticesTurn),
-            intersections,
-            thisGeoTree.lType,
+    with solveStats.measure("serialize"):
+        thisOutputJSONString = json.dumps(
+            thisParser.giveOutputJSON(
+                shouldVerticesTurn,
+                thisGeoTree.giveLeafOffsetAfterTurns(shouldVerticesTurn),
+                intersections,
+                thisGeoTree.lType,
+                solverStats["bound"],
+                solverStats["gap"],
+            )
         )
-    )
 
     outputStream.write(thisOutputJSONString)
 
+    solveStats.log(
+        logger,
+        {"instance": instanceFileName, "numLeaves": len(thisGeoTree.leafs)},
+    )
+    if args.stats is not None:
+        with open(args.stats, "w", encoding="utf-8") as statsFile:
+            statsFile.write(json.dumps(solveStats.giveJson(), indent=1))
+
     print("Done.")
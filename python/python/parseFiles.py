@@ -2,10 +2,13 @@ import argparse
 import json
 import math
 import numpy as np
-from Bio import Phylo
+import scipy.sparse as sp
 from pyproj import Transformer
 import csv
 from geojson import Feature, Point, FeatureCollection
+from lcaIndex import LcaIndex
+from newickParser import giveNewickTreeJson
+import deepJson
 
 TRAN_4326_TO_3857 = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
 
@@ -18,32 +21,83 @@ def getId(obj):
     return obj[0]
 
 
+def giveFeatureIndex(pFeatures, pProperty):
+    # maps every value of the property pProperty to the index of the feature that has
+    # it, in one pass over the features. Values that more than one feature has are
+    # collected as well, they only cause an error if a leaf is connected by them
+    featureIndex = {}
+    duplicateValues = set()
+    for thisIndex, thisFeature in enumerate(pFeatures):
+        thisProperties = thisFeature.get("properties") or {}
+        if pProperty not in thisProperties:
+            continue
+
+        thisValue = thisProperties[pProperty]
+        try:
+            if thisValue in featureIndex:
+                duplicateValues.add(thisValue)
+            else:
+                featureIndex[thisValue] = thisIndex
+        except TypeError:
+            # lists and objects can never be the name of a leaf
+            continue
+
+    return featureIndex, duplicateValues
+
+
 class Vertex(object):
-    def __init__(self, pType, pId):
+    # An inner vertex or leaf of a GeoTree. The tree itself is stored in the arrays of
+    # the GeoTree, a Vertex is only a small view on one of its entries that is made
+    # when it is accessed, so two Vertex objects can stand for the same vertex.
+    __slots__ = ["geoTree", "type", "totalIndex"]
+
+    def __init__(self, pGeoTree, pType, pTotalIndex):
+        self.geoTree = pGeoTree
         self.type = pType
-        self.children = []
-        self.allParents = []
-        self.id = pId
-
-    def incSubTreeWidth(self):
-        self.subTreeWidth += 1
-        if self.type != "root":
-            self.allParents[0][0].incSubTreeWidth()
-
-    def addChild(self, pChild):
-        self.children.append(pChild)
-        pChild.allParents = [[self, len(self.children) == 1]]
-        pChild.allParents.extend(self.allParents)
-        pChild.geoTree = self.geoTree
-
-        if pChild.type == "leaf":
-            self.incSubTreeWidth()
-            self.geoTree.leafs.append(pChild)
-            self.geoTree.sites.append(pChild.site)
-            pChild.totalIndex = len(self.geoTree.leafs) - 1
+        self.totalIndex = pTotalIndex
+
+    @property
+    def id(self):
+        if self.type == "leaf":
+            return int(self.geoTree.leafIds[self.totalIndex])
+        return int(self.geoTree.innerIds[self.totalIndex])
+
+    @property
+    def site(self):
+        return self.geoTree.sites[self.totalIndex]
+
+    @property
+    def subTreeWidth(self):
+        if self.type == "leaf":
+            return 1
+        return int(self.geoTree.innerWidth[self.totalIndex])
+
+    @property
+    def children(self):
+        if self.type == "leaf":
+            return []
+        return [
+            self.geoTree.giveChildVertex(self.geoTree.innerLeftChild[self.totalIndex]),
+            self.geoTree.giveChildVertex(self.geoTree.innerRightChild[self.totalIndex]),
+        ]
+
+    @property
+    def allParents(self):
+        # [[parent, am I in its left subtree], ...] from the parent up to the root
+        if self.type == "leaf":
+            parent = int(self.geoTree.leafParent[self.totalIndex])
+            isLeft = bool(self.geoTree.leafIsLeft[self.totalIndex])
         else:
-            self.geoTree.innerVertices.append(pChild)
-            pChild.totalIndex = len(self.geoTree.innerVertices) - 1
+            parent = int(self.geoTree.innerParent[self.totalIndex])
+            isLeft = bool(self.geoTree.innerIsLeft[self.totalIndex])
+
+        res = []
+        while parent >= 0:
+            res.append([self.geoTree.innerVertices[parent], isLeft])
+            isLeft = bool(self.geoTree.innerIsLeft[parent])
+            parent = int(self.geoTree.innerParent[parent])
+
+        return res
 
     def giveOffsetAfterTurns(self, pTurns):
         offset = 0
@@ -57,8 +111,19 @@ class Vertex(object):
 
         return offset
 
+    def __eq__(self, pOther):
+        return (
+            isinstance(pOther, Vertex)
+            and self.geoTree is pOther.geoTree
+            and (self.type == "leaf") == (pOther.type == "leaf")
+            and self.totalIndex == pOther.totalIndex
+        )
+
+    def __hash__(self):
+        return hash((id(self.geoTree), self.type == "leaf", self.totalIndex))
+
     def __str__(self):
-        return "Vertex: " + self.id
+        return "Vertex: " + str(self.id)
 
     def __repr__(self):
         return self.__str__()
@@ -93,101 +158,80 @@ class Vertex(object):
     pass
 
 
-class InnerVertex(Vertex):
-    def __init__(self, pId):
-        self.subTreeWidth = 0
-        return super().__init__("inner", pId)
+class Site(object):
+    def __init__(self, pPos, pName):
+        self.pos = pPos
+        self.name = pName
+
+    def __str__(self):
+        return "Site: " + self.name
+
+    def __repr__(self):
+        return self.__str__()
 
     pass
 
 
-class Leaf(Vertex):
-    def __init__(self, pSite, pId):
-        self.subTreeWidth = 1
-        self.site = pSite
-        pSite.leaf = self
-        return super().__init__("leaf", pId)
+class GeoTreeSequence(object):
+    # read only list of the innerVertices, leafs or sites of a GeoTree, the Vertex and
+    # Site objects are made on access
+    def __init__(self, pGeoTree, pKind):
+        self.geoTree = pGeoTree
+        self.kind = pKind
 
-    pass
+    def __len__(self):
+        if self.kind == "innerVertices":
+            return len(self.geoTree.innerIds)
+        return len(self.geoTree.leafIds)
 
+    def giveItem(self, pIndex):
+        if self.kind == "innerVertices":
+            return Vertex(self.geoTree, "root" if pIndex == 0 else "inner", pIndex)
 
-class RootVertex(Vertex):
-    def __init__(self):
-        self.subTreeWidth = 0
-        self.totalIndex = 0
-        return super().__init__("root", 0)
+        leaf = Vertex(self.geoTree, "leaf", pIndex)
+        if self.kind == "leafs":
+            return leaf
 
-    pass
+        site = Site(self.geoTree.sitePositions[pIndex].tolist(), "")
+        site.leaf = leaf
+        return site
 
+    def __getitem__(self, pIndex):
+        if isinstance(pIndex, slice):
+            return [self.giveItem(i) for i in range(*pIndex.indices(len(self)))]
 
-class Site(object):
-    def __init__(self, pPos, pName):
-        self.pos = pPos
-        self.name = pName
+        index = int(pIndex)
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("GeoTree index out of range")
 
-    def __str__(self):
-        return "Site: " + self.name
+        return self.giveItem(index)
 
-    def __repr__(self):
-        return self.__str__()
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.giveItem(i)
+
+    def __reversed__(self):
+        for i in reversed(range(len(self))):
+            yield self.giveItem(i)
 
     pass
 
 
 class DataFileParser(object):
-    def newickToJsonRecursionStep(self, pClade, pMaxId, pMaxSiteId, pCumBranchLength):
-        thisBranchLength = pClade.branch_length
-        if thisBranchLength is None:
-            thisBranchLength = math.inf
-
-        newCumBranchLength = pCumBranchLength + thisBranchLength
-        if len(pClade.clades) == 0:
-            return [
-                {
-                    "leaf": True,
-                    "id": pMaxId + 1,
-                    "label": pClade.name,
-                    "site_id": pMaxSiteId + 1,
-                    "cum_branch_length": newCumBranchLength,
-                },
-                pMaxSiteId + 1,
-                [pClade.name],
-                newCumBranchLength,
-            ]
-        else:
-            outputSubTree = {"leaf": False, "cum_branch_length": newCumBranchLength}
-            leftRecursionRes = self.newickToJsonRecursionStep(
-                pClade.clades[0], pMaxId, pMaxSiteId, newCumBranchLength
-            )
-            outputSubTree["left"] = leftRecursionRes[0]
-            rightRecursionRes = self.newickToJsonRecursionStep(
-                pClade.clades[1],
-                outputSubTree["left"]["id"],
-                leftRecursionRes[1],
-                newCumBranchLength,
-            )
-            outputSubTree["right"] = rightRecursionRes[0]
-            outputSubTree["id"] = outputSubTree["right"]["id"] + 1
-            return [
-                outputSubTree,
-                rightRecursionRes[1],
-                leftRecursionRes[2] + rightRecursionRes[2],
-                max(leftRecursionRes[3], rightRecursionRes[3]),
-            ]
-
     def newickToJson(self, pNewick, pName=""):
-        newickTree = Phylo.read(pNewick, "newick")
-        recursionRes = self.newickToJsonRecursionStep(newickTree.root, -1, -1, 0)
+        tree, namesOrder, maxCumBranchLength = giveNewickTreeJson(pNewick)
         if "name" in pNewick:
             newickName = pNewick.name
         else:
             newickName = pName
         return {
             "title": newickName,
-            "tree": recursionRes[0],
-            "num_leaves": recursionRes[1] + 1,
-            "namesOrder": recursionRes[2],
-            "maxCumBranchLength": recursionRes[3],
+            "tree": tree,
+            "num_leaves": len(namesOrder),
+            "namesOrder": namesOrder,
+            "maxCumBranchLength": maxCumBranchLength,
         }
 
     def csvToGeoJson(self, pCsv):
@@ -204,18 +248,45 @@ class DataFileParser(object):
 
         return thisFeatureCollection
 
-    def addSubtree(self, pSubtree, pParent):
-        if pSubtree["leaf"]:
-            pParent.addChild(Leaf(self.sites[pSubtree["site_id"]], pSubtree["id"]))
-        else:
-            thisChild = InnerVertex(pSubtree["id"])
-            pParent.addChild(thisChild)
+    def addSubtree(self, pSubtree, pParentIndex, pIsLeft, pVertexLists):
+        # appends the subtree to the lists GeoTree.setVertexArrays is built from, inner
+        # vertices in pre-order and leafs in the order they are reached. An explicit
+        # stack instead of recursion, so deep trees do not hit the recursion limit
+        innerIds = pVertexLists["innerIds"]
+        innerParent = pVertexLists["innerParent"]
+        innerIsLeft = pVertexLists["innerIsLeft"]
+        leafIds = pVertexLists["leafIds"]
+        leafParent = pVertexLists["leafParent"]
+        leafIsLeft = pVertexLists["leafIsLeft"]
+        leafSiteIds = pVertexLists["leafSiteIds"]
+
+        stack = [(pSubtree, pParentIndex, pIsLeft)]
+        while stack:
+            thisSubtree, thisParentIndex, thisIsLeft = stack.pop()
+
+            if thisSubtree["leaf"]:
+                leafIds.append(thisSubtree["id"])
+                leafParent.append(thisParentIndex)
+                leafIsLeft.append(thisIsLeft)
+                leafSiteIds.append(thisSubtree["site_id"])
+            else:
+                thisIndex = len(innerIds)
+                innerIds.append(thisSubtree["id"])
+                innerParent.append(thisParentIndex)
+                innerIsLeft.append(thisIsLeft)
 
-            self.addSubtree(pSubtree["left"], thisChild)
-            self.addSubtree(pSubtree["right"], thisChild)
+                # the left subtree is taken from the stack first
+                stack.append((thisSubtree["right"], thisIndex, False))
+                stack.append((thisSubtree["left"], thisIndex, True))
 
     def giveOutputJSON(
-        self, pShouldInnerVerticesTurn, pLeafPosAfterTurns, pIntersections, pLType
+        self,
+        pShouldInnerVerticesTurn,
+        pLeafPosAfterTurns,
+        pIntersections,
+        pLType,
+        pBound=None,
+        pGap=None,
     ):
         should_rotate = {}
         for [id, rot] in pShouldInnerVerticesTurn:
@@ -228,6 +299,11 @@ class DataFileParser(object):
             "lType": pLType,
         }
 
+        # lower bound on the intersections and relative gap, if the solver proved them
+        if pBound is not None:
+            outputObject["bound"] = pBound
+            outputObject["gap"] = pGap
+
         return outputObject
 
     def convertTreeAndGeoToInstance(
@@ -244,73 +320,55 @@ class DataFileParser(object):
             "maxCumBranchLength": thisPhyloTreeJson["maxCumBranchLength"],
         }
 
-        # Autofit
-        maxX = -math.inf
-        maxY = -math.inf
-        minX = math.inf
-        minY = math.inf
-
         if pAssignSitesBy == "":
             if len(thisGeoJson["features"]) < thisPhyloTreeJson["num_leaves"]:
                 raise Exception("There are not enough sites.")
 
-            for thisFeature in thisGeoJson["features"]:
-                mercatorX, mercatorY = transformToMercator(
-                    thisFeature["geometry"]["coordinates"][0],
-                    thisFeature["geometry"]["coordinates"][1],
-                )
-
-                thisSiteObject = {"x": mercatorX, "y": -mercatorY}
-
-                outputObject["sites"].append(thisSiteObject)
-
-                if thisSiteObject["x"] > maxX:
-                    maxX = thisSiteObject["x"]
-                if thisSiteObject["x"] < minX:
-                    minX = thisSiteObject["x"]
-                if thisSiteObject["y"] > maxY:
-                    maxY = thisSiteObject["y"]
-                if thisSiteObject["y"] < minY:
-                    minY = thisSiteObject["y"]
+            siteFeatures = thisGeoJson["features"]
         else:
+            featureIndex, duplicateValues = giveFeatureIndex(
+                thisGeoJson["features"], pAssignSitesBy
+            )
+
+            siteFeatures = []
             for thisName in thisPhyloTreeJson["namesOrder"]:
-                foundSite = False
-
-                for thisFeature in thisGeoJson["features"]:
-                    if (
-                        pAssignSitesBy in thisFeature["properties"]
-                        and thisFeature["properties"][pAssignSitesBy] == thisName
-                    ):
-                        foundSite = True
-                        mercatorX, mercatorY = transformToMercator(
-                            thisFeature["geometry"]["coordinates"][0],
-                            thisFeature["geometry"]["coordinates"][1],
-                        )
-
-                        thisSiteObject = {"x": mercatorX, "y": -mercatorY}
-
-                        outputObject["sites"].append(thisSiteObject)
-
-                        if thisSiteObject["x"] > maxX:
-                            maxX = thisSiteObject["x"]
-                        if thisSiteObject["x"] < minX:
-                            minX = thisSiteObject["x"]
-                        if thisSiteObject["y"] > maxY:
-                            maxY = thisSiteObject["y"]
-                        if thisSiteObject["y"] < minY:
-                            minY = thisSiteObject["y"]
-
-                        break
-                if not foundSite:
+                if thisName in duplicateValues:
                     raise Exception(
                         "The leaf "
-                        + thisName
+                        + str(thisName)
+                        + " has more than one corresponding site with "
+                        + pAssignSitesBy
+                        + "="
+                        + str(thisName)
+                    )
+                if thisName not in featureIndex:
+                    raise Exception(
+                        "The leaf "
+                        + str(thisName)
                         + " has no corresponding site with "
                         + pAssignSitesBy
                         + "="
-                        + thisName
+                        + str(thisName)
                     )
 
+                siteFeatures.append(thisGeoJson["features"][featureIndex[thisName]])
+
+        # all sites are projected at once
+        coordinates = [
+            thisFeature["geometry"]["coordinates"] for thisFeature in siteFeatures
+        ]
+        siteX, siteY = transformToMercator(
+            np.array([thisCoords[0] for thisCoords in coordinates], dtype=np.float64),
+            np.array([thisCoords[1] for thisCoords in coordinates], dtype=np.float64),
+        )
+        siteY = -siteY
+
+        # Autofit
+        maxX = float(np.max(siteX, initial=-math.inf))
+        maxY = float(np.max(siteY, initial=-math.inf))
+        minX = float(np.min(siteX, initial=math.inf))
+        minY = float(np.min(siteY, initial=math.inf))
+
         padding = max((maxX - minX) * pRelPadding, (maxY - minY) * pRelPadding)
         mapLeft = minX - padding
         mapTop = minY - padding
@@ -319,9 +377,13 @@ class DataFileParser(object):
 
         scale = min(100 / mapWidth, 100 / mapHeight)
 
-        for thisSite in outputObject["sites"]:
-            thisSite["x"] = (thisSite["x"] - mapLeft) * scale
-            thisSite["y"] = (thisSite["y"] - mapTop) * scale
+        outputObject["sites"] = [
+            {"x": thisX, "y": thisY}
+            for thisX, thisY in zip(
+                ((siteX - mapLeft) * scale).tolist(),
+                ((siteY - mapTop) * scale).tolist(),
+            )
+        ]
 
         # the mercator bbox is needed for the background map
         outputObject["mercator_min_x"] = mapLeft
@@ -348,28 +410,202 @@ class DataFileParser(object):
         right = n_sites * leaf_x_scale
         resTree = GeoTree([left, 0], [right, 0], pLType, pPoGap)
 
-        self.sites = []
-        for thisSite in self.coords:
-            self.sites.append(Site([thisSite["x"], thisSite["y"]], ""))
-
-        resTree.innerVertices[0].id = importedData["tree"]["id"]
-
-        self.addSubtree(importedData["tree"]["left"], resTree.innerVertices[0])
-        self.addSubtree(importedData["tree"]["right"], resTree.innerVertices[0])
+        vertexLists = {
+            "innerIds": [importedData["tree"]["id"]],
+            "innerParent": [-1],
+            "innerIsLeft": [False],
+            "leafIds": [],
+            "leafParent": [],
+            "leafIsLeft": [],
+            "leafSiteIds": [],
+        }
+        self.addSubtree(importedData["tree"]["left"], 0, True, vertexLists)
+        self.addSubtree(importedData["tree"]["right"], 0, False, vertexLists)
+
+        resTree.setVertexArrays(
+            vertexLists["innerIds"],
+            vertexLists["innerParent"],
+            vertexLists["innerIsLeft"],
+            vertexLists["leafIds"],
+            vertexLists["leafParent"],
+            vertexLists["leafIsLeft"],
+            [
+                [self.coords[thisSiteId]["x"], self.coords[thisSiteId]["y"]]
+                for thisSiteId in vertexLists["leafSiteIds"]
+            ],
+        )
+        resTree.buildLcaIndex()
 
         return resTree
 
 
 class GeoTree(object):
+    # The tree is stored in numpy arrays indexed by totalIndex, see setVertexArrays.
+    # innerVertices, leafs and sites give Vertex and Site views on them.
     def __init__(self, pTopLineStart, pTopLineEnd, pLType, pPoGap):
-        self.sites = []
-        self.leafs = []
-        self.innerVertices = [RootVertex()]
         self.topLineStart = pTopLineStart
         self.topLineEnd = pTopLineEnd
-        self.innerVertices[0].geoTree = self
         self.lType = pLType
         self.poGap = pPoGap
+        self.lcaIndex = None
+        self.cachedParentCoefMatrix = None
+
+        self.innerVertices = GeoTreeSequence(self, "innerVertices")
+        self.leafs = GeoTreeSequence(self, "leafs")
+        self.sites = GeoTreeSequence(self, "sites")
+
+        # set by setVertexArrays
+        self.innerIds = np.empty(0, dtype=np.int64)
+        self.innerParent = np.empty(0, dtype=np.int32)
+        self.innerIsLeft = np.empty(0, dtype=bool)
+        self.innerLeftChild = np.empty(0, dtype=np.int32)
+        self.innerRightChild = np.empty(0, dtype=np.int32)
+        self.innerWidth = np.empty(0, dtype=np.int32)
+        self.innerDepth = np.empty(0, dtype=np.int32)
+        self.innerFirstLeaf = np.empty(0, dtype=np.int32)
+        self.leafIds = np.empty(0, dtype=np.int64)
+        self.leafParent = np.empty(0, dtype=np.int32)
+        self.leafIsLeft = np.empty(0, dtype=bool)
+        self.sitePositions = np.empty((0, 2), dtype=np.float64)
+
+    def setVertexArrays(
+        self,
+        pInnerIds,
+        pInnerParent,
+        pInnerIsLeft,
+        pLeafIds,
+        pLeafParent,
+        pLeafIsLeft,
+        pSitePositions,
+    ):
+        # The inner vertices are given in pre-order with the root first, so every parent
+        # comes before its children, and the leafs in the order of a depth first search,
+        # so the leafs of every subtree are a contiguous range. Parents are given by
+        # their totalIndex (-1 for the root). A child is stored as its totalIndex if it
+        # is an inner vertex and as -1 - totalIndex if it is a leaf.
+        numInnerVertices = len(pInnerIds)
+        numLeafs = len(pLeafIds)
+
+        self.innerIds = np.array(pInnerIds, dtype=np.int64)
+        self.innerParent = np.array(pInnerParent, dtype=np.int32)
+        self.innerIsLeft = np.array(pInnerIsLeft, dtype=bool)
+        self.leafIds = np.array(pLeafIds, dtype=np.int64)
+        self.leafParent = np.array(pLeafParent, dtype=np.int32)
+        self.leafIsLeft = np.array(pLeafIsLeft, dtype=bool)
+        self.sitePositions = np.array(pSitePositions, dtype=np.float64).reshape(
+            numLeafs, 2
+        )
+
+        self.innerLeftChild = np.zeros(numInnerVertices, dtype=np.int32)
+        self.innerRightChild = np.zeros(numInnerVertices, dtype=np.int32)
+        innerChildren = np.arange(1, numInnerVertices, dtype=np.int32)
+        innerChildParents = self.innerParent[1:]
+        innerChildIsLeft = self.innerIsLeft[1:]
+        self.innerLeftChild[innerChildParents[innerChildIsLeft]] = innerChildren[
+            innerChildIsLeft
+        ]
+        self.innerRightChild[innerChildParents[~innerChildIsLeft]] = innerChildren[
+            ~innerChildIsLeft
+        ]
+        leafChildren = -1 - np.arange(numLeafs, dtype=np.int32)
+        self.innerLeftChild[self.leafParent[self.leafIsLeft]] = leafChildren[
+            self.leafIsLeft
+        ]
+        self.innerRightChild[self.leafParent[~self.leafIsLeft]] = leafChildren[
+            ~self.leafIsLeft
+        ]
+
+        # one pass down for the depths, one pass up for the widths and the first leaf
+        # of every subtree
+        parents = self.innerParent.tolist()
+        leftChildren = self.innerLeftChild.tolist()
+        depths = [0] * numInnerVertices
+        for thisIndex in range(1, numInnerVertices):
+            depths[thisIndex] = depths[parents[thisIndex]] + 1
+        widths = np.bincount(self.leafParent, minlength=numInnerVertices).tolist()
+        firstLeafs = [0] * numInnerVertices
+        for thisIndex in range(numInnerVertices - 1, -1, -1):
+            if thisIndex > 0:
+                widths[parents[thisIndex]] += widths[thisIndex]
+            leftChild = leftChildren[thisIndex]
+            if leftChild < 0:
+                firstLeafs[thisIndex] = -1 - leftChild
+            else:
+                firstLeafs[thisIndex] = firstLeafs[leftChild]
+
+        self.innerDepth = np.array(depths, dtype=np.int32)
+        self.innerWidth = np.array(widths, dtype=np.int32)
+        self.innerFirstLeaf = np.array(firstLeafs, dtype=np.int32)
+
+        self.lcaIndex = None
+        self.cachedParentCoefMatrix = None
+
+    def giveChildVertex(self, pChild):
+        # pChild as stored in innerLeftChild and innerRightChild
+        if pChild < 0:
+            return self.leafs[-1 - int(pChild)]
+        return self.innerVertices[int(pChild)]
+
+    def giveLeftChildWidths(self):
+        # subTreeWidth of the left child of every inner vertex, the right child has the
+        # rest of innerWidth
+        leftChildren = self.innerLeftChild
+        return np.where(
+            leftChildren < 0, 1, self.innerWidth[np.maximum(leftChildren, 0)]
+        ).astype(np.int64)
+
+    def buildLcaIndex(self):
+        self.lcaIndex = LcaIndex.fromGeoTree(self)
+
+    @property
+    def parentCoefMatrix(self):
+        # it has one entry per leaf and parent, so it is only built once it is needed
+        if self.cachedParentCoefMatrix is None:
+            self.cachedParentCoefMatrix = self.buildParentCoefMatrix()
+        return self.cachedParentCoefMatrix
+
+    @property
+    def initialOffsets(self):
+        # leafs[i].initialOffset, before any turn the leafs are in the order of leafs
+        return np.arange(len(self.leafIds), dtype=np.int64)
+
+    def buildParentCoefMatrix(self):
+        # row i holds leafs[i].parentCoef in the columns of the parents' totalIndex
+        numInnerVertices = len(self.innerIds)
+        leftChildWidth = self.giveLeftChildWidths()
+        rightChildWidth = self.innerWidth - leftChildWidth
+
+        numLeafs = len(self.leafIds)
+        rows = np.arange(numLeafs, dtype=np.int64)
+        parents = self.leafParent.astype(np.int64)
+        isLeft = self.leafIsLeft
+
+        coefRows = []
+        coefCols = []
+        coefVals = []
+
+        # walk up from all leafs at once, one tree level per step
+        while len(rows) > 0:
+            coefRows.append(rows)
+            coefCols.append(parents)
+            coefVals.append(
+                np.where(isLeft, rightChildWidth[parents], -leftChildWidth[parents])
+            )
+
+            isLeft = self.innerIsLeft[parents]
+            parents = self.innerParent[parents].astype(np.int64)
+            hasParent = parents >= 0
+            rows = rows[hasParent]
+            parents = parents[hasParent]
+            isLeft = isLeft[hasParent]
+
+        return sp.csr_matrix(
+            (
+                np.concatenate(coefVals),
+                (np.concatenate(coefRows), np.concatenate(coefCols)),
+            ),
+            shape=(numLeafs, numInnerVertices),
+        )
 
     def giveTwoSitesTopLineIntersectIndex(self, pSite1Pos, pSite2Pos):
         intermRes = [
@@ -383,7 +619,7 @@ class GeoTree(object):
                 self.topLineEnd[0] - self.topLineStart[0]
             ):
                 # they point in the same direction -> site 1 is left -> the imaginary intersect index is positive
-                return [self.innerVertices[0].subTreeWidth + 1, True]
+                return [int(self.innerWidth[0]) + 1, True]
             else:
                 return [-1, True]
         else:
@@ -408,7 +644,7 @@ class GeoTree(object):
                 ) / (pSite2Pos[0] - pSite1Pos[0]) > 0
             if self.lType == "s":
                 return [
-                    intersectPercent * (self.innerVertices[0].subTreeWidth - 1),
+                    intersectPercent * (int(self.innerWidth[0]) - 1),
                     site1Lower,
                 ]
             elif self.lType == "po":
@@ -416,46 +652,99 @@ class GeoTree(object):
                     return [
                         (pSite2Pos[0] - self.topLineStart[0])
                         / (self.topLineEnd[0] - self.topLineStart[0])
-                        * (self.innerVertices[0].subTreeWidth - 1),
+                        * (int(self.innerWidth[0]) - 1),
                         site1Lower,
                     ]
                 else:
                     return [
                         (pSite1Pos[0] - self.topLineStart[0])
                         / (self.topLineEnd[0] - self.topLineStart[0])
-                        * (self.innerVertices[0].subTreeWidth - 1),
+                        * (int(self.innerWidth[0]) - 1),
                         site1Lower,
                     ]
 
     def giveLowestCommonParentVertex(self, pVertex1, pVertex2):
+        if (
+            self.lcaIndex is not None
+            and pVertex1.type == "leaf"
+            and pVertex2.type == "leaf"
+            and pVertex1.totalIndex != pVertex2.totalIndex
+        ):
+            lowestCommonParent, isVertex1Left = self.lcaIndex.giveLowestCommonParent(
+                pVertex1.totalIndex, pVertex2.totalIndex
+            )
+            return [self.innerVertices[lowestCommonParent], isVertex1Left]
+
+        return self.giveLowestCommonParentVertexByParents(pVertex1, pVertex2)
+
+    def giveLowestCommonParentVertexByParents(self, pVertex1, pVertex2):
         vertex1Parents = pVertex1.allParents
         vertex2Parents = pVertex2.allParents
 
         for thisVertex1Parent in vertex1Parents:
             for thisVertex2Parent in vertex2Parents:
-                if thisVertex1Parent[0] is thisVertex2Parent[0]:
+                if thisVertex1Parent[0].totalIndex == thisVertex2Parent[0].totalIndex:
                     return thisVertex1Parent
 
         raise Exception("Two Vertices have no common parent")
 
-    def giveLeafOffsetAfterTurns(self, pTurns):
-        res = {}
+    def giveLowestCommonParentIndices(self, pLeafIndices1, pLeafIndices2):
+        # batched form for arrays of leaf indices, returns the totalIndex of each lowest
+        # common parent and whether leaf 1 is in its left subtree
+        if self.lcaIndex is None:
+            self.buildLcaIndex()
+
+        return self.lcaIndex.giveLowestCommonParents(pLeafIndices1, pLeafIndices2)
+
+    def giveLeafPositionsAfterTurns(self, pShouldTurn):
+        # position of every leaf in the order of leafs if the inner vertices turn as
+        # given by one bool per inner vertex, in one pass down the tree: every inner
+        # vertex places its children in its block of the top line, and the block of a
+        # child starts where the block of its parent starts plus the width of the child
+        # placed before it
+        turns = np.asarray(pShouldTurn, dtype=bool)
+        leftChildWidth = self.giveLeftChildWidths()
+        rightChildWidth = self.innerWidth - leftChildWidth
+
+        # start of the block of each child in the block of its parent
+        leftChildShift = np.where(turns, rightChildWidth, 0)
+        rightChildShift = np.where(turns, 0, leftChildWidth)
+
+        innerShift = np.where(
+            self.innerIsLeft,
+            leftChildShift[self.innerParent],
+            rightChildShift[self.innerParent],
+        ).tolist()
+        parents = self.innerParent.tolist()
+        blockStart = [0] * len(parents)
+        # parents come before their children in innerVertices
+        for thisIndex in range(1, len(parents)):
+            blockStart[thisIndex] = (
+                blockStart[parents[thisIndex]] + innerShift[thisIndex]
+            )
+        blockStart = np.array(blockStart, dtype=np.int64)
 
-        for thisLeaf in self.leafs:
-            res[str(thisLeaf.id)] = thisLeaf.giveOffsetAfterTurns(pTurns)
+        return blockStart[self.leafParent] + np.where(
+            self.leafIsLeft,
+            leftChildShift[self.leafParent],
+            rightChildShift[self.leafParent],
+        )
 
-        return res
+    def giveLeafOffsetAfterTurns(self, pTurns):
+        return dict(
+            zip(
+                [str(thisLeafId) for thisLeafId in self.leafIds.tolist()],
+                self.giveLeafPositionsAfterTurns(
+                    [thisTurn[1] for thisTurn in pTurns]
+                ).tolist(),
+            )
+        )
 
     def giveNullSolution(self):
         res = [[], -1]
 
-        for thisInnerVertexIndex in range(len(self.innerVertices)):
-            res[0].append(
-                [
-                    self.innerVertices[thisInnerVertexIndex].id,
-                    False,
-                ]
-            )
+        for thisInnerVertexId in self.innerIds.tolist():
+            res[0].append([thisInnerVertexId, False])
 
         return res
 
@@ -517,7 +806,7 @@ if __name__ == "__main__":
         phyloTreeJson, geoJson, padding, connect
     )
 
-    thisOutputJSONString = json.dumps(thisInstanceJson)
+    thisOutputJSONString = deepJson.dumps(thisInstanceJson)
 
     outputStream.write(thisOutputJSONString)
 
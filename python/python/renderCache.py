@@ -0,0 +1,169 @@
+import collections
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+
+# brotli is optional, without it the bodies are only compressed with gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Caches for rendered output. Keys are strings, values bytes. The memory tier is an
+# LRU bounded by the summed size of its values, the optional disk tier keeps one file
+# per key and removes the files used last longest ago once it is too big.
+
+
+def giveKeyHash(pKey):
+    return hashlib.sha256(pKey.encode("utf-8")).hexdigest()
+
+
+class MemoryCache(object):
+    def __init__(self, pMaxBytes):
+        self.maxBytes = pMaxBytes
+        self.numBytes = 0
+        # key: value, the one used last at the end
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, pKey):
+        with self.lock:
+            value = self.entries.get(pKey)
+            if value is not None:
+                self.entries.move_to_end(pKey)
+            return value
+
+    def put(self, pKey, pValue):
+        if len(pValue) > self.maxBytes:
+            return
+
+        with self.lock:
+            if pKey in self.entries:
+                self.numBytes -= len(self.entries.pop(pKey))
+            self.entries[pKey] = pValue
+            self.numBytes += len(pValue)
+
+            while self.numBytes > self.maxBytes:
+                self.numBytes -= len(self.entries.popitem(last=False)[1])
+
+    pass
+
+
+class DiskCache(object):
+    # Several processes can share the directory. Files are replaced atomically, so
+    # a reader never sees half a file, and the modification time of a file is the
+    # time it was used last
+    def __init__(self, pDirectory, pMaxBytes):
+        self.directory = pDirectory
+        self.maxBytes = pMaxBytes
+        os.makedirs(pDirectory, exist_ok=True)
+        # only an estimate, the other processes write to the directory as well
+        self.numBytes = sum(size for path, size, time in self.giveFiles())
+        self.lock = threading.Lock()
+
+    def givePath(self, pKey):
+        return os.path.join(self.directory, giveKeyHash(pKey))
+
+    def giveFiles(self):
+        # [path, size, time used last] of all files in the cache
+        files = []
+        for thisEntry in os.scandir(self.directory):
+            if thisEntry.name.startswith(".") or not thisEntry.is_file():
+                continue
+            try:
+                thisStat = thisEntry.stat()
+            except FileNotFoundError:
+                continue
+            files.append([thisEntry.path, thisStat.st_size, thisStat.st_mtime])
+        return files
+
+    def get(self, pKey):
+        path = self.givePath(pKey)
+        try:
+            with open(path, "rb") as cacheFile:
+                value = cacheFile.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def put(self, pKey, pValue):
+        if len(pValue) > self.maxBytes:
+            return
+
+        fileDescriptor, tempPath = tempfile.mkstemp(dir=self.directory, prefix=".")
+        with os.fdopen(fileDescriptor, "wb") as tempFile:
+            tempFile.write(pValue)
+        os.replace(tempPath, self.givePath(pKey))
+
+        with self.lock:
+            self.numBytes += len(pValue)
+            if self.numBytes > self.maxBytes:
+                self.evict()
+
+    def evict(self):
+        # removes the files used last longest ago until the cache is at most 3/4 full
+        files = sorted(self.giveFiles(), key=lambda thisFile: thisFile[2])
+        self.numBytes = sum(thisFile[1] for thisFile in files)
+        for thisPath, thisSize, thisTime in files:
+            if self.numBytes <= self.maxBytes * 3 / 4:
+                break
+            try:
+                os.remove(thisPath)
+            except FileNotFoundError:
+                pass
+            self.numBytes -= thisSize
+
+    pass
+
+
+class RenderCache(object):
+    # rendered bodies in a memory tier and, if pDirectory is given, a disk tier.
+    # Compressed versions of a body are made when they are asked for and are kept in
+    # the memory tier as well
+    def __init__(self, pMaxMemoryBytes, pDirectory=None, pMaxDiskBytes=0):
+        self.memory = MemoryCache(pMaxMemoryBytes)
+        self.disk = None
+        if pDirectory:
+            self.disk = DiskCache(pDirectory, pMaxDiskBytes)
+
+    def get(self, pKey, pEncoding="identity"):
+        value = self.memory.get(pKey + "\n" + pEncoding)
+        if value is not None:
+            return value
+
+        body = self.memory.get(pKey + "\nidentity")
+        if body is None and self.disk is not None:
+            body = self.disk.get(pKey)
+            if body is not None:
+                self.memory.put(pKey + "\nidentity", body)
+        if body is None or pEncoding == "identity":
+            return body
+
+        value = giveCompressedBody(body, pEncoding)
+        self.memory.put(pKey + "\n" + pEncoding, value)
+        return value
+
+    def put(self, pKey, pBody):
+        self.memory.put(pKey + "\nidentity", pBody)
+        if self.disk is not None:
+            self.disk.put(pKey, pBody)
+
+    pass
+
+
+def giveEncodings():
+    # the content encodings bodies can be compressed with, best first
+    if brotli is not None:
+        return ["br", "gzip"]
+    return ["gzip"]
+
+
+def giveCompressedBody(pBody, pEncoding):
+    if pEncoding == "br":
+        return brotli.compress(pBody, quality=5)
+    if pEncoding == "gzip":
+        return gzip.compress(pBody, compresslevel=6, mtime=0)
+    raise Exception("Unknown content encoding " + pEncoding)
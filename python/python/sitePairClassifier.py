@@ -0,0 +1,250 @@
+import numpy as np
+
+# upper bound for the number of site pairs that are classified at once
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+
+class ClassifiedSitePairs(object):
+    # all site indices refer to GeoTree.sites, which is in the same order as GeoTree.leafs
+    def __init__(self):
+        self.fixedSite1 = np.empty(0, dtype=np.int32)
+        self.fixedSite2 = np.empty(0, dtype=np.int32)
+        self.fixedIntersectIndex = np.empty(0, dtype=np.float64)
+        self.fixedIsSite1Lower = np.empty(0, dtype=bool)
+
+        self.intersectingSite1 = np.empty(0, dtype=np.int32)
+        self.intersectingSite2 = np.empty(0, dtype=np.int32)
+        self.intersectingIntersectIndex = np.empty(0, dtype=np.float64)
+        self.intersectingIsSite1Lower = np.empty(0, dtype=bool)
+
+        self.horizontalSite1 = np.empty(0, dtype=np.int32)
+        self.horizontalSite2 = np.empty(0, dtype=np.int32)
+        self.horizontalIsSite1Left = np.empty(0, dtype=bool)
+
+    @property
+    def numFixed(self):
+        return len(self.fixedSite1)
+
+    @property
+    def numIntersecting(self):
+        return len(self.intersectingSite1)
+
+    @property
+    def numHorizontal(self):
+        return len(self.horizontalSite1)
+
+    pass
+
+
+def giveSitePairChunks(pNumSites, pChunkSize=DEFAULT_CHUNK_SIZE):
+    # yields all pairs (i, j) with i < j in lexicographic order, split into chunks of
+    # whole rows i that contain about pChunkSize pairs each
+    rowStart = 0
+
+    while rowStart < pNumSites - 1:
+        rowEnd = rowStart
+        numPairs = 0
+        while rowEnd < pNumSites - 1 and (
+            numPairs == 0 or numPairs + pNumSites - 1 - rowEnd <= pChunkSize
+        ):
+            numPairs += pNumSites - 1 - rowEnd
+            rowEnd += 1
+
+        rows = np.arange(rowStart, rowEnd, dtype=np.int64)
+        rowLengths = pNumSites - 1 - rows
+        rowOffsets = np.cumsum(rowLengths) - rowLengths
+
+        site1 = np.repeat(rows, rowLengths)
+        site2 = (
+            np.arange(numPairs, dtype=np.int64)
+            - np.repeat(rowOffsets, rowLengths)
+            + site1
+            + 1
+        )
+
+        yield site1.astype(np.int32), site2.astype(np.int32)
+
+        rowStart = rowEnd
+
+
+def giveTopLineIntersectIndices(pGeoTree, pSite1Pos, pSite2Pos):
+    # vectorized version of GeoTree.giveTwoSitesTopLineIntersectIndex, the arithmetic is
+    # done in the same order so the results are identical to the scalar version
+    topLineStart = pGeoTree.topLineStart
+    topLineEnd = pGeoTree.topLineEnd
+    treeWidth = pGeoTree.innerVertices[0].subTreeWidth
+
+    site1X = pSite1Pos[:, 0]
+    site1Y = pSite1Pos[:, 1]
+    site2X = pSite2Pos[:, 0]
+    site2Y = pSite2Pos[:, 1]
+
+    intersectIndex = np.empty(len(site1X), dtype=np.float64)
+    isSite1Lower = np.ones(len(site1X), dtype=bool)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        intermRes = (topLineStart[1] - topLineEnd[1]) * (site1X - site2X) - (
+            site1Y - site2Y
+        ) * (topLineStart[0] - topLineEnd[0])
+
+        # sites are parallel to TopLine. We have to still check which one is left
+        isParallel = intermRes == 0
+        isSite1Left = np.sign(site2X - site1X) == np.sign(
+            topLineEnd[0] - topLineStart[0]
+        )
+        intersectIndex[isParallel & isSite1Left] = treeWidth + 1
+        intersectIndex[isParallel & ~isSite1Left] = -1
+
+        notParallel = ~isParallel
+        site1X = site1X[notParallel]
+        site1Y = site1Y[notParallel]
+        site2X = site2X[notParallel]
+        site2Y = site2Y[notParallel]
+
+        intersectPercent = (
+            (site1Y - site2Y) * (site1X - topLineStart[0])
+            - (site1Y - topLineStart[1]) * (site1X - site2X)
+        ) / intermRes[notParallel]
+
+        # for determining the order of the sites from left to right, it is important if the direction vector from 1 to 2 has been traversed positive or negative
+        site1LowerByY = (
+            topLineStart[1]
+            - site1Y
+            + intersectPercent * (topLineEnd[1] - topLineStart[1])
+        ) / (site2Y - site1Y) > 0
+        site1LowerByX = (
+            topLineStart[0]
+            - site1X
+            + intersectPercent * (topLineEnd[0] - topLineStart[0])
+        ) / (site2X - site1X) > 0
+        site1Lower = np.where(site2X - site1X == 0, site1LowerByY, site1LowerByX)
+        isSite1Lower[notParallel] = site1Lower
+
+        if pGeoTree.lType == "s":
+            intersectIndex[notParallel] = intersectPercent * (treeWidth - 1)
+        elif pGeoTree.lType == "po":
+            intersectIndex[notParallel] = (
+                (np.where(site1Lower, site2X, site1X) - topLineStart[0])
+                / (topLineEnd[0] - topLineStart[0])
+                * (treeWidth - 1)
+            )
+
+    return intersectIndex, isSite1Lower
+
+
+def giveClassifiedSitePairChunks(pGeoTree, pChunkSize=DEFAULT_CHUNK_SIZE):
+    # yields the site pairs classified chunk by chunk, as ClassifiedSitePairs of about
+    # pChunkSize pairs each, so the pairs never have to be in memory all at once
+    sitePos = pGeoTree.sitePositions
+    treeWidth = pGeoTree.innerVertices[0].subTreeWidth
+
+    for site1, site2 in giveSitePairChunks(len(sitePos), pChunkSize):
+        res = ClassifiedSitePairs()
+        site1Pos = sitePos[site1]
+        site2Pos = sitePos[site2]
+
+        if pGeoTree.lType == "po":
+            isHorizontal = np.abs(site1Pos[:, 1] - site2Pos[:, 1]) < pGeoTree.poGap
+            res.horizontalSite1 = site1[isHorizontal]
+            res.horizontalSite2 = site2[isHorizontal]
+            res.horizontalIsSite1Left = (
+                site1Pos[isHorizontal, 0] < site2Pos[isHorizontal, 0]
+            )
+
+            isNotHorizontal = ~isHorizontal
+            site1 = site1[isNotHorizontal]
+            site2 = site2[isNotHorizontal]
+            site1Pos = site1Pos[isNotHorizontal]
+            site2Pos = site2Pos[isNotHorizontal]
+
+        intersectIndex, isSite1Lower = giveTopLineIntersectIndices(
+            pGeoTree, site1Pos, site2Pos
+        )
+
+        isIntersecting = (intersectIndex > 0) & (intersectIndex < treeWidth - 1)
+        isFixed = ~isIntersecting
+
+        res.intersectingSite1 = site1[isIntersecting]
+        res.intersectingSite2 = site2[isIntersecting]
+        res.intersectingIntersectIndex = intersectIndex[isIntersecting]
+        res.intersectingIsSite1Lower = isSite1Lower[isIntersecting]
+
+        res.fixedSite1 = site1[isFixed]
+        res.fixedSite2 = site2[isFixed]
+        res.fixedIntersectIndex = intersectIndex[isFixed]
+        res.fixedIsSite1Lower = isSite1Lower[isFixed]
+
+        yield res
+
+
+def giveClassifiedSitePairs(pGeoTree, pChunkSize=DEFAULT_CHUNK_SIZE):
+    chunks = list(giveClassifiedSitePairChunks(pGeoTree, pChunkSize))
+    res = ClassifiedSitePairs()
+
+    if len(chunks) > 0:
+        for thisColumn in [
+            "fixedSite1",
+            "fixedSite2",
+            "fixedIntersectIndex",
+            "fixedIsSite1Lower",
+            "intersectingSite1",
+            "intersectingSite2",
+            "intersectingIntersectIndex",
+            "intersectingIsSite1Lower",
+            "horizontalSite1",
+            "horizontalSite2",
+            "horizontalIsSite1Left",
+        ]:
+            setattr(
+                res,
+                thisColumn,
+                np.concatenate(
+                    [getattr(thisChunk, thisColumn) for thisChunk in chunks]
+                ),
+            )
+
+    return res
+
+
+def giveFixedPairOrders(pGeoTree, pSitePairs):
+    # a fixed pair only depends on the turn of its lowest common parent. Returns the
+    # totalIndex of that parent, whether the leafs are in the order of the sites if it
+    # does not turn and whether the pair can be separated at all, for every fixed pair.
+    sitePos = pGeoTree.sitePositions
+
+    lowestCommonParents, isLeaf1Left = pGeoTree.giveLowestCommonParentIndices(
+        pSitePairs.fixedSite1, pSitePairs.fixedSite2
+    )
+
+    # because the intersect index for fixed Pairs can either be negative
+    # (meaning the line drawn from 1 to 2 passes the top line lefthand) or positive (passes righthand)
+    # if the intersecting line is reversed (from 2 to 1) the result is reversed to
+    isSite1LeftOf2 = (
+        pSitePairs.fixedIntersectIndex > 0
+    ) == pSitePairs.fixedIsSite1Lower
+    leafsInOrder = isLeaf1Left == isSite1LeftOf2
+
+    # pairs of sites at the same position can not be separated, so they never count
+    hasConstraint = np.any(
+        sitePos[pSitePairs.fixedSite1] != sitePos[pSitePairs.fixedSite2], axis=1
+    )
+
+    return lowestCommonParents, leafsInOrder, hasConstraint
+
+
+def giveFixedPairCrossingCounts(pGeoTree, pSitePairs):
+    # number of fixed pairs crossing if their lowest common parent keeps its children
+    # and if it turns them, for every inner vertex
+    lowestCommonParents, leafsInOrder, hasConstraint = giveFixedPairOrders(
+        pGeoTree, pSitePairs
+    )
+    numInnerVertices = len(pGeoTree.innerVertices)
+
+    crossingsIfKept = np.bincount(
+        lowestCommonParents[hasConstraint & ~leafsInOrder], minlength=numInnerVertices
+    )
+    crossingsIfTurned = np.bincount(
+        lowestCommonParents[hasConstraint & leafsInOrder], minlength=numInnerVertices
+    )
+
+    return crossingsIfKept, crossingsIfTurned
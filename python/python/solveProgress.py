@@ -0,0 +1,88 @@
+import json
+import time
+import redis
+
+# The solve task publishes every write of a solution on a Redis channel per solution
+# and keeps the last one in a key, so the loading page can wait for news of the solve
+# instead of polling the solutions table. Like the metrics, progress is best effort:
+# without Redis the loading page only learns about the solve when it asks again.
+CHANNEL_PREFIX = "solveProgress:"
+# the last progress is kept this long after the last write, in seconds
+PROGRESS_TTL = 24 * 60 * 60
+
+
+def giveProgressJson(pSolutionJson, pSolutionStatus, pSolutionVersion):
+    # what the loading page needs to know of a written solution
+    return {
+        "status": pSolutionStatus,
+        "version": pSolutionVersion,
+        "num_intersections": pSolutionJson["num_intersections"],
+        "gap": pSolutionJson.get("gap"),
+    }
+
+
+def publishProgress(pRedis, pId, pProgressJson):
+    progressString = json.dumps(pProgressJson)
+    try:
+        pipe = pRedis.pipeline(transaction=False)
+        pipe.set(CHANNEL_PREFIX + str(pId), progressString, ex=PROGRESS_TTL)
+        pipe.publish(CHANNEL_PREFIX + str(pId), progressString)
+        pipe.execute()
+    except redis.RedisError:
+        pass
+
+
+def giveProgress(pRedis, pId):
+    # the last published progress of pId, None if there is none
+    try:
+        progressString = pRedis.get(CHANNEL_PREFIX + str(pId))
+    except redis.RedisError:
+        return None
+    if progressString is None:
+        return None
+    return json.loads(progressString)
+
+
+def waitForProgress(pRedis, pId, pVersion, pTimeout, pGiveVersion):
+    # waits at most pTimeout seconds for a solution of pId newer than pVersion and
+    # returns its progress, or None if there was none. pGiveVersion() gives the
+    # version in the db (None if there is no such solution), it is asked after
+    # subscribing, so no write is missed
+    try:
+        pubSub = pRedis.pubsub(ignore_subscribe_messages=True)
+        pubSub.subscribe(CHANNEL_PREFIX + str(pId))
+        # reads the confirmation, from then on every publish reaches pubSub
+        pubSub.get_message(timeout=1)
+    except redis.RedisError:
+        pubSub = None
+
+    try:
+        version = pGiveVersion()
+        if version is None or version > pVersion:
+            return {"version": version}
+
+        if pubSub is None:
+            # without Redis, the db is asked once more after a while
+            time.sleep(min(pTimeout, 5))
+            version = pGiveVersion()
+            if version is None or version > pVersion:
+                return {"version": version}
+            return None
+
+        endTime = time.monotonic() + pTimeout
+        while time.monotonic() < endTime:
+            message = pubSub.get_message(timeout=endTime - time.monotonic())
+            if message is None or message["type"] != "message":
+                continue
+            progressJson = json.loads(message["data"])
+            if progressJson["version"] > pVersion:
+                return progressJson
+        return None
+    except redis.RedisError:
+        return None
+    finally:
+        if pubSub is not None:
+            try:
+                pubSub.close()
+            except redis.RedisError:
+                pass
@@ -0,0 +1,97 @@
+from contextlib import contextmanager
+import json
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def resetPeakMemory():
+    # Linux resets the peak resident set size of the process on writing 5 to clear_refs,
+    # elsewhere the peak of the whole process so far is reported
+    try:
+        with open("/proc/self/clear_refs", "w") as clearRefs:
+            clearRefs.write("5")
+    except OSError:
+        pass
+
+
+def givePeakMemory():
+    # peak resident set size in bytes since the last resetPeakMemory, or None
+    try:
+        with open("/proc/self/status") as status:
+            for thisLine in status:
+                if thisLine.startswith("VmHWM:"):
+                    return int(thisLine.split()[1]) * 1024
+    except OSError:
+        pass
+
+    if resource is not None:
+        # kilobytes on Linux, bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    return None
+
+
+class SolveStats(object):
+    # wall time and peak memory of the phases of a solve, the size of the ILP and the
+    # statistics of the solver
+    def __init__(self):
+        # [{"phase", "seconds", "peak_memory_bytes"}, ...] in the order they ran
+        self.phases = []
+        self.model = {}
+        self.solver = {}
+
+    @contextmanager
+    def measure(self, pPhase):
+        resetPeakMemory()
+        startTime = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append(
+                {
+                    "phase": pPhase,
+                    "seconds": time.perf_counter() - startTime,
+                    "peak_memory_bytes": givePeakMemory(),
+                }
+            )
+
+    def setModel(self, pIlpModel):
+        self.model = {
+            "num_vars": pIlpModel.numVars,
+            "num_constraints": pIlpModel.numConstraints,
+            "num_nonzeros": pIlpModel.numNonzeros,
+        }
+
+    def setSolver(self, pName, pSolverStats):
+        self.solver = {
+            "name": pName,
+            "runtime": pSolverStats["runtime"],
+            "time_to_first_incumbent": pSolverStats["timeToFirstIncumbent"],
+            "nodes": pSolverStats.get("nodes"),
+            "bound": pSolverStats["bound"],
+            "gap": pSolverStats["gap"],
+        }
+
+    def giveJson(self):
+        return {"phases": self.phases, "model": self.model, "solver": self.solver}
+
+    def log(self, pLogger, pContext=None):
+        # one JSON line per phase and one for the model and solver, each with pContext
+        # (e.g. the solution id) so the lines of a solve can be found again
+        context = {} if pContext is None else pContext
+
+        for thisPhase in self.phases:
+            pLogger.info(json.dumps(dict(context, event="solvePhase", **thisPhase)))
+        pLogger.info(
+            json.dumps(
+                dict(
+                    context, event="solveSummary", model=self.model, solver=self.solver
+                )
+            )
+        )
+
+    pass
@@ -0,0 +1,417 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import milp, Bounds, LinearConstraint
+import math
+import os
+import time
+
+try:
+    import gurobipy as gp
+    from gurobipy import GRB
+except ImportError:
+    gp = None
+
+# size limits of the restricted license that ships with gurobipy
+RESTRICTED_LICENSE_MAX_VARS = 2000
+RESTRICTED_LICENSE_MAX_CONSTRAINTS = 2000
+
+gurobiEnv = None
+
+
+def isGurobiLicenseSet():
+    return (
+        (os.getenv("GRB_WLSACCESSID") is not None)
+        and (os.getenv("GRB_LICENSEID") is not None)
+        and (os.getenv("GRB_WLSSECRET") is not None)
+    )
+
+
+def giveGurobiEnv():
+    # the WLS environment is only started once a worker actually solves with Gurobi
+    global gurobiEnv
+
+    if gurobiEnv is None and isGurobiLicenseSet():
+        print("usingLicense")
+        gurobiEnv = gp.Env(empty=True)
+
+        wlsaccessID = os.getenv("GRB_WLSACCESSID", "undefined")
+        gurobiEnv.setParam("WLSACCESSID", wlsaccessID)
+
+        licenseID = os.getenv("GRB_LICENSEID", "0")
+        gurobiEnv.setParam("LICENSEID", int(licenseID))
+
+        wlsSecrets = os.getenv("GRB_WLSSECRET", "undefined")
+        gurobiEnv.setParam("WLSSECRET", wlsSecrets)
+
+        gurobiEnv.setParam("CSCLIENTLOG", int(3))
+
+        gurobiEnv.start()
+
+    return gurobiEnv
+
+
+class IlpModel(object):
+    # a binary minimization problem "min c x + objectiveConstant s.t. A x <= b", the
+    # variables and constraints are grouped into named blocks
+    def __init__(self, pName):
+        self.name = pName
+        self.numVars = 0
+        self.numConstraints = 0
+        self.objectiveConstant = 0
+        # [name, first column, number of variables, objective coefficients]
+        self.variableBlocks = []
+        # [name, [[variable block name, matrix], ...], rhs]
+        self.constraintBlocks = []
+
+    def addVariables(self, pName, pNum, pObjectiveCoef=0):
+        objectiveCoef = np.zeros(pNum)
+        objectiveCoef[:] = pObjectiveCoef
+        self.variableBlocks.append([pName, self.numVars, pNum, objectiveCoef])
+        self.numVars += pNum
+
+    def addConstraints(self, pName, pTerms, pRhs):
+        if len(pRhs) > 0:
+            self.constraintBlocks.append([pName, pTerms, np.asarray(pRhs)])
+            self.numConstraints += len(pRhs)
+
+    def giveVariableSlice(self, pName):
+        for thisName, thisStart, thisNum, thisObjectiveCoef in self.variableBlocks:
+            if thisName == pName:
+                return slice(thisStart, thisStart + thisNum)
+
+        raise Exception("Unknown variable block " + pName)
+
+    def giveConstraintBlock(self, pName):
+        # returns the terms by variable block name and the rhs, or None if the block is empty
+        for thisName, thisTerms, thisRhs in self.constraintBlocks:
+            if thisName == pName:
+                return [dict(thisTerms), thisRhs]
+
+        return None
+
+    def giveObjectiveVector(self):
+        return np.concatenate(
+            [thisBlock[3] for thisBlock in self.variableBlocks] + [np.zeros(0)]
+        )
+
+    def giveConstraintMatrix(self):
+        rows = []
+
+        for thisName, thisTerms, thisRhs in self.constraintBlocks:
+            thisTermsByBlock = dict(thisTerms)
+            row = []
+            for (
+                thisBlockName,
+                thisStart,
+                thisNum,
+                thisObjectiveCoef,
+            ) in self.variableBlocks:
+                if thisBlockName in thisTermsByBlock:
+                    row.append(thisTermsByBlock[thisBlockName])
+                else:
+                    row.append(sp.csr_matrix((len(thisRhs), thisNum)))
+            rows.append(sp.hstack(row, format="csr"))
+
+        if len(rows) == 0:
+            return sp.csr_matrix((0, self.numVars))
+
+        return sp.vstack(rows, format="csr")
+
+    def giveRhsVector(self):
+        return np.concatenate(
+            [thisBlock[2] for thisBlock in self.constraintBlocks] + [np.zeros(0)]
+        )
+
+    @property
+    def numNonzeros(self):
+        return sum(
+            thisMatrix.nnz
+            for thisName, thisTerms, thisRhs in self.constraintBlocks
+            for thisBlockName, thisMatrix in thisTerms
+        )
+
+    def hasIntegralObjective(self):
+        return bool(
+            np.all(np.mod(self.giveObjectiveVector(), 1) == 0)
+            and self.objectiveConstant % 1 == 0
+        )
+
+    def isWithinRestrictedLicense(self):
+        return (
+            self.numVars <= RESTRICTED_LICENSE_MAX_VARS
+            and self.numConstraints <= RESTRICTED_LICENSE_MAX_CONSTRAINTS
+        )
+
+    pass
+
+
+class SolverResult(object):
+    def __init__(self, pX, pObjVal, pStats):
+        self.x = pX
+        self.objVal = pObjVal
+        # runtime and, if the solver reports it, timeToFirstIncumbent in seconds, as
+        # well as the bound and gap of the solution and the number of explored branch
+        # and bound nodes, which are None if unknown
+        self.stats = pStats
+
+    pass
+
+
+def giveSolverBudget(pTimeLimit=None, pMipGap=None):
+    # the time limit in seconds and relative gap asked for by the caller, otherwise the
+    # ones of the deployment. None means the solver runs until the solution is optimal
+    timeLimit = pTimeLimit
+    if timeLimit is None and os.getenv("solverTimeLimit"):
+        timeLimit = float(os.getenv("solverTimeLimit"))
+
+    mipGap = pMipGap
+    if mipGap is None and os.getenv("solverMipGap"):
+        mipGap = float(os.getenv("solverMipGap"))
+
+    return timeLimit, mipGap
+
+
+def giveMipBound(pIlpModel, pBound):
+    # the number of intersections is integral, so the bound can be rounded up
+    if pBound is None or not math.isfinite(pBound):
+        return pBound
+    if pIlpModel.hasIntegralObjective():
+        return float(math.ceil(pBound - 1e-6))
+
+    return pBound
+
+
+def giveMipGap(pObjVal, pBound):
+    # relative gap as Gurobi defines it: |objVal - bound| / |objVal|
+    if pBound is None:
+        return None
+    if pObjVal == pBound:
+        return 0.0
+    if pObjVal == 0:
+        return math.inf
+
+    return abs(pObjVal - pBound) / abs(pObjVal)
+
+
+class SolverBackend(object):
+    name = ""
+
+    def solve(
+        self,
+        pIlpModel,
+        pStart=None,
+        pTimeLimit=None,
+        pMipGap=None,
+        pOnIncumbent=None,
+        pOnProgress=None,
+    ):
+        # pStart is an optional full assignment of the variables used as MIP start.
+        # The solve stops after pTimeLimit seconds or once the relative gap is at most
+        # pMipGap and returns the best solution found so far. If the time limit is hit
+        # before a first solution is found, x and objVal are None. If the solver
+        # supports it, pOnIncumbent(x, objVal, bound) is called for every improving
+        # solution found while solving and pOnProgress() regularly in between.
+        raise NotImplementedError()
+
+    pass
+
+
+class GurobiBackend(SolverBackend):
+    name = "gurobi"
+
+    def solve(
+        self,
+        pIlpModel,
+        pStart=None,
+        pTimeLimit=None,
+        pMipGap=None,
+        pOnIncumbent=None,
+        pOnProgress=None,
+    ):
+        ilpModel = gp.Model(env=giveGurobiEnv(), name=pIlpModel.name)
+        if pTimeLimit is not None:
+            ilpModel.Params.TimeLimit = pTimeLimit
+        if pMipGap is not None:
+            ilpModel.Params.MIPGap = pMipGap
+
+        variables = {}
+        objective = gp.LinExpr()
+        for thisName, thisStart, thisNum, thisObjectiveCoef in pIlpModel.variableBlocks:
+            variables[thisName] = ilpModel.addMVar(
+                thisNum, vtype=GRB.BINARY, name=thisName
+            )
+            if np.any(thisObjectiveCoef != 0):
+                objective += thisObjectiveCoef @ variables[thisName]
+        objective += pIlpModel.objectiveConstant
+        ilpModel.setObjective(objective, GRB.MINIMIZE)
+
+        for thisName, thisTerms, thisRhs in pIlpModel.constraintBlocks:
+            thisExpr = 0
+            for thisBlockName, thisMatrix in thisTerms:
+                thisExpr = thisExpr + thisMatrix @ variables[thisBlockName]
+            ilpModel.addConstr(thisExpr <= thisRhs, name=thisName)
+
+        if pStart is not None:
+            for (
+                thisName,
+                thisStart,
+                thisNum,
+                thisObjectiveCoef,
+            ) in pIlpModel.variableBlocks:
+                if thisNum > 0:
+                    variables[thisName].Start = pStart[thisStart : thisStart + thisNum]
+
+        nonEmptyVariables = [
+            variables[thisBlock[0]]
+            for thisBlock in pIlpModel.variableBlocks
+            if thisBlock[2] > 0
+        ]
+
+        stats = {"timeToFirstIncumbent": None}
+        bestObjVal = [math.inf]
+
+        def recordIncumbent(pModel, pWhere):
+            if pWhere == GRB.Callback.MIP and pOnProgress is not None:
+                pOnProgress()
+            if pWhere != GRB.Callback.MIPSOL:
+                return
+
+            if stats["timeToFirstIncumbent"] is None:
+                stats["timeToFirstIncumbent"] = pModel.cbGet(GRB.Callback.RUNTIME)
+
+            # MIPSOL is also reported for solutions that are not better than the
+            # incumbent, e.g. the ones found by other threads
+            objVal = pModel.cbGet(GRB.Callback.MIPSOL_OBJ)
+            if pOnIncumbent is not None and objVal < bestObjVal[0]:
+                bestObjVal[0] = objVal
+                x = np.concatenate(
+                    [pModel.cbGetSolution(thisVars) for thisVars in nonEmptyVariables]
+                )
+                pOnIncumbent(
+                    x,
+                    objVal,
+                    giveMipBound(pIlpModel, pModel.cbGet(GRB.Callback.MIPSOL_OBJBND)),
+                )
+
+        ilpModel.optimize(recordIncumbent)
+        stats["runtime"] = ilpModel.Runtime
+
+        stats["nodes"] = int(ilpModel.NodeCount)
+
+        if ilpModel.SolCount == 0:
+            if ilpModel.Status in (GRB.TIME_LIMIT, GRB.INTERRUPTED):
+                stats["bound"] = None
+                stats["gap"] = None
+                return SolverResult(None, None, stats)
+            raise Exception("Gurobi found no solution, status " + str(ilpModel.Status))
+
+        x = np.concatenate([thisVars.X for thisVars in nonEmptyVariables])
+
+        stats["bound"] = giveMipBound(pIlpModel, ilpModel.ObjBound)
+        stats["gap"] = giveMipGap(ilpModel.ObjVal, stats["bound"])
+
+        return SolverResult(x, ilpModel.ObjVal, stats)
+
+    pass
+
+
+class HighsBackend(SolverBackend):
+    name = "highs"
+
+    def solve(
+        self,
+        pIlpModel,
+        pStart=None,
+        pTimeLimit=None,
+        pMipGap=None,
+        pOnIncumbent=None,
+        pOnProgress=None,
+    ):
+        # scipy's milp interface to HiGHS neither takes a MIP start nor reports
+        # solutions while solving, so pStart, pOnIncumbent and pOnProgress are ignored
+        constraints = []
+        if pIlpModel.numConstraints > 0:
+            constraints.append(
+                LinearConstraint(
+                    pIlpModel.giveConstraintMatrix(),
+                    -np.inf,
+                    pIlpModel.giveRhsVector(),
+                )
+            )
+
+        options = {}
+        if pTimeLimit is not None:
+            options["time_limit"] = pTimeLimit
+        if pMipGap is not None:
+            options["mip_rel_gap"] = pMipGap
+
+        objective = pIlpModel.giveObjectiveVector()
+        startTime = time.perf_counter()
+        res = milp(
+            objective,
+            integrality=np.ones(pIlpModel.numVars),
+            bounds=Bounds(0, 1),
+            constraints=constraints,
+            options=options,
+        )
+
+        stats = {
+            "runtime": time.perf_counter() - startTime,
+            "timeToFirstIncumbent": None,
+            "nodes": getattr(res, "mip_node_count", None),
+        }
+
+        if res.x is None:
+            # status 1 is the time limit
+            if res.status == 1:
+                stats["bound"] = None
+                stats["gap"] = None
+                return SolverResult(None, None, stats)
+            raise Exception("HiGHS found no solution: " + res.message)
+
+        objVal = res.fun + pIlpModel.objectiveConstant
+        if pIlpModel.hasIntegralObjective():
+            # HiGHS reports integral objectives with a little float noise
+            objVal = float(round(objVal))
+
+        bound = getattr(res, "mip_dual_bound", None)
+        if bound is not None:
+            bound = giveMipBound(pIlpModel, bound + pIlpModel.objectiveConstant)
+        stats["bound"] = bound
+        stats["gap"] = giveMipGap(objVal, bound)
+
+        return SolverResult(res.x, objVal, stats)
+
+    pass
+
+
+SOLVER_BACKENDS = {"gurobi": GurobiBackend, "highs": HighsBackend}
+
+
+def giveSolverName(pSolver):
+    # the solver asked for by the caller, otherwise the one of the deployment
+    if pSolver is None:
+        return os.getenv("solverBackend", "auto")
+
+    return pSolver
+
+
+def giveSolverBackend(pSolver, pIlpModel):
+    # "auto" uses Gurobi with a license or for models the restricted license can solve,
+    # HiGHS otherwise
+    solver = giveSolverName(pSolver)
+
+    if solver == "auto":
+        if gp is not None and (
+            isGurobiLicenseSet() or pIlpModel.isWithinRestrictedLicense()
+        ):
+            solver = "gurobi"
+        else:
+            solver = "highs"
+
+    if solver not in SOLVER_BACKENDS:
+        raise Exception("Unknown solver backend " + solver)
+    if solver == "gurobi" and gp is None:
+        raise Exception("The gurobi solver backend needs gurobipy")
+
+    return SOLVER_BACKENDS[solver]()
@@ -1,46 +1,205 @@
 from celeryConfig import celery
+from celery.signals import task_failure, task_prerun, task_postrun
+from celery.utils.log import get_task_logger
 from parseFiles import DataFileParser
-from gurobiFunctions import giveMinLeaderIntersectConfig
+from gurobiFunctions import giveMinLeaderIntersectResult
+from solveStats import SolveStats
+import instanceStore
+import metrics
+import solveProgress
+from solverBackends import giveMipGap
 import json
+import os
+import time
 from sqlalchemy import create_engine, text
 
 engine = create_engine("mariadb+mysqlconnector://root:toor@db:3306/phyloptimize")
+logger = get_task_logger(__name__)
 
 
-@celery.task(name="solve")
-def solve(pId):
+metricsRedis = metrics.giveRedis()
+progressRedis = metrics.giveRedis()
+# start times of the running tasks by task id
+taskStartTimes = {}
+
+
+@task_prerun.connect
+def startTaskTimer(task_id=None, **kwargs):
+    taskStartTimes[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def observeTaskDuration(task_id=None, task=None, state=None, **kwargs):
+    startTime = taskStartTimes.pop(task_id, None)
+    if startTime is not None and task is not None and task.name == "solve":
+        metrics.observe(
+            metricsRedis,
+            "phyloptimize_solve_duration_seconds",
+            time.perf_counter() - startTime,
+            {"state": state},
+        )
+
+
+@task_failure.connect
+def endFailedSolve(sender=None, args=None, **kwargs):
+    # a failed solve never writes its timeEnd, without it the solve would count as
+    # in flight forever
+    if sender is None or sender.name != "solve" or not args:
+        return
     with engine.connect() as conn:
+        conn.execute(
+            text(
+                "UPDATE solutions SET timeEnd=:timeEnd WHERE id=:solutionId AND timeEnd IS NULL;"
+            ),
+            [{"solutionId": args[0], "timeEnd": giveTimestamp()}],
+        )
+        conn.commit()
+
+
+def giveTimestamp():
+    # timeStart and timeEnd of the solutions table are unix time in milliseconds
+    return int(time.time() * 1000)
+
+
+def writeSolution(pId, pSolutionJson, pSolutionJsonString, pSolutionStatus):
+    # pSolutionJsonString is pSolutionJson as a string
+    with engine.connect() as conn:
+        conn.execute(
+            text(
+                "UPDATE solutions SET solution=:solutionJson, solutionStatus=:solutionStatus, solutionVersion=solutionVersion+1, solutionTime=:solutionTime WHERE id=:solutionId;"
+            ),
+            [
+                {
+                    "solutionId": pId,
+                    "solutionJson": pSolutionJsonString,
+                    "solutionStatus": pSolutionStatus,
+                    "solutionTime": giveTimestamp(),
+                }
+            ],
+        )
         result = (
             conn.execute(
-                text("SELECT * FROM solutions WHERE id=:solutionId;"),
+                text("SELECT solutionVersion FROM solutions WHERE id=:solutionId;"),
                 [{"solutionId": pId}],
             )
             .mappings()
             .all()
         )
-        phyloTreeJson = json.loads(result[0].tree)
-        geoJson = json.loads(result[0].geo)
-        padding = float(result[0].padding)
-        lType = result[0].lType
-        connect = result[0].connect
         conn.commit()
 
-    thisParser = DataFileParser()
-    thisInstanceJson = thisParser.convertTreeAndGeoToInstance(
-        phyloTreeJson, geoJson, padding, connect
+    # the loading page waits for this
+    solveProgress.publishProgress(
+        progressRedis,
+        pId,
+        solveProgress.giveProgressJson(
+            pSolutionJson, pSolutionStatus, result[0].solutionVersion
+        ),
     )
-    thisGeoTree = thisParser.parseFile(thisInstanceJson, lType, 0)
-    shouldVerticesTurn, intersections = giveMinLeaderIntersectConfig(thisGeoTree)
-    thisSolutionJson = thisParser.giveOutputJSON(
-        shouldVerticesTurn,
-        thisGeoTree.giveLeafOffsetAfterTurns(shouldVerticesTurn),
-        intersections,
-        thisGeoTree.lType,
+
+
+@celery.task(name="solve")
+def solve(pId, pSolver=None, pTimeLimit=None, pMipGap=None):
+    solveStats = SolveStats()
+
+    with solveStats.measure("fetch"):
+        with engine.connect() as conn:
+            conn.execute(
+                text("UPDATE solutions SET timeStart=:timeStart WHERE id=:solutionId;"),
+                [{"solutionId": pId, "timeStart": giveTimestamp()}],
+            )
+            result = (
+                conn.execute(
+                    text("SELECT lType FROM solutions WHERE id=:solutionId;"),
+                    [{"solutionId": pId}],
+                )
+                .mappings()
+                .all()
+            )
+            lType = result[0].lType
+            instanceBlob = instanceStore.giveInstanceBlobOfSolution(conn, pId)
+            conn.commit()
+
+    thisParser = DataFileParser()
+    with solveStats.measure("loadInstance"):
+        thisInstanceJson = instanceStore.giveInstanceFromBlob(instanceBlob)
+    with solveStats.measure("parseFile"):
+        thisGeoTree = thisParser.parseFile(thisInstanceJson, lType, 0)
+
+    # the best leaf order so far is written to the row, so /draw can already show it,
+    # but at most once every incumbentWriteInterval seconds. A leaf order found within
+    # the interval is kept and written once the interval has passed
+    incumbentWriteInterval = float(os.getenv("incumbentWriteInterval", "5"))
+    lastIncumbentWriteTime = [None]
+    pendingIncumbent = [None]
+
+    def writeIncumbent(pShouldVerticesTurn, pIntersections, pBound):
+        pendingIncumbent[0] = [pShouldVerticesTurn, pIntersections, pBound]
+        writePendingIncumbent()
+
+    def writePendingIncumbent():
+        if pendingIncumbent[0] is None or (
+            lastIncumbentWriteTime[0] is not None
+            and time.monotonic() - lastIncumbentWriteTime[0] < incumbentWriteInterval
+        ):
+            return
+        lastIncumbentWriteTime[0] = time.monotonic()
+        shouldVerticesTurn, intersections, bound = pendingIncumbent[0]
+        pendingIncumbent[0] = None
+
+        incumbentJson = thisParser.giveOutputJSON(
+            shouldVerticesTurn,
+            thisGeoTree.giveLeafOffsetAfterTurns(shouldVerticesTurn),
+            intersections,
+            thisGeoTree.lType,
+            bound,
+            giveMipGap(intersections, bound),
+        )
+        writeSolution(pId, incumbentJson, json.dumps(incumbentJson), "incumbent")
+
+    shouldVerticesTurn, intersections, solverStats = giveMinLeaderIntersectResult(
+        thisGeoTree,
+        pSolver,
+        pWarmStart=True,
+        pTimeLimit=pTimeLimit,
+        pMipGap=pMipGap,
+        pOnIncumbent=writeIncumbent,
+        pSolveStats=solveStats,
+        pOnProgress=writePendingIncumbent,
     )
+    with solveStats.measure("serialize"):
+        thisSolutionJson = thisParser.giveOutputJSON(
+            shouldVerticesTurn,
+            thisGeoTree.giveLeafOffsetAfterTurns(shouldVerticesTurn),
+            intersections,
+            thisGeoTree.lType,
+            solverStats["bound"],
+            solverStats["gap"],
+        )
+        thisSolutionJsonString = json.dumps(thisSolutionJson)
+
+    writeSolution(pId, thisSolutionJson, thisSolutionJsonString, "final")
 
+    solveStats.log(logger, {"solutionId": pId, "numLeaves": len(thisGeoTree.leafs)})
+    if len(solveStats.model) > 0:
+        metrics.observe(
+            metricsRedis, "phyloptimize_model_variables", solveStats.model["num_vars"]
+        )
+        metrics.observe(
+            metricsRedis,
+            "phyloptimize_model_constraints",
+            solveStats.model["num_constraints"],
+        )
     with engine.connect() as conn:
         conn.execute(
-            text("UPDATE solutions SET solution=:solutionJson WHERE id=:solutionId;"),
-            [{"solutionId": pId, "solutionJson": json.dumps(thisSolutionJson)}],
+            text(
+                "UPDATE solutions SET timeEnd=:timeEnd, stats=:statsJson WHERE id=:solutionId;"
+            ),
+            [
+                {
+                    "solutionId": pId,
+                    "timeEnd": giveTimestamp(),
+                    "statsJson": json.dumps(solveStats.giveJson()),
+                }
+            ],
         )
         conn.commit()
@@ -0,0 +1,177 @@
+import base64
+import math
+import os
+import sqlite3
+import threading
+from renderCache import MemoryCache
+
+# Background maps put together from raster tiles on the local disk, either an MBTiles
+# file or a folder of XYZ tiles ({z}/{x}/{y}.png). The tiles are embedded as one
+# svg image each, so they never have to be decoded or stitched into one image.
+
+# half the circumference of the earth in web mercator meters
+MERCATOR_MAX = 20037508.342789244
+TILE_PIXELS = 256
+TILE_EXTENSIONS = [".png", ".jpg", ".jpeg", ".webp"]
+
+
+def giveTileMercatorSize(pZoom):
+    return 2 * MERCATOR_MAX / 2**pZoom
+
+
+def giveImageMimeType(pImage):
+    if pImage.startswith(b"\x89PNG"):
+        return "image/png"
+    if pImage.startswith(b"RIFF") and pImage[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+class MBTilesSource(object):
+    # tiles of an MBTiles file, their rows count from the south there
+    def __init__(self, pPath):
+        self.path = pPath
+        # sqlite connections can only be used by the thread that made them
+        self.local = threading.local()
+
+        zooms = (
+            self.giveConnection()
+            .execute("SELECT MIN(zoom_level), MAX(zoom_level) FROM tiles;")
+            .fetchone()
+        )
+        if zooms[0] is None:
+            raise Exception("There are no tiles in " + pPath)
+        self.minZoom, self.maxZoom = zooms
+
+    def giveConnection(self):
+        if getattr(self.local, "connection", None) is None:
+            self.local.connection = sqlite3.connect(
+                "file:" + self.path + "?mode=ro", uri=True
+            )
+        return self.local.connection
+
+    def giveTile(self, pZoom, pX, pY):
+        result = (
+            self.giveConnection()
+            .execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?;",
+                (pZoom, pX, 2**pZoom - 1 - pY),
+            )
+            .fetchone()
+        )
+        if result is None:
+            return None
+        return bytes(result[0])
+
+    pass
+
+
+class DirectoryTileSource(object):
+    # tiles in {z}/{x}/{y} files, with any of the TILE_EXTENSIONS
+    def __init__(self, pPath):
+        self.path = pPath
+
+        zooms = [int(thisName) for thisName in os.listdir(pPath) if thisName.isdigit()]
+        if len(zooms) == 0:
+            raise Exception("There are no tiles in " + pPath)
+        self.minZoom = min(zooms)
+        self.maxZoom = max(zooms)
+
+    def giveTile(self, pZoom, pX, pY):
+        basePath = os.path.join(self.path, str(pZoom), str(pX), str(pY))
+        for thisExtension in TILE_EXTENSIONS:
+            try:
+                with open(basePath + thisExtension, "rb") as tileFile:
+                    return tileFile.read()
+            except FileNotFoundError:
+                continue
+        return None
+
+    pass
+
+
+class TileMap(object):
+    # The tiles of pSource in the drawing, the data URIs of the tiles used last are
+    # kept in memory up to pMaxCacheBytes
+    def __init__(self, pSource, pMaxCacheBytes):
+        self.source = pSource
+        self.cache = MemoryCache(pMaxCacheBytes)
+
+    def giveZoom(self, pMercatorWidth, pPixelWidth):
+        # the smallest zoom level with at least pPixelWidth pixels on pMercatorWidth
+        if pMercatorWidth <= 0 or pPixelWidth <= 0:
+            return self.source.minZoom
+        zoom = math.ceil(
+            math.log2(pPixelWidth * 2 * MERCATOR_MAX / (TILE_PIXELS * pMercatorWidth))
+        )
+        return min(max(zoom, self.source.minZoom), self.source.maxZoom)
+
+    def giveTileDataUri(self, pZoom, pX, pY):
+        # "" for tiles that are missing
+        cacheKey = str(pZoom) + "/" + str(pX) + "/" + str(pY)
+        dataUri = self.cache.get(cacheKey)
+        if dataUri is None:
+            tile = self.source.giveTile(pZoom, pX, pY)
+            dataUri = ""
+            if tile is not None:
+                dataUri = (
+                    "data:"
+                    + giveImageMimeType(tile)
+                    + ";base64,"
+                    + base64.b64encode(tile).decode("ascii")
+                )
+            self.cache.put(cacheKey, dataUri)
+        return dataUri
+
+    def giveTiles(self, pMinX, pMinY, pMaxX, pMaxY, pPixelWidth):
+        # [data URI, min x, min y, size] in mercator meters of the tiles that cover
+        # the box. Like the sites of an instance, y is the negated mercator y, so it
+        # grows to the south as the rows of the tiles
+        zoom = self.giveZoom(pMaxX - pMinX, pPixelWidth)
+        tileSize = giveTileMercatorSize(zoom)
+        lastTile = 2**zoom - 1
+
+        def giveTileIndex(pCoord):
+            return min(max(math.floor((pCoord + MERCATOR_MAX) / tileSize), 0), lastTile)
+
+        tiles = []
+        for thisY in range(giveTileIndex(pMinY), giveTileIndex(pMaxY) + 1):
+            for thisX in range(giveTileIndex(pMinX), giveTileIndex(pMaxX) + 1):
+                dataUri = self.giveTileDataUri(zoom, thisX, thisY)
+                if dataUri != "":
+                    tiles.append(
+                        [
+                            dataUri,
+                            thisX * tileSize - MERCATOR_MAX,
+                            thisY * tileSize - MERCATOR_MAX,
+                            tileSize,
+                        ]
+                    )
+
+        return tiles
+
+    pass
+
+
+def giveTileSource(pPath):
+    if os.path.isdir(pPath):
+        return DirectoryTileSource(pPath)
+    return MBTilesSource(pPath)
+
+
+# made on first use, see giveTileMap
+tileMap = None
+
+
+def giveTileMap():
+    # the TileMap of the tiles at backgroundTiles
+    global tileMap
+    if tileMap is None:
+        tilePath = os.getenv("backgroundTiles")
+        if not tilePath:
+            raise Exception("backgroundTiles is not set, there are no local map tiles.")
+        tileMap = TileMap(
+            giveTileSource(tilePath),
+            int(float(os.getenv("backgroundTileCacheBytes", "64e6"))),
+        )
+    return tileMap
@@ -2,20 +2,37 @@ parent.clearTimeout(parent.document.enableEditBtnTimeout)
 parent.editBtn.disabled = true;
 parent.setEnableEditBtnTimeout();
 
-var reloadTime = 1000;
+var solutionId = document.body.dataset.solutionId;
+var solutionVersion = parseInt(document.body.dataset.solutionVersion);
 
-setTimeout(function(){
-    solvingLabel.innerText += "."
-},reloadTime * 1/4)
+setInterval(function(){
+    if (solvingLabel.innerText.endsWith("...")) {
+        solvingLabel.innerText = solvingLabel.innerText.slice(0, -3);
+    } else {
+        solvingLabel.innerText += ".";
+    }
+},250)
 
-setTimeout(function(){
-    solvingLabel.innerText += "."
-},reloadTime * 2/4)
+// /progress answers once the solver wrote a newer solution, the page is only
+// reloaded then
+function waitForProgress() {
+    fetch("/progress?id=" + solutionId + "&version=" + solutionVersion)
+        .then(function(response){
+            if (!response.ok) {
+                throw new Error(response.statusText);
+            }
+            return response.json();
+        })
+        .then(function(progress){
+            if (progress.version === null || progress.version > solutionVersion) {
+                location.reload();
+            } else {
+                waitForProgress();
+            }
+        })
+        .catch(function(){
+            setTimeout(waitForProgress, 5000);
+        });
+}
 
-setTimeout(function(){
-    solvingLabel.innerText += "."
-},reloadTime * 3/4)
-
-setTimeout(function(){
-    location.reload();
-},reloadTime)
\ No newline at end of file
+waitForProgress();